@@ -0,0 +1,247 @@
+from array import array
+from book import Book
+from collections import Counter
+from typing import Callable, Iterable
+import itertools
+
+try:
+    import numpy
+except ImportError:  # The columns stay in arrays and are scanned by the C loops of the built-ins
+    numpy = None
+
+GROUP_KEYS = ('year', 'decade', 'author', 'status')  # Columns the books can be grouped by
+BOOK_KEYS: dict[str, Callable[[Book], object]] = {  # The same keys taken from a book
+    'year': lambda book: book.year,
+    'decade': lambda book: book.year // 10 * 10,
+    'author': lambda book: book.author,
+    'status': lambda book: book.status,
+}
+
+
+def matches(book: Book, year_from: int | None = None, year_to: int | None = None, author: str | None = None,
+            status: str | None = None) -> bool:
+
+    """
+    Check a book with the filters of ColumnTable.where, the filters that are not set match every book.
+
+    :param book: The book.
+    :param year_from: The first publication year, inclusive.
+    :param year_to: The last publication year, inclusive.
+    :param author: The author of the book, exactly as it is written.
+    :param status: The status of the book.
+    :return: True if the book matches all filters.
+    """
+
+    return ((year_from is None or book.year >= year_from) and (year_to is None or book.year <= year_to) and
+            (author is None or book.author == author) and (status is None or book.status == status))
+
+
+def group_books(books: Iterable[Book], *keys: str, **filters) -> dict:
+
+    """
+    Count the books in groups one object at a time, the reference for ColumnTable.group_by.
+
+    :param books: The books.
+    :param keys: Names from GROUP_KEYS.
+    :param filters: The filters of matches.
+    :return: Number of books by the value of the key, or by the tuple of the values of several keys, sorted.
+    """
+
+    getters = [BOOK_KEYS[key] for key in keys]
+    counts = Counter(getters[0](book) if len(getters) == 1 else tuple(getter(book) for getter in getters)
+                     for book in books if matches(book, **filters))
+    return dict(sorted(counts.items()))
+
+
+class ColumnTable:
+    def __init__(self, books: Iterable[Book], use_numpy: bool | None = None) -> None:
+
+        """
+        Export books into contiguous columns for analytical scans.
+
+        IDs and years are integer arrays, authors and statuses are dictionary-encoded: every
+        column holds the codes and a list holds the names. With NumPy the filters and the counts
+        run over the columns as vectors, otherwise over the arrays with the C loops of the
+        built-ins. The table is a copy, later changes of the library are not seen.
+
+        :param books: The books to export.
+        :param use_numpy: Use NumPy, by default if it is installed.
+        """
+
+        self.numpy = numpy if use_numpy is None or use_numpy else None  # NumPy module or None
+        if use_numpy and numpy is None:
+            raise ValueError("NumPy is not installed")
+        self.ids: array = array('i')  # IDs of the books
+        self.years: array = array('i')  # Publication years of the books
+        self.authors: array = array('i')  # Author codes of the books
+        self.statuses: bytearray = bytearray()  # Status codes of the books
+        self.author_names: list[str] = []  # Author names by their codes
+        self.status_names: list[str] = []  # Status names by their codes
+        author_codes: dict[str, int] = {}
+        status_codes: dict[str, int] = {}
+        for book in books:
+            self.ids.append(book.id)
+            self.years.append(book.year)
+            code = author_codes.setdefault(book.author, len(author_codes))
+            if code == len(self.author_names):
+                self.author_names.append(book.author)
+            self.authors.append(code)
+            code = status_codes.setdefault(book.status, len(status_codes))
+            if code == len(self.status_names):
+                self.status_names.append(book.status)
+            self.statuses.append(code)
+        self.columns: dict = {'year': self.years, 'author': self.authors, 'status': self.statuses}
+        if self.numpy is not None:  # Views of the same memory, nothing is copied
+            self.columns = {'year': self.numpy.frombuffer(self.years, self.numpy.int32),
+                            'author': self.numpy.frombuffer(self.authors, self.numpy.int32),
+                            'status': self.numpy.frombuffer(self.statuses, self.numpy.uint8)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, name: str, accepted: Callable[[int], bool]):
+
+        """
+        Mark the rows whose value in a column is accepted.
+
+        The test is done once for every value from 0 to the largest one, and the rows are marked
+        through a lookup table. Codes are never negative, but years of imported or edited books may
+        be, then the table starts at the smallest value instead of 0.
+
+        :param name: 'year', 'author' or 'status'.
+        :param accepted: Test of a value of the column.
+        :return: A mask: a NumPy array of booleans or bytes of zeros and ones, one for every row.
+        """
+
+        column = self.columns[name]
+        if not len(column):
+            return self.numpy.zeros(0, dtype=self.numpy.bool_) if self.numpy is not None else b''
+        if self.numpy is None:
+            offset, size = min(min(column), 0), max(column) + 1
+        else:  # max(initial=-1) would overflow the uint8 statuses
+            offset, size = min(int(column.min()), 0), int(column.max()) + 1
+        table = bytes(bool(accepted(value)) for value in range(offset, size))  # Value at its index minus offset
+        if self.numpy is not None:
+            return self.numpy.frombuffer(table, dtype=self.numpy.bool_)[column - offset if offset else column]
+        if name == 'status':
+            return column.translate(table.ljust(256, b'\0'))
+        if offset:
+            return bytes(table[value - offset] for value in column)
+        return bytes(map(table.__getitem__, column))
+
+    def where(self, year_from: int | None = None, year_to: int | None = None, author: str | None = None,
+              status: str | None = None):
+
+        """
+        Mark the books matching all given filters, the filters that are not set match every book.
+
+        :param year_from: The first publication year, inclusive.
+        :param year_to: The last publication year, inclusive.
+        :param author: The author of the books, exactly as it is written.
+        :param status: The status of the books.
+        :return: A mask for count, group_by and ids.
+        """
+
+        masks = []
+        if year_from is not None or year_to is not None:
+            masks.append(self.select('year', lambda year: (year_from is None or year >= year_from) and
+                                                          (year_to is None or year <= year_to)))
+        if author is not None:
+            masks.append(self.select('author', lambda code: self.author_names[code] == author))
+        if status is not None:
+            masks.append(self.select('status', lambda code: self.status_names[code] == status))
+        if not masks:
+            return self.numpy.ones(len(self), dtype=self.numpy.bool_) if self.numpy is not None else \
+                b'\1' * len(self)
+        mask = masks[0]
+        for other in masks[1:]:
+            if self.numpy is not None:
+                mask = mask & other
+            else:  # A bitwise and of the masks as big integers
+                mask = (int.from_bytes(mask, 'little') & int.from_bytes(other, 'little')).to_bytes(len(mask), 'little')
+        return mask
+
+    def count(self, mask=None) -> int:
+        if mask is None:
+            return len(self)
+        return int(self.numpy.count_nonzero(mask)) if self.numpy is not None else mask.count(1)
+
+    def ids_of(self, mask) -> list[int]:
+
+        """
+        Take the IDs of the marked books.
+
+        :param mask: A mask of where.
+        :return: The IDs in the order the books were exported.
+        """
+
+        if self.numpy is not None:
+            return self.numpy.frombuffer(self.ids, dtype=self.numpy.int32)[mask].tolist()
+        return list(itertools.compress(self.ids, mask))
+
+    def group_by(self, *keys: str, mask=None) -> dict:
+
+        """
+        Count the books in groups, for example by decade or by author and status.
+
+        :param keys: Names from GROUP_KEYS.
+        :param mask: A mask of where, all books if None.
+        :return: Number of books by the value of the key, or by the tuple of the values of several
+            keys, sorted, the same as group_books.
+        """
+
+        if not keys or any(key not in GROUP_KEYS for key in keys):
+            raise ValueError(f"Unknown group keys: {keys!r}")
+        columns = [self.columns['year' if key == 'decade' else key] for key in keys]
+        if self.numpy is not None:
+            if mask is not None:
+                columns = [column[mask] for column in columns]
+            combined = self.numpy.zeros(len(columns[0]), dtype=self.numpy.int64)
+            offsets = [min(int(column.min()), 0) if len(column) else 0 for column in columns]  # Negative years
+            sizes = [int(column.max()) - offset + 1 if len(column) else 0 for column, offset in zip(columns, offsets)]
+            for column, size, offset in zip(columns, sizes, offsets):
+                combined = combined * size + (column - offset)  # One code for every combination of the values
+            codes, counts = self.numpy.unique(combined, return_counts=True)  # Only the combinations that occur
+            raw = self.split_codes(codes, counts, sizes, offsets)
+        else:
+            if mask is not None:
+                columns = [itertools.compress(column, mask) for column in columns]
+            counts = Counter(columns[0] if len(columns) == 1 else zip(*columns))
+            raw = {(values if len(columns) > 1 else (values,)): count for values, count in counts.items()}
+        groups = Counter()
+        for values, count in raw.items():
+            group = tuple(self.decode(key, value) for key, value in zip(keys, values))
+            groups[group[0] if len(group) == 1 else group] += count
+        return dict(sorted(groups.items()))
+
+    @staticmethod
+    def split_codes(codes, counts, sizes: list[int], offsets: list[int]) -> dict[tuple, int]:
+
+        """
+        Split the combined codes counted by NumPy into the values of the columns.
+
+        :param codes: The combined codes that occur.
+        :param counts: Number of rows of every combined code.
+        :param sizes: Number of distinct codes of every column.
+        :param offsets: Smallest value of every column if it is negative, 0 otherwise.
+        :return: Number of rows by the tuple of the codes.
+        """
+
+        raw = {}
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            values = []
+            for size, offset in zip(reversed(sizes), reversed(offsets)):
+                code, value = divmod(code, size)
+                values.append(value + offset)
+            raw[tuple(reversed(values))] = count
+        return raw
+
+    def decode(self, key: str, value: int):
+        match key:
+            case 'decade':
+                return value // 10 * 10
+            case 'author':
+                return self.author_names[value]
+            case 'status':
+                return self.status_names[value]
+        return value
@@ -0,0 +1,718 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from book import Book, STATUSES
+from book_store import BookStore
+from collections import Counter
+from parallel import ParallelScanner, matches_query
+from sharding import ShardedStorage, rebalance
+from snapshot import SnapshotStorage, write_snapshot
+from storage import JsonStorage
+from unittest.mock import patch
+
+FIRST_NAMES = ['Михаил', 'Николай', 'Александр', 'Лев', 'Фёдор', 'Антон', 'Иван', 'Илья', 'Анна', 'Марина']
+LAST_NAMES = ['Булгаков', 'Гоголь', 'Дюма', 'Толстой', 'Достоевский', 'Чехов', 'Тургенев', 'Ильф', 'Ахматова',
+              'Цветаева', 'Пушкин', 'Лермонтов', 'Бунин', 'Куприн', 'Горький', 'Набоков']
+NOISE_FLOOR = {'_s': 0.0005, '_mib': 1.0}  # Smallest growth of seconds and MiB reported as a regression
+WORDS = ['мастер', 'сердце', 'стулья', 'души', 'граф', 'война', 'мир', 'идиот', 'дама', 'собака', 'вишнёвый',
+         'сад', 'отцы', 'дети', 'герой', 'нашего', 'времени', 'белая', 'гвардия', 'тихий', 'дон', 'анна']
+
+
+class DictBook:
+    def __init__(self, id: int, title: str, author: str, year: int, status: str = "в наличии") -> None:
+
+        """
+        Initialize a book with the layout Book had before __slots__, used as the baseline.
+        """
+
+        self.id = id
+        self.title = title
+        self.author = author
+        self.year = year
+        self.status = status
+
+
+def generate_books(count: int, seed: int = 0) -> list[dict]:
+
+    """
+    Generate a synthetic catalogue of books.
+
+    :param count: Number of books to generate.
+    :param seed: Seed of the random generator, the same seed gives the same catalogue.
+    :return: A list of book dictionaries in the format of library.json.
+    """
+
+    generator = random.Random(seed)
+    authors = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    return [{
+        'id': book_id,
+        'title': ' '.join(generator.choices(WORDS, k=generator.randint(1, 4))).capitalize(),
+        'author': generator.choice(authors),
+        'year': generator.randint(1000, 2024),
+        'status': generator.choice(STATUSES)
+    } for book_id in range(1, count + 1)]
+
+
+def measure_memory(build) -> int:
+
+    """
+    Measure the memory allocated by a function that builds a collection of books.
+
+    :param build: Function without arguments returning the collection.
+    :return: Number of bytes held by the returned collection.
+    """
+
+    tracemalloc.start()
+    collection = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del collection
+    return size
+
+
+def benchmark_memory(count: int) -> dict[str, int]:
+
+    """
+    Compare the memory used by the layouts of the books and by whole libraries.
+
+    For the layouts the titles and authors are created in advance, so only the memory of the layout
+    itself is measured: the objects or the columns. A library is loaded from a JSON file, so its
+    number includes the strings read from the file and everything the library keeps besides the books,
+    once as loaded and once after the first search has built the index.
+
+    :param count: Number of books.
+    :return: Bytes used by every layout and library.
+    """
+
+    from library import Library
+
+    books = generate_books(count)
+
+    def build_store() -> BookStore:
+        store = BookStore()
+        for book in books:
+            store[book['id']] = Book(**book)
+        return store
+
+    def build_library(file_name: str, compact: bool, search: bool) -> Library:
+        library = Library(file_name, compact=compact)
+        if search:
+            library.find_books('гоголь')
+        return library
+
+    results = {
+        'dict_books': measure_memory(lambda: {book['id']: DictBook(**book) for book in books}),
+        'slotted_books': measure_memory(lambda: {book['id']: Book(**book) for book in books}),
+        'book_store': measure_memory(build_store),
+    }
+    with tempfile.TemporaryDirectory() as directory, patch('builtins.print'):
+        file_name = os.path.join(directory, 'library.json')
+        write_catalogue(file_name, count)
+        for compact, search in itertools.product((False, True), repeat=2):
+            name = ('compact_library' if compact else 'library') + ('_searched' if search else '')
+            results[name] = measure_memory(lambda: build_library(file_name, compact, search))
+    return results
+
+
+def write_catalogue(file_name: str, count: int) -> None:
+
+    """
+    Write a synthetic catalogue to a JSON file in the format of library.json.
+
+    :param file_name: Path of the file.
+    :param count: Number of books.
+    """
+
+    with open(file_name, 'w', encoding='utf-8') as file:
+        json.dump(generate_books(count), file, ensure_ascii=False, indent=4)
+
+
+def run_load(file_name: str, lazy: bool) -> dict[str, float]:
+
+    """
+    Open a library and read its first page and then all books, in the current process.
+
+    :param file_name: Path of the JSON file.
+    :param lazy: Open the library in the lazy mode.
+    :return: Seconds to the first page and to all books, and the peak RSS in MiB.
+    """
+
+    from library import Library
+
+    start = time.perf_counter()
+    with patch('builtins.print'):
+        library = Library(file_name, lazy=lazy)
+        list(itertools.islice(library.iter_books(), 20))
+        first_page = time.perf_counter() - start
+        library.ensure_loaded()
+    return {
+        'first_page_s': first_page,
+        'full_load_s': time.perf_counter() - start,
+        'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark_load(count: int) -> dict[str, dict[str, float]]:
+
+    """
+    Compare the startup of the eager and the lazy loading on a synthetic catalogue.
+
+    Every mode runs in its own process, so the peak RSS of one does not affect the other.
+
+    :param count: Number of books.
+    :return: Results of run_load for every mode.
+    """
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'library.json')
+        write_catalogue(file_name, count)
+        for mode in ('eager', 'lazy'):
+            output = subprocess.run([sys.executable, __file__, 'load-run', file_name, mode],
+                                    check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(output)
+    return results
+
+
+def read_until(process: subprocess.Popen, marker: str) -> float:
+
+    """
+    Read the output of the console program until a line with the marker.
+
+    :param process: The console program started with a pipe for the output.
+    :param marker: The text to wait for.
+    :return: Seconds since the time.perf_counter origin when the line was read.
+    """
+
+    for line in process.stdout:
+        if marker in line:
+            return time.perf_counter()
+    raise RuntimeError(f"The console program ended before {marker!r}")
+
+
+def benchmark_startup(count: int) -> dict[str, float]:
+
+    """
+    Measure the console program on a synthetic catalogue: the time to the menu and to the first search.
+
+    The menu is shown while the books are loaded in the background, the search waits for them.
+    The full eager load of the same file in another process is measured for comparison.
+
+    :param count: Number of books.
+    :return: Seconds to the menu, to the answer of the first search and of the eager load.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'library.json')
+        JsonStorage(file_name).save((Book(**book) for book in generate_books(count)), count + 1)
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-u', os.path.join(os.path.dirname(__file__), 'main.py'),
+                                    '--file', file_name], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   text=True, encoding='utf-8')
+        try:
+            menu = read_until(process, '0. Выход.') - start
+            process.stdin.write('3\nбулгаков\n')
+            process.stdin.flush()
+            search = read_until(process, 'Найденные книги:') - start
+            process.stdin.write('0\n')
+            process.stdin.flush()
+            process.communicate()
+        finally:
+            process.kill()
+        output = subprocess.run([sys.executable, __file__, 'load-run', file_name, 'eager'],
+                                check=True, capture_output=True, text=True).stdout
+    return {'menu_s': menu, 'first_search_s': search, 'eager_load_s': json.loads(output)['full_load_s']}
+
+
+def run_snapshot(file_name: str) -> dict[str, float]:
+
+    """
+    Open a library on a binary snapshot and read its first page and one book by its ID, in the current process.
+
+    :param file_name: Path of the snapshot file.
+    :return: Seconds to the first page and to the lookup after it.
+    """
+
+    from library import Library
+
+    start = time.perf_counter()
+    with patch('builtins.print'):
+        library = Library(file_name, lazy=True, storage=SnapshotStorage(file_name))
+        library.display_books(0, 20)
+        first_page = time.perf_counter() - start
+        library.get_book(library.storage.reader.count // 2)
+    return {'first_page_s': first_page, 'lookup_s': time.perf_counter() - start - first_page}
+
+
+def benchmark_snapshot(counts: list[int]) -> dict[int, dict[str, float]]:
+
+    """
+    Measure the cold start on binary snapshots of different sizes.
+
+    Every size runs in its own process, so nothing is cached in the interpreter.
+
+    :param counts: Numbers of books.
+    :return: Results of run_snapshot for every number of books.
+    """
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            file_name = os.path.join(directory, f'library{count}.snap')
+            write_snapshot(file_name, (Book(**book) for book in generate_books(count)), count + 1)
+            output = subprocess.run([sys.executable, __file__, 'snapshot-run', file_name],
+                                    check=True, capture_output=True, text=True).stdout
+            results[count] = json.loads(output)
+    return results
+
+
+def benchmark_writes(count: int, changes: int) -> dict[str, float]:
+
+    """
+    Compare a burst of status changes saved on every call, in full or only the changed statuses, with the
+    journal and the write-behind mode.
+
+    :param count: Number of books in the library.
+    :param changes: Number of status changes in the burst.
+    :return: Status changes per second for every mode, the write-behind one including the final flush.
+    """
+
+    from library import Library
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, options in (('per_call', {}), ('differential', {'differential': True}),
+                              ('journal', {'journal': True}), ('write_behind', {'write_behind': True})):
+            file_name = os.path.join(directory, f'{mode}.json')
+            write_catalogue(file_name, count)
+            generator = random.Random(0)
+            with patch('builtins.print'):
+                library = Library(file_name, **options)
+            start = time.perf_counter()
+            with library:
+                for _ in range(changes):
+                    library.set_status(generator.randint(1, count), generator.choice(STATUSES))
+            results[mode] = changes / (time.perf_counter() - start)
+    return results
+
+
+def benchmark_shards(count: int, shard_counts: list[int], changes: int) -> dict[int, dict[str, float]]:
+
+    """
+    Compare a single JSON file with catalogues split into shards by the hash of the IDs.
+
+    :param count: Number of books.
+    :param shard_counts: Numbers of shards, 1 is the single JSON file.
+    :param changes: Number of status changes, every one saved at once.
+    :return: Seconds of the load and of one status change for every number of shards.
+    """
+
+    results = {}
+    generator = random.Random(0)
+    for shards in shard_counts:
+        with tempfile.TemporaryDirectory() as directory, patch('builtins.print'):
+            from library import Library
+
+            file_name = os.path.join(directory, 'library.json')
+            write_catalogue(file_name, count)
+            if shards > 1:
+                rebalance(file_name, 'hash', shards)
+            start = time.perf_counter()
+            library = Library(file_name, storage=ShardedStorage(file_name) if shards > 1 else None)
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(changes):
+                library.set_status(generator.randint(1, count), generator.choice(STATUSES))
+            results[shards] = {'load_s': load, 'change_s': (time.perf_counter() - start) / changes}
+    return results
+
+
+def benchmark_circulation(count: int, changes: int) -> dict[str, float]:
+
+    """
+    Compare the dashboard counters of the circulation with a full pass over the books.
+
+    :param count: Number of books.
+    :param changes: Number of status changes, persisted with the journal.
+    :return: Seconds of a full pass and of a read of the counters, and the status changes per second
+        without and with the log of checkouts and returns.
+    """
+
+    from library import Library
+
+    results = {}
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory, patch('builtins.print'):
+        file_name = os.path.join(directory, 'library.json')
+        write_catalogue(file_name, count)
+        for circulation in (False, True):
+            # The journal of both runs is never compacted, so no change rewrites the file
+            library = Library(file_name, journal=True, compact_threshold=2 * changes + 1, circulation=circulation)
+            start = time.perf_counter()
+            for _ in range(changes):
+                library.set_status(generator.randint(1, count), generator.choice(STATUSES))
+            results['changes_log' if circulation else 'changes'] = changes / (time.perf_counter() - start)
+        results['full_pass_s'] = time_operation(lambda run: Counter(
+            book.author for book in library.books.values() if book.status == STATUSES[1]).most_common(10), 5)
+        results['counters_s'] = time_operation(lambda run: library.circulation_stats(), 1000)
+    return results
+
+
+def benchmark_analytics(counts: list[int], repeat: int) -> dict[int, dict[str, float]]:
+
+    """
+    Compare the reports over the columns of analytics.py with the same reports over the book objects.
+
+    :param counts: Numbers of books.
+    :param repeat: Number of runs of every report.
+    :return: Seconds of the export to columns and of every report over the objects and the columns.
+    """
+
+    from analytics import ColumnTable, group_books
+
+    results = {}
+    for count in counts:
+        books = [Book(**book) for book in generate_books(count)]
+        start = time.perf_counter()
+        table = ColumnTable(books)
+        result = {'export_s': time.perf_counter() - start}
+        reports = {
+            'by_decade': (('decade',), {}),
+            'status_by_author': (('author', 'status'), {}),
+            'issued_1900_1950': (('status',), {'year_from': 1900, 'year_to': 1950, 'status': STATUSES[1]}),
+        }
+        for name, (keys, filters) in reports.items():
+            result[f'{name}_objects_s'] = time_operation(lambda run: group_books(books, *keys, **filters), repeat)
+            result[f'{name}_columns_s'] = time_operation(
+                lambda run: table.group_by(*keys, mask=table.where(**filters) if filters else None), repeat)
+        results[count] = result
+    return results
+
+
+def benchmark_threads(count: int, lookups: int, thread_counts: list[int]) -> dict[int, float]:
+
+    """
+    Measure lookups by ID and searches from a pool of threads sharing one thread-safe library.
+
+    :param count: Number of books in the library.
+    :param lookups: Number of operations done by every pool.
+    :param thread_counts: Sizes of the pools.
+    :return: Operations per second for every size of the pool.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from library import Library
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'library.json')
+        write_catalogue(file_name, count)
+        with patch('builtins.print'):
+            library = Library(file_name, thread_safe=True)
+        generator = random.Random(0)
+        operations = [generator.randint(1, count) for _ in range(lookups)]
+
+        def run(book_id: int) -> None:
+            if book_id % 10:
+                library.get_book(book_id)
+            else:
+                library.find_books(WORDS[book_id % len(WORDS)], 0, 20)
+
+        for threads in thread_counts:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                for _ in pool.map(run, operations, chunksize=256):
+                    pass
+            results[threads] = lookups / (time.perf_counter() - start)
+    return results
+
+
+def time_operation(operation, repeat: int) -> float:
+
+    """
+    Time an operation several times.
+
+    :param operation: Function without arguments, called with the index of the run.
+    :param repeat: Number of runs.
+    :return: The median number of seconds of one run.
+    """
+
+    times = []
+    for run in range(repeat):
+        start = time.perf_counter()
+        operation(run)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_suite(file_name: str, count: int, repeat: int) -> dict[str, float]:
+
+    """
+    Time the hot paths of Library on a synthetic catalogue, in the current process.
+
+    The searches run without the query cache so that the index itself is measured, and the
+    changes use the journal so that they do not rewrite the whole file. The peak memory of
+    the loading is measured separately, because tracemalloc slows everything down.
+
+    :param file_name: Path of the JSON file with the catalogue.
+    :param count: Number of books in the catalogue.
+    :param repeat: Number of runs of every fast operation.
+    :return: Median seconds of every operation and the peak memory of the loading in MiB.
+    """
+
+    from library import Library
+
+    def open_library() -> Library:
+        with patch('builtins.print'):
+            return Library(file_name, journal=True, compact_threshold=10 ** 9, cache_size=0)
+
+    results = {}
+    slow_repeat = 1 if count >= 1_000_000 else 3
+    results['load_books_s'] = time_operation(lambda run: open_library(), slow_repeat)
+    library = open_library()
+    results['save_books_s'] = time_operation(lambda run: library.save_books(), slow_repeat)
+    generator = random.Random(0)
+    ids = [generator.randint(1, count) for _ in range(repeat)]
+    results['find_hit_s'] = time_operation(lambda run: library.find_books('Булгаков', 0, 20), repeat)
+    results['find_miss_s'] = time_operation(lambda run: library.find_books('Нет такой книги', 0, 20), repeat)
+    results['find_substring_s'] = time_operation(lambda run: library.find_books('ма', 0, 20), repeat)
+    results['display_first_page_s'] = time_operation(lambda run: library.display_books(0, 20), repeat)
+    results['display_middle_page_s'] = time_operation(lambda run: library.display_books(count // 2, 20), repeat)
+    results['lookup_s'] = time_operation(lambda run: library.get_book(ids[run]), repeat)
+    results['status_s'] = time_operation(lambda run: library.set_status(ids[run], STATUSES[run % 2]), repeat)
+    added = []
+    results['add_s'] = time_operation(lambda run: added.append(library.new_book('Новая книга', 'Автор', 2000).id),
+                                      repeat)
+    results['remove_s'] = time_operation(lambda run: library.delete_book(added[run]), repeat)
+    del library
+
+    tracemalloc.start()
+    open_library()
+    results['load_peak_mib'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return results
+
+
+def benchmark_suite(counts: list[int], repeat: int) -> dict[str, dict[str, float]]:
+
+    """
+    Run the benchmark suite on synthetic catalogues of different sizes.
+
+    Every size runs in its own process, so the memory of one does not affect the other.
+
+    :param counts: Numbers of books.
+    :param repeat: Number of runs of every fast operation.
+    :return: Results of run_suite for every number of books.
+    """
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            file_name = os.path.join(directory, f'library{count}.json')
+            write_catalogue(file_name, count)
+            output = subprocess.run([sys.executable, __file__, 'suite-run', file_name, str(count), str(repeat)],
+                                    check=True, capture_output=True, text=True).stdout
+            results[str(count)] = json.loads(output)
+    return results
+
+
+def compare_results(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]],
+                    tolerance: float) -> list[str]:
+
+    """
+    Compare the results of the suite with a stored baseline.
+
+    :param results: Results of benchmark_suite.
+    :param baseline: Results of an earlier run.
+    :param tolerance: Allowed slowdown or memory growth as a fraction, for example 0.25.
+    :return: Descriptions of the metrics that got worse than the tolerance allows. Growth below
+        NOISE_FLOOR is ignored, the timings of the fastest operations jitter more than that.
+    """
+
+    regressions = []
+    for count, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(count, {}).get(name)
+            floor = next((floor for suffix, floor in NOISE_FLOOR.items() if name.endswith(suffix)), 0)
+            if old and value > old * (1 + tolerance) and value - old > floor:
+                regressions.append(f"{count} books {name}: {old:.6g} -> {value:.6g} ({value / old - 1:+.0%})")
+    return regressions
+
+
+def benchmark_parallel(count: int, worker_counts: list[int], repeat: int) -> dict[int, dict[str, float]]:
+
+    """
+    Compare the scan of all books in the current process with the scan in worker processes.
+
+    :param count: Number of books.
+    :param worker_counts: Numbers of worker processes, 1 is the scan in the current process.
+    :param repeat: Number of scans for every number of workers.
+    :return: Seconds to start the workers, the median seconds of a scan and the speedup for every number of workers.
+    """
+
+    books = [Book(**book) for book in generate_books(count)]
+    queries = [(query, query.lower()) for query in ('Булгаков', 'ма', 'нет такой книги', '1925')]
+    results = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        scanner = ParallelScanner(books, workers) if workers > 1 else None
+        startup = time.perf_counter() - start
+
+        def scan(run: int) -> None:
+            query, lowered = queries[run % len(queries)]
+            if scanner is None:
+                [book.id for book in books if matches_query(book, query, lowered)]
+            else:
+                scanner.scan(matches_query, query, lowered)
+
+        results[workers] = {'startup_s': startup, 'scan_s': time_operation(scan, repeat)}
+        if scanner is not None:
+            scanner.close()
+    baseline = results[worker_counts[0]]['scan_s']
+    for result in results.values():
+        result['speedup'] = baseline / result['scan_s']
+    return results
+
+
+def main() -> None:
+
+    """
+    Run the benchmarks from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the library.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    memory_parser = subparsers.add_parser('memory', help='Compare the memory used by the layouts of the books '
+                                                         'and by whole libraries.')
+    memory_parser.add_argument('--books', type=int, default=1_000_000, help='Number of books.')
+    load_parser = subparsers.add_parser('load', help='Compare the startup of the eager and the lazy loading.')
+    load_parser.add_argument('--books', type=int, default=1_000_000, help='Number of books.')
+    load_run_parser = subparsers.add_parser('load-run')  # Used by the load benchmark in a child process
+    load_run_parser.add_argument('file_name')
+    load_run_parser.add_argument('mode', choices=['eager', 'lazy'])
+    startup_parser = subparsers.add_parser('startup', help='Measure the time to the menu of the console program.')
+    startup_parser.add_argument('--books', type=int, default=1_000_000, help='Number of books.')
+    snapshot_parser = subparsers.add_parser('snapshot', help='Measure the cold start on binary snapshots.')
+    snapshot_parser.add_argument('--books', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                                 help='Numbers of books.')
+    snapshot_run_parser = subparsers.add_parser('snapshot-run')  # Used by the snapshot benchmark in a child process
+    snapshot_run_parser.add_argument('file_name')
+    writes_parser = subparsers.add_parser('writes', help='Compare the per-call save with the write-behind mode.')
+    writes_parser.add_argument('--books', type=int, default=1000, help='Number of books.')
+    writes_parser.add_argument('--changes', type=int, default=10_000, help='Number of status changes.')
+    shards_parser = subparsers.add_parser('shards', help='Compare a single JSON file with sharded catalogues.')
+    shards_parser.add_argument('--books', type=int, default=100_000, help='Number of books.')
+    shards_parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16], help='Numbers of shards.')
+    shards_parser.add_argument('--changes', type=int, default=20, help='Number of status changes.')
+    circulation_parser = subparsers.add_parser('circulation', help='Compare the circulation counters with a full pass.')
+    circulation_parser.add_argument('--books', type=int, default=1_000_000, help='Number of books.')
+    circulation_parser.add_argument('--changes', type=int, default=1000, help='Number of status changes.')
+    analytics_parser = subparsers.add_parser('analytics', help='Compare the reports over columns and over objects.')
+    analytics_parser.add_argument('--books', type=int, nargs='+', default=[1_000_000, 2_000_000],
+                                  help='Numbers of books.')
+    analytics_parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every report.')
+    threads_parser = subparsers.add_parser('threads', help='Measure a thread pool sharing a thread-safe library.')
+    threads_parser.add_argument('--books', type=int, default=10_000, help='Number of books.')
+    threads_parser.add_argument('--lookups', type=int, default=20_000, help='Number of operations.')
+    threads_parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help='Sizes of the pool.')
+    suite_parser = subparsers.add_parser('suite', help='Time the hot paths of the library and compare with a baseline.')
+    suite_parser.add_argument('--books', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                              help='Numbers of books.')
+    suite_parser.add_argument('--repeat', type=int, default=50, help='Number of runs of every fast operation.')
+    suite_parser.add_argument('--output', help='JSON file to write the results to.')
+    suite_parser.add_argument('--baseline', help='JSON file with the results of an earlier run to compare with.')
+    suite_parser.add_argument('--tolerance', type=float, default=0.25,
+                              help='Allowed slowdown or memory growth as a fraction of the baseline.')
+    parallel_parser = subparsers.add_parser('parallel', help='Compare the scan in one and in several processes.')
+    parallel_parser.add_argument('--books', type=int, default=1_000_000, help='Number of books.')
+    parallel_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1],
+                                 help='Numbers of worker processes, 1 is the current process.')
+    parallel_parser.add_argument('--repeat', type=int, default=8, help='Number of scans for every number of workers.')
+    suite_run_parser = subparsers.add_parser('suite-run')  # Used by the suite in a child process
+    suite_run_parser.add_argument('file_name')
+    suite_run_parser.add_argument('count', type=int)
+    suite_run_parser.add_argument('repeat', type=int)
+    args = parser.parse_args()
+
+    match args.command:
+        case 'memory':
+            results = benchmark_memory(args.books)
+            baseline = results['dict_books']
+            for name, size in results.items():
+                print(f"{name:<24} {size / 2 ** 20:>10.1f} MiB {size / args.books:>8.1f} B/book "
+                      f"{size / baseline:>6.0%}")
+        case 'load':
+            for mode, result in benchmark_load(args.books).items():
+                print(f"{mode:<6} first page {result['first_page_s']:>8.3f} s  "
+                      f"all books {result['full_load_s']:>8.3f} s  peak RSS {result['peak_rss_mib']:>8.1f} MiB")
+        case 'load-run':
+            print(json.dumps(run_load(args.file_name, args.mode == 'lazy')))
+        case 'startup':
+            result = benchmark_startup(args.books)
+            print(f"menu {result['menu_s']:>8.3f} s  first search {result['first_search_s']:>8.3f} s  "
+                  f"eager load {result['eager_load_s']:>8.3f} s")
+        case 'snapshot':
+            for count, result in benchmark_snapshot(args.books).items():
+                print(f"{count:>10} books  first page {result['first_page_s'] * 1000:>8.2f} ms  "
+                      f"lookup {result['lookup_s'] * 1000:>8.3f} ms")
+        case 'snapshot-run':
+            print(json.dumps(run_snapshot(args.file_name)))
+        case 'writes':
+            for mode, rate in benchmark_writes(args.books, args.changes).items():
+                print(f"{mode:<13} {rate:>10.1f} changes/s")
+        case 'shards':
+            for shards, result in benchmark_shards(args.books, args.shards, args.changes).items():
+                print(f"{shards:>3} shards  load {result['load_s']:>7.2f} s  "
+                      f"status change {result['change_s'] * 1000:>9.1f} ms")
+        case 'circulation':
+            result = benchmark_circulation(args.books, args.changes)
+            print(f"issued by author: full pass {result['full_pass_s'] * 1000:>9.2f} ms  "
+                  f"counters {result['counters_s'] * 1000:>9.4f} ms")
+            print(f"status changes: {result['changes']:>8.0f}/s  with the log {result['changes_log']:>8.0f}/s")
+        case 'analytics':
+            from analytics import numpy
+            print(f"Столбцы: {'NumPy ' + numpy.__version__ if numpy is not None else 'array'}")
+            for count, result in benchmark_analytics(args.books, args.repeat).items():
+                print(f"{count} books: export {result.pop('export_s'):.2f} s")
+                for name, value in result.items():
+                    print(f"  {name:<30} {value * 1000:>10.1f} ms")
+        case 'threads':
+            for threads, rate in benchmark_threads(args.books, args.lookups, args.threads).items():
+                print(f"{threads:>3} threads {rate:>10.0f} operations/s")
+        case 'suite':
+            results = benchmark_suite(args.books, args.repeat)
+            for count, metrics in results.items():
+                print(f"{count} books:")
+                for name, value in metrics.items():
+                    print(f"  {name:<22} {value * 1000 if name.endswith('_s') else value:>12.3f} "
+                          f"{'ms' if name.endswith('_s') else 'MiB'}")
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as file:
+                    json.dump(results, file, indent=4)
+            if args.baseline:
+                with open(args.baseline, 'r', encoding='utf-8') as file:
+                    regressions = compare_results(results, json.load(file), args.tolerance)
+                for regression in regressions:
+                    print(f"Регрессия: {regression}")
+                if regressions:
+                    sys.exit(1)
+        case 'parallel':
+            print(f"Ядер процессора: {os.cpu_count()}")
+            for workers, result in benchmark_parallel(args.books, sorted(set(args.workers)), args.repeat).items():
+                print(f"{workers:>3} workers  startup {result['startup_s']:>7.2f} s  scan {result['scan_s'] * 1000:>9.1f} ms  "
+                      f"speedup {result['speedup']:>5.2f}x")
+        case 'suite-run':
+            print(json.dumps(run_suite(args.file_name, args.count, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,11 @@
+STATUS_AVAILABLE = "в наличии"  # Status of a book that can be given out
+STATUS_ISSUED = "выдана"  # Status of a book that is given out
+STATUSES = (STATUS_AVAILABLE, STATUS_ISSUED)  # All valid statuses of a book
+
+
 class Book:
+    __slots__ = ('id', 'title', 'author', 'year', 'status')  # No per-instance __dict__ to save memory
+
     def __init__(self, id: int, title: str, author: str, year: int, status: str = "в наличии") -> None:
         """
         Initialize a Book instance.
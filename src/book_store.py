@@ -0,0 +1,245 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterator
+from book import Book, STATUSES
+
+DELETED = 255  # Status code of a removed book whose slot was not reclaimed yet
+
+
+class BookView:
+    __slots__ = ('store', 'book_id', 'position', 'generation')  # A view holds no fields of the book
+
+    def __init__(self, store: 'BookStore', slot: int) -> None:
+
+        """
+        Initialize a view of a book kept in a BookStore.
+
+        The view has the same attributes and methods as Book, so it can be used everywhere
+        a Book is expected. It keeps working when the store reclaims slots: the slot is then
+        found again by the ID of the book.
+
+        :param store: The store holding the book.
+        :param slot: Position of the book in the columns of the store.
+        """
+
+        self.store: BookStore = store  # Store holding the book
+        self.book_id: int = store.ids[slot]  # ID of the book, used to find it after the slots are reclaimed
+        self.position: int = slot  # Position of the book in the columns in the generation below
+        self.generation: int = store.generation  # Generation of the slots the position belongs to
+
+    @property
+    def slot(self) -> int:
+
+        """
+        Get the current position of the book in the columns.
+
+        :return: The slot of the book.
+        :raises KeyError: If the book was removed and its slot reclaimed.
+        """
+
+        if self.generation != self.store.generation:
+            slot = self.store.find_slot(self.book_id)
+            if slot is None:
+                raise KeyError(self.book_id)
+            self.position, self.generation = slot, self.store.generation
+        return self.position
+
+    @property
+    def id(self) -> int:
+        return self.book_id
+
+    @property
+    def title(self) -> str:
+        return self.store.titles[self.slot]
+
+    @property
+    def author(self) -> str:
+        return self.store.authors[self.slot]
+
+    @property
+    def year(self) -> int:
+        return self.store.years[self.slot]
+
+    @property
+    def status(self) -> str:
+        return self.store.status_names[self.store.statuses[self.slot]]
+
+    @status.setter
+    def status(self, status: str) -> None:
+        self.store.statuses[self.slot] = self.store.status_code(status)
+
+    def to_dict(self) -> dict:
+
+        """
+        Converting the book to a dictionary.
+
+        :return: A dictionary representation of the book, the same as Book.to_dict.
+        """
+
+        return {
+            'id': self.id,
+            'title': self.title,
+            'author': self.author,
+            'year': self.year,
+            'status': self.status
+        }
+
+
+class BookStore:
+    def __init__(self) -> None:
+
+        """
+        Initialize an empty columnar store of books.
+
+        Every field of the books is kept in its own column: IDs and years in integer arrays,
+        statuses as one-byte codes and authors as shared strings. The store can be used instead
+        of the dictionary of books by their IDs: it supports the same mapping operations and
+        hands out BookView objects.
+        """
+
+        self.ids: array = array('i')  # IDs of the books
+        self.years: array = array('i')  # Publication years of the books
+        self.statuses: bytearray = bytearray()  # Status codes of the books, DELETED for removed books
+        self.titles: list[str] = []  # Titles of the books
+        self.authors: list[str] = []  # Authors of the books, equal names share one string
+        self.status_names: list[str] = list(STATUSES)  # Status names by their codes
+        self.status_codes: dict[str, int] = {status: code for code, status in enumerate(STATUSES)}
+        self.author_names: dict[str, str] = {}  # Shared string for every author name
+        self.slots: dict[int, int] | None = None  # Slots by IDs, only used when IDs are not added in ascending order
+        self.count: int = 0  # Number of books in the store
+        self.deleted: int = 0  # Number of slots of removed books
+        self.generation: int = 0  # Changed every time the slots are reclaimed and the books move
+
+    def status_code(self, status: str) -> int:
+
+        """
+        Get the one-byte code of a status, adding unknown statuses to the table of codes.
+
+        :param status: The status name.
+        :return: The code of the status.
+        """
+
+        code = self.status_codes.get(status)
+        if code is None:
+            if len(self.status_names) >= DELETED:
+                raise ValueError(f"Too many distinct statuses: {status!r}")
+            code = len(self.status_names)
+            self.status_names.append(status)
+            self.status_codes[status] = code
+        return code
+
+    def find_slot(self, book_id: int) -> int | None:
+
+        """
+        Find the slot of a book by its ID.
+
+        IDs are usually added in ascending order, then the slot is found by binary search
+        without keeping any per-book index.
+
+        :param book_id: The ID of the book.
+        :return: The slot of the book or None if there is no book with such ID.
+        """
+
+        if self.slots is not None:
+            slot = self.slots.get(book_id)
+        else:
+            slot = bisect_left(self.ids, book_id)
+            if slot == len(self.ids) or self.ids[slot] != book_id:
+                return None
+        if slot is None or self.statuses[slot] == DELETED:
+            return None
+        return slot
+
+    def __setitem__(self, book_id: int, book: Book) -> None:
+        slot = self.find_slot(book_id)
+        author = self.author_names.setdefault(book.author, book.author)
+        if slot is not None:
+            self.titles[slot] = book.title
+            self.authors[slot] = author
+            self.years[slot] = book.year
+            self.statuses[slot] = self.status_code(book.status)
+            return
+
+        if self.slots is None and self.ids and self.ids[-1] >= book_id:
+            self.slots = {self.ids[slot]: slot for slot in range(len(self.ids)) if self.statuses[slot] != DELETED}
+        if self.slots is not None:
+            self.slots[book_id] = len(self.ids)
+
+        self.ids.append(book_id)
+        self.years.append(book.year)
+        self.statuses.append(self.status_code(book.status))
+        self.titles.append(book.title)
+        self.authors.append(author)
+        self.count += 1
+
+    def __getitem__(self, book_id: int) -> BookView:
+        slot = self.find_slot(book_id)
+        if slot is None:
+            raise KeyError(book_id)
+        return BookView(self, slot)
+
+    def get(self, book_id: int, default: BookView | None = None) -> BookView | None:
+        slot = self.find_slot(book_id)
+        return default if slot is None else BookView(self, slot)
+
+    def pop(self, book_id: int, default: Book | None = None) -> Book | None:
+
+        """
+        Remove a book from the store.
+
+        :param book_id: The ID of the book.
+        :param default: The value returned if there is no book with such ID.
+        :return: A detached Book with the fields of the removed book.
+        """
+
+        slot = self.find_slot(book_id)
+        if slot is None:
+            return default
+
+        book = Book(**BookView(self, slot).to_dict())
+        self.statuses[slot] = DELETED
+        self.titles[slot] = self.authors[slot] = ''
+        if self.slots is not None:
+            del self.slots[book_id]
+        self.count -= 1
+        self.deleted += 1
+
+        if self.deleted > self.count:
+            self.reclaim()
+        return book
+
+    def reclaim(self) -> None:
+
+        """
+        Drop the slots of removed books from all columns.
+
+        The books move to other slots, so the generation is changed and the views given out
+        before find their books again.
+        """
+
+        live = [slot for slot in range(len(self.ids)) if self.statuses[slot] != DELETED]
+        self.ids = array('i', (self.ids[slot] for slot in live))
+        self.years = array('i', (self.years[slot] for slot in live))
+        self.statuses = bytearray(self.statuses[slot] for slot in live)
+        self.titles = [self.titles[slot] for slot in live]
+        self.authors = [self.authors[slot] for slot in live]
+        if self.slots is not None:
+            self.slots = {book_id: slot for slot, book_id in enumerate(self.ids)}
+        self.deleted = 0
+        self.generation += 1
+
+    def __contains__(self, book_id: int) -> bool:
+        return self.find_slot(book_id) is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        for slot in range(len(self.ids)):
+            if self.statuses[slot] != DELETED:
+                yield self.ids[slot]
+
+    def values(self) -> Iterator[BookView]:
+        for slot in range(len(self.ids)):
+            if self.statuses[slot] != DELETED:
+                yield BookView(self, slot)
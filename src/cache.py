@@ -0,0 +1,127 @@
+from book import Book
+from collections import OrderedDict
+import threading
+
+CACHE_SIZE = 128  # Number of search queries kept in the cache
+
+
+class CacheEntry:
+    __slots__ = ('ids', 'members', 'pages')
+
+    def __init__(self, ids: list[int]) -> None:
+        self.ids: list[int] = ids  # IDs of the found books in the order they were added
+        self.members: set[int] = set(ids)  # The same IDs for the checks of the changed books
+        self.pages: dict[tuple[int, int | None], str] = {}  # Rendered pages by their offset and limit
+
+
+class QueryCache:
+    def __init__(self, size: int = CACHE_SIZE) -> None:
+
+        """
+        Initialize a bounded cache of the search results, the least recently used query is dropped first.
+
+        Every query keeps the IDs of the found books and its rendered pages. A change of the
+        library drops only the entries it affects: an added book drops the queries it matches,
+        a removed book drops the queries that found it, and a new status of a book drops only
+        the rendered pages of the queries that found it.
+
+        :param size: Maximum number of queries in the cache.
+        """
+
+        self.size: int = size  # Maximum number of queries
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()  # Entries by their queries, the oldest first
+        self.lock: threading.Lock = threading.Lock()  # Readers of a thread-safe library share the cache
+        self.hits: int = 0  # Number of lookups answered by the cache
+        self.misses: int = 0  # Number of lookups not found in the cache
+
+    def get(self, query: str) -> list[int] | None:
+
+        """
+        Take the IDs of the books found by a query.
+
+        :param query: The search query.
+        :return: The IDs in the order the books were added, or None if the query is not cached.
+        """
+
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(query)
+            self.hits += 1
+            return entry.ids
+
+    def put(self, query: str, ids: list[int]) -> None:
+        with self.lock:
+            self.entries[query] = CacheEntry(ids)
+            self.entries.move_to_end(query)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def get_page(self, query: str, offset: int, limit: int | None) -> str | None:
+
+        """
+        Take a rendered page of the books found by a query.
+
+        :param query: The search query.
+        :param offset: Number of found books skipped on the page.
+        :param limit: Maximum number of books on the page.
+        :return: The rendered page, or None if it is not cached.
+        """
+
+        with self.lock:
+            entry = self.entries.get(query)
+            page = None if entry is None else entry.pages.get((offset, limit))
+            if page is None:
+                return None  # The miss is counted by get when the books are searched
+            self.entries.move_to_end(query)
+            self.hits += 1
+            return page
+
+    def put_page(self, query: str, offset: int, limit: int | None, page: str) -> None:
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry is not None:
+                entry.pages[(offset, limit)] = page
+
+    def book_added(self, book: Book) -> None:
+
+        """
+        Drop the queries matching a new book.
+
+        :param book: The added book.
+        """
+
+        if not self.entries:
+            return  # Nothing to check while the books are loaded
+        title, author, year = book.title.lower(), book.author.lower(), str(book.year)
+        with self.lock:
+            for query in [query for query in self.entries
+                          if query.lower() in title or query.lower() in author or query == year]:
+                del self.entries[query]
+
+    def book_removed(self, book_id: int) -> None:
+
+        """
+        Drop the queries that found a removed book.
+
+        :param book_id: The ID of the removed book.
+        """
+
+        with self.lock:
+            for query in [query for query, entry in self.entries.items() if book_id in entry.members]:
+                del self.entries[query]
+
+    def book_changed(self, book_id: int) -> None:
+
+        """
+        Drop the rendered pages of the queries that found a book with a new status.
+
+        :param book_id: The ID of the changed book.
+        """
+
+        with self.lock:
+            for entry in self.entries.values():
+                if book_id in entry.members:
+                    entry.pages.clear()
@@ -0,0 +1,213 @@
+from book import Book, STATUS_AVAILABLE, STATUS_ISSUED
+from collections import Counter
+from storage import resolve_path
+from typing import Iterable, Iterator
+import json
+import os
+import sys
+import time
+
+CIRCULATION_SUFFIX = '.circulation'  # Suffix of the log of checkouts and returns stored next to the JSON file
+TOP_AUTHORS = 10  # Number of the most borrowed authors in the snapshot
+
+
+class Circulation:
+    def __init__(self, file_name: str | None = None) -> None:
+
+        """
+        Initialize the counters of the circulation and the append-only log of checkouts and returns.
+
+        The counters of the current state, the available and issued books and the issued books of
+        every author and year, follow every change of the library. The counters of the history,
+        the checkouts and returns of every author and year, follow the log. Both are kept up to
+        date with every event, so reading them does not look at the books.
+
+        :param file_name: The name of the JSON file of the library, the log is stored next to it.
+            The log is not written if None.
+        """
+
+        self.log_name: str | None = None if file_name is None else resolve_path(file_name) + CIRCULATION_SUFFIX
+        self.available: int = 0  # Number of books with the status 'в наличии'
+        self.issued: int = 0  # Number of books with the status 'выдана'
+        self.issued_by_author: Counter[str] = Counter()  # Issued books of every author
+        self.issued_by_year: Counter[int] = Counter()  # Issued books of every publication year
+        self.checkouts: int = 0  # Number of checkouts in the log
+        self.returns: int = 0  # Number of returns in the log
+        self.checkouts_by_author: Counter[str] = Counter()  # Checkouts of the books of every author
+        self.checkouts_by_year: Counter[int] = Counter()  # Checkouts of the books of every publication year
+
+    def count(self, book: Book, status: str, change: int) -> None:
+
+        """
+        Count a book with a status in the counters of the current state or take it out of them.
+
+        :param book: The book.
+        :param status: Its status.
+        :param change: 1 to count the book, -1 to take it out.
+        """
+
+        if status == STATUS_ISSUED:
+            self.issued += change
+            self.issued_by_author[book.author] += change
+            self.issued_by_year[book.year] += change
+            if not self.issued_by_author[book.author]:
+                del self.issued_by_author[book.author]
+            if not self.issued_by_year[book.year]:
+                del self.issued_by_year[book.year]
+        else:
+            self.available += change
+
+    def book_added(self, book: Book) -> None:
+        self.count(book, book.status, 1)
+
+    def book_removed(self, book: Book) -> None:
+        self.count(book, book.status, -1)
+
+    def status_changed(self, book: Book, old: str, new: str) -> None:
+        self.count(book, old, -1)
+        self.count(book, new, 1)
+
+    def apply(self, event: dict) -> None:
+
+        """
+        Count an event of the log in the counters of the history.
+
+        :param event: The event with 'op' 'checkout' or 'return', and the 'author' and the 'year' of the book.
+        """
+
+        if event['op'] == 'checkout':
+            self.checkouts += 1
+            self.checkouts_by_author[event['author']] += 1
+            self.checkouts_by_year[event['year']] += 1
+        else:
+            self.returns += 1
+
+    def record(self, book: Book, status: str) -> None:
+
+        """
+        Append a checkout or a return of a book to the log and count it.
+
+        :param book: The book.
+        :param status: The new status of the book, 'выдана' for a checkout and 'в наличии' for a return.
+        """
+
+        event = {'op': 'checkout' if status == STATUS_ISSUED else 'return', 'id': book.id,
+                 'author': book.author, 'year': book.year, 'time': time.time()}
+        if self.log_name is not None:
+            with open(self.log_name, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(event, ensure_ascii=False) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+        self.apply(event)
+
+    def read_log(self) -> Iterator[dict]:
+
+        """
+        Read the events of the log.
+
+        A torn last line (the process died in the middle of a write) is discarded and cut from the
+        file, so the events recorded afterwards are not appended to it.
+
+        :return: An iterator over the events in the order they happened.
+        """
+
+        if self.log_name is None or not os.path.exists(self.log_name):
+            return
+        valid_size = 0
+        with open(self.log_name, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    event = json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                yield event
+                valid_size += len(line)
+
+        if os.path.getsize(self.log_name) != valid_size:
+            print('Журнал выдачи повреждён, последняя неполная запись отброшена.')
+            with open(self.log_name, 'r+b') as file:
+                file.truncate(valid_size)
+
+    def replay(self) -> dict[int, str]:
+
+        """
+        Rebuild the counters of the history from the log.
+
+        :return: The status every book has after its last event, by the IDs of the books.
+        """
+
+        self.checkouts = self.returns = 0
+        self.checkouts_by_author.clear()
+        self.checkouts_by_year.clear()
+        statuses = {}
+        for event in self.read_log():
+            self.apply(event)
+            statuses[event['id']] = STATUS_ISSUED if event['op'] == 'checkout' else STATUS_AVAILABLE
+        return statuses
+
+    def verify(self, books: Iterable[Book]) -> list[str]:
+
+        """
+        Check the counters against a full recount of the books and a replay of the log.
+
+        :param books: All books of the library.
+        :return: Descriptions of the differences, empty if everything matches.
+        """
+
+        recount = Circulation()
+        replayed = Circulation()
+        replayed.log_name = self.log_name  # Replays the same log without touching these counters
+        statuses = replayed.replay()
+        problems = []
+        for book in books:
+            recount.book_added(book)
+            if statuses.get(book.id, book.status) != book.status:
+                problems.append(f"Книга {book.id}: в журнале выдачи {statuses[book.id]}, в каталоге {book.status}")
+        for name in ('available', 'issued', 'issued_by_author', 'issued_by_year'):
+            if getattr(self, name) != getattr(recount, name):
+                problems.append(f"{name}: {getattr(self, name)} вместо {getattr(recount, name)} по пересчёту книг")
+        for name in ('checkouts', 'returns', 'checkouts_by_author', 'checkouts_by_year'):
+            if getattr(self, name) != getattr(replayed, name):
+                problems.append(f"{name}: {getattr(self, name)} вместо {getattr(replayed, name)} по журналу выдачи")
+        return problems
+
+    def snapshot(self, top: int = TOP_AUTHORS) -> dict:
+
+        """
+        Collect the counters for a dashboard.
+
+        :param top: Number of the most borrowed authors.
+        :return: The available and issued books, the checkouts and returns, and the most borrowed authors.
+        """
+
+        return {'available': self.available, 'issued': self.issued, 'checkouts': self.checkouts,
+                'returns': self.returns, 'most_borrowed_authors': self.checkouts_by_author.most_common(top)}
+
+
+def main() -> None:
+
+    """
+    Replay the log of checkouts and returns of a library and check the counters against a full recount.
+    """
+
+    from library import Library
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the circulation counters of library.json.')
+    parser.add_argument('file_name')
+    args = parser.parse_args()
+
+    library = Library(os.path.abspath(args.file_name), circulation=True)
+    print(json.dumps(library.circulation.snapshot(), ensure_ascii=False, indent=4))
+    problems = library.verify_circulation()
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("Счётчики совпадают с журналом выдачи и пересчётом книг.")
+
+
+if __name__ == "__main__":
+    main()
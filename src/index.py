@@ -0,0 +1,460 @@
+from bisect import bisect_left, bisect_right, insort
+from book import Book
+from collections import Counter
+from typing import Callable
+import heapq
+import re
+
+NGRAM_SIZE = 3  # Length of the n-grams stored in the index
+FUZZY_LIMIT = 20  # Number of books returned by the fuzzy search by default
+WORD = re.compile(r'\w+')  # A word of a title or an author for the fuzzy search
+
+
+def ngrams(text: str) -> set[str]:
+
+    """
+    Split a text into the set of its n-grams.
+
+    :param text: The text to split, already lowercased.
+    :return: A set of all substrings of the text with the length of NGRAM_SIZE.
+    """
+
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def words(text: str) -> set[str]:
+
+    """
+    Split a text into the set of its lowercased words.
+
+    :param text: The text to split.
+    :return: A set of the words, sequences of letters and digits.
+    """
+
+    return set(WORD.findall(text.lower()))
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+
+    """
+    Compute the Levenshtein distance between two words.
+
+    :param first: The first word.
+    :param second: The second word.
+    :param limit: Largest distance of interest, the computation stops once it is exceeded.
+    :return: The distance, or limit + 1 if it is larger than the limit.
+    """
+
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1] + (first_char != second_char)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class BookIndex:
+    def __init__(self, books: dict[int, Book] | None = None):
+
+        """
+        Initialize an empty inverted index over the books.
+
+        Titles and authors are lowercased the same way as in the linear search and split
+        into n-grams, every n-gram keeps the set of IDs of the books containing it.
+        Years are stored in a separate hash index.
+
+        Secondary indexes answer the filters of query: a bitmap of the positions of the books
+        for every status, the sorted list of the years for ranges, and the books of every
+        lowercased author with the sorted list of the authors for prefixes. The fuzzy search
+        uses the books of every word and the n-grams of the distinct words.
+
+        :param books: Books by their IDs maintained by the owner of the index. If not given,
+            the index keeps its own dictionary of the added books.
+        """
+
+        self.owned: bool = books is None  # The index adds and removes books in its own dictionary
+        self.books: dict[int, Book] = {} if books is None else books  # Indexed books by their IDs
+        self.order: dict[int, int] = {}  # Position of every book in the order it was added
+        self.postings: dict[str, set[int]] = {}  # IDs of the books for every n-gram
+        self.short: set[int] = set()  # IDs of the books with a title or an author shorter than an n-gram
+        self.years: dict[str, set[int]] = {}  # IDs of the books for every publication year
+        self.counter: int = 0  # Position given to the next added book
+        self.positions: dict[int, int] = {}  # ID of the book at every position
+        self.statuses: dict[str, bytearray] = {}  # Bitmap of the positions of the books for every status
+        self.year_keys: list[int] = []  # Sorted publication years of the indexed books
+        self.authors: dict[str, set[int]] = {}  # IDs of the books for every lowercased author
+        self.author_keys: list[str] = []  # Sorted lowercased authors of the indexed books
+        self.words: dict[str, set[int]] = {}  # IDs of the books for every word of the titles and the authors
+        self.word_grams: dict[str, set[str]] = {}  # Words containing every n-gram
+
+    def add(self, book: Book) -> None:
+
+        """
+        Add a book to the index.
+
+        :param book: The book to add.
+        """
+
+        if self.owned:
+            self.books[book.id] = book
+        self.order[book.id] = self.counter
+        self.positions[self.counter] = book.id
+        self.counter += 1
+        self.link(book)
+
+    def remove(self, book: Book) -> None:
+
+        """
+        Remove a book from the index.
+
+        :param book: The book to remove.
+        """
+
+        if book.id not in self.order:
+            return
+        self.unlink(book)  # Reads the position of the book in its status bitmap
+        del self.positions[self.order.pop(book.id)]
+        if self.owned:
+            del self.books[book.id]
+
+    def link(self, book: Book) -> None:
+
+        """
+        Add the ID of a book to the postings of its n-grams, its year, its status and its author.
+
+        :param book: The book to link.
+        """
+
+        title, author = book.title.lower(), book.author.lower()
+        for gram in ngrams(title) | ngrams(author):
+            self.postings.setdefault(gram, set()).add(book.id)
+        if len(title) < NGRAM_SIZE or len(author) < NGRAM_SIZE:
+            self.short.add(book.id)
+        if str(book.year) not in self.years:
+            insort(self.year_keys, book.year)
+        self.years.setdefault(str(book.year), set()).add(book.id)
+        self.mark(book.status, self.order[book.id], True)
+        if author not in self.authors:
+            insort(self.author_keys, author)
+        self.authors.setdefault(author, set()).add(book.id)
+
+        for word in words(title) | words(author):
+            if word not in self.words:
+                self.words[word] = set()
+                for gram in ngrams(word):
+                    self.word_grams.setdefault(gram, set()).add(word)
+            self.words[word].add(book.id)
+
+    def unlink(self, book: Book) -> None:
+
+        """
+        Remove the ID of a book from the postings of its n-grams, its year, its status and its author.
+
+        :param book: The book to unlink.
+        """
+
+        for gram in ngrams(book.title.lower()) | ngrams(book.author.lower()):
+            ids = self.postings[gram]
+            ids.discard(book.id)
+            if not ids:
+                del self.postings[gram]
+        self.short.discard(book.id)
+
+        ids = self.years[str(book.year)]
+        ids.discard(book.id)
+        if not ids:
+            del self.years[str(book.year)]
+            del self.year_keys[bisect_left(self.year_keys, book.year)]
+
+        self.mark(book.status, self.order[book.id], False)
+
+        author = book.author.lower()
+        ids = self.authors[author]
+        ids.discard(book.id)
+        if not ids:
+            del self.authors[author]
+            del self.author_keys[bisect_left(self.author_keys, author)]
+
+        for word in words(book.title) | words(author):
+            ids = self.words[word]
+            ids.discard(book.id)
+            if not ids:
+                del self.words[word]
+                for gram in ngrams(word):
+                    grams = self.word_grams[gram]
+                    grams.discard(word)
+                    if not grams:
+                        del self.word_grams[gram]
+
+    def set_status(self, book: Book, status: str) -> None:
+
+        """
+        Change the status of an indexed book and move it to the bitmap of the new status.
+
+        :param book: The book.
+        :param status: The new status.
+        """
+
+        position = self.order[book.id]
+        self.mark(book.status, position, False)
+        book.status = status
+        self.mark(status, position, True)
+
+    def mark(self, status: str, position: int, value: bool) -> None:
+
+        """
+        Set or clear the bit of a position in the bitmap of a status.
+
+        :param status: The status.
+        :param position: Position of the book.
+        :param value: True to set the bit, False to clear it.
+        """
+
+        bitmap = self.statuses.setdefault(status, bytearray())
+        byte = position >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(max(byte + 1 - len(bitmap), len(bitmap))))  # Grow geometrically
+        if value:
+            bitmap[byte] |= 1 << (position & 7)
+        else:
+            bitmap[byte] &= ~(1 << (position & 7)) & 0xFF
+
+    def candidates(self, query: str) -> set[int]:
+
+        """
+        Collect the IDs of the books that may contain the query in their title or author.
+
+        :param query: The lowercased search query.
+        :return: A superset of the IDs of the matching books.
+        """
+
+        if not query:
+            return set(self.order)
+
+        if len(query) < NGRAM_SIZE:
+            # The number of distinct n-grams does not depend on the size of the library
+            ids = set(self.short)
+            for gram, gram_ids in self.postings.items():
+                if query in gram:
+                    ids |= gram_ids
+            return ids
+
+        postings = []
+        for gram in ngrams(query):
+            gram_ids = self.postings.get(gram)
+            if gram_ids is None:
+                return set()
+            postings.append(gram_ids)
+
+        postings.sort(key=len)
+        ids = set(postings[0])
+        for gram_ids in postings[1:]:
+            ids &= gram_ids
+            if not ids:
+                break
+        return ids
+
+    def search(self, query: str) -> list[Book]:
+
+        """
+        Find books by title, author, or publication year.
+
+        The result is the same as of the linear search: the query is a case-insensitive
+        substring of the title or the author, or equals the year.
+
+        :param query: The search query for title, author, or year.
+        :return: A list of found books in the order they were added.
+        """
+
+        lowered = query.lower()
+        ids = {book_id for book_id in self.candidates(lowered)
+               if lowered in self.books[book_id].title.lower() or
+               lowered in self.books[book_id].author.lower()}
+        ids |= self.years.get(query, set())
+
+        return [self.books[book_id] for book_id in sorted(ids, key=self.order.__getitem__)]
+
+    def with_status(self, status: str) -> set[int]:
+
+        """
+        Decode the bitmap of a status into the IDs of the books.
+
+        :param status: The status.
+        :return: The IDs of the books with the status.
+        """
+
+        ids = set()
+        for byte_position, byte in enumerate(self.statuses.get(status, b'')):
+            while byte:
+                low = byte & -byte
+                ids.add(self.positions[byte_position * 8 + low.bit_length() - 1])
+                byte ^= low
+        return ids
+
+    def count_status(self, status: str) -> int:
+        return int.from_bytes(self.statuses.get(status, b''), 'little').bit_count()
+
+    def in_years(self, year_from: int | None, year_to: int | None) -> list[set[int]]:
+
+        """
+        Take the IDs of the books published in a range of years.
+
+        :param year_from: The first year of the range, unbounded if None.
+        :param year_to: The last year of the range, unbounded if None.
+        :return: The sets of IDs of every year in the range.
+        """
+
+        start = 0 if year_from is None else bisect_left(self.year_keys, year_from)
+        end = len(self.year_keys) if year_to is None else bisect_right(self.year_keys, year_to)
+        return [self.years[str(year)] for year in self.year_keys[start:end]]
+
+    def by_author_prefix(self, prefix: str) -> list[set[int]]:
+
+        """
+        Take the IDs of the books whose lowercased author starts with a prefix.
+
+        :param prefix: The lowercased prefix.
+        :return: The sets of IDs of every matching author.
+        """
+
+        found = []
+        for author in self.author_keys[bisect_left(self.author_keys, prefix):]:
+            if not author.startswith(prefix):
+                break
+            found.append(self.authors[author])
+        return found
+
+    def query(self, status: str | None = None, year_from: int | None = None, year_to: int | None = None,
+              author: str | None = None, author_prefix: str | None = None, title: str | None = None) -> list[Book]:
+
+        """
+        Find books matching all given filters.
+
+        The planner estimates how many books every filter selects using its index, takes the
+        IDs from the most selective one and checks the other filters on those books only.
+
+        :param status: The status of the books.
+        :param year_from: The first publication year, inclusive.
+        :param year_to: The last publication year, inclusive.
+        :param author: The author of the books, case-insensitive.
+        :param author_prefix: The beginning of the author of the books, case-insensitive.
+        :param title: A case-insensitive substring of the title.
+        :return: A list of found books in the order they were added.
+        """
+
+        plans: list[tuple[int, Callable[[], set[int]], Callable[[Book], bool]]] = []  # Estimate, IDs, check
+        if status is not None:
+            plans.append((self.count_status(status), lambda: self.with_status(status),
+                          lambda book: book.status == status))
+        if year_from is not None or year_to is not None:
+            years = self.in_years(year_from, year_to)
+            plans.append((sum(map(len, years)), lambda: set().union(*years),
+                          lambda book: (year_from is None or book.year >= year_from) and
+                                       (year_to is None or book.year <= year_to)))
+        if author is not None:
+            lowered_author = author.lower()
+            ids = self.authors.get(lowered_author, set())
+            plans.append((len(ids), lambda: set(ids), lambda book: book.author.lower() == lowered_author))
+        if author_prefix is not None:
+            lowered_prefix = author_prefix.lower()
+            authors = self.by_author_prefix(lowered_prefix)
+            plans.append((sum(map(len, authors)), lambda: set().union(*authors),
+                          lambda book: book.author.lower().startswith(lowered_prefix)))
+        if title is not None:
+            lowered_title = title.lower()
+            candidates = self.candidates(lowered_title)  # Also the books with the query in the author
+
+            def in_title(book: Book) -> bool:
+                return lowered_title in book.title.lower()
+
+            plans.append((len(candidates), lambda: {book_id for book_id in candidates if in_title(self.books[book_id])},
+                          in_title))
+
+        if not plans:
+            return [self.books[book_id] for book_id in sorted(self.order, key=self.order.__getitem__)]
+
+        plans.sort(key=lambda plan: plan[0])
+        checks = [check for _, _, check in plans[1:]]
+        found = [book_id for book_id in plans[0][1]()
+                 if all(check(self.books[book_id]) for check in checks)]
+        return [self.books[book_id] for book_id in sorted(found, key=self.order.__getitem__)]
+
+    def similar_words(self, word: str, max_edits: int) -> dict[str, int]:
+
+        """
+        Find the words of the indexed books within a number of typos from a word.
+
+        One edit changes at most NGRAM_SIZE n-grams, so a similar word shares at least the given
+        number of the n-grams of the word. A short word may share none, then it is split into
+        max_edits + 1 parts, one of which a similar word contains without typos.
+
+        :param word: The lowercased word.
+        :param max_edits: Largest number of typos.
+        :return: The number of typos of every similar word.
+        """
+
+        grams = ngrams(word)
+        needed = len(grams) - max_edits * NGRAM_SIZE  # Shared n-grams of every similar word
+        if needed > 0:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.word_grams.get(gram, ()))
+            candidates = [candidate for candidate, count in shared.items() if count >= needed]
+        else:
+            step = len(word) / (max_edits + 1)
+            parts = [word[round(part * step):round((part + 1) * step)] for part in range(max_edits + 1)]
+            candidates = {candidate for gram, gram_words in self.word_grams.items()
+                          if any(part in gram for part in parts) for candidate in gram_words}
+
+        similar = {}
+        for candidate in candidates:
+            edits = edit_distance(word, candidate, max_edits)
+            if edits <= max_edits:
+                similar[candidate] = edits
+        return similar
+
+    def fuzzy_search(self, query: str, limit: int = FUZZY_LIMIT, max_edits: int | None = None) -> list[Book]:
+
+        """
+        Find books with the words of the query in the title or the author, allowing typos.
+
+        Every word of the query is looked up among the distinct words of the indexed books with
+        the n-gram index of the words, so the edit distance is computed only for a few words
+        and never for every book. A book matches if it has a similar word for every word of the
+        query, and its rank is the total number of typos.
+
+        :param query: The search query with possible typos.
+        :param limit: Maximum number of books to return.
+        :param max_edits: Largest number of typos in a word, a quarter of the length of the word if not set.
+            Words shorter than an n-gram must match exactly.
+        :return: A list of found books, the most similar first, books added earlier first among equal ones.
+        """
+
+        typos: dict[int, int] | None = None  # Total number of typos of every matching book
+        for word in sorted(words(query), key=len, reverse=True):
+            if len(word) < NGRAM_SIZE:
+                similar = {word: 0} if word in self.words else {}
+            else:
+                similar = self.similar_words(word, max(1, len(word) // 4) if max_edits is None else max_edits)
+
+            word_typos: dict[int, int] = {}
+            for similar_word, edits in sorted(similar.items(), key=lambda item: item[1], reverse=True):
+                ids = self.words[similar_word]
+                if typos is not None:
+                    ids = ids & typos.keys()
+                word_typos.update(dict.fromkeys(ids, edits))  # The closest words are written last
+            typos = word_typos if typos is None else {book_id: typos[book_id] + edits
+                                                      for book_id, edits in word_typos.items()}
+            if not typos:
+                return []
+
+        if typos is None:
+            return []
+        best = heapq.nsmallest(limit, typos, key=lambda book_id: (typos[book_id], self.order[book_id]))
+        return [self.books[book_id] for book_id in best]
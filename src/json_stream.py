@@ -0,0 +1,79 @@
+import json
+from typing import Iterator, TextIO
+
+CHUNK_SIZE = 1 << 16  # Number of characters read from the file at once
+WHITESPACE = ' \t\n\r'  # Characters allowed between JSON tokens
+
+
+def iter_json_array(file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator:
+
+    """
+    Parse a top-level JSON array one element at a time.
+
+    Only a chunk of the file and the current element are held in memory, so the first
+    elements are available long before the whole file is read.
+
+    :param file: A text file containing a JSON array.
+    :param chunk_size: Number of characters read from the file at once.
+    :return: An iterator over the decoded elements of the array.
+    :raises json.JSONDecodeError: If the file is not a valid JSON array.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, eof
+        if eof:
+            return False
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk  # Drop the parsed part of the buffer
+        position = 0
+        return True
+
+    def next_token() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ''
+
+    if next_token() != '[':
+        raise json.JSONDecodeError('Expecting JSON array', buffer, position)
+    position += 1
+
+    if next_token() == ']':
+        position += 1
+    else:
+        while True:
+            next_token()
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if read_more():
+                        continue
+                    raise
+                if (end == len(buffer) or buffer[end] not in ',]' + WHITESPACE) and read_more():
+                    continue  # A number may continue in the next chunk
+                break
+            position = end
+            yield element
+
+            token = next_token()
+            position += 1
+            if token == ']':
+                break
+            if token != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position - 1)
+
+    if next_token() != '':
+        raise json.JSONDecodeError('Extra data', buffer, position)
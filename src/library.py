@@ -1,6 +1,145 @@
-from book import Book
-import os
+from book import Book, STATUS_AVAILABLE, STATUSES
+from book_store import BookStore
+from cache import CACHE_SIZE, QueryCache
+from circulation import Circulation
+from index import FUZZY_LIMIT, BookIndex
+from metrics import Metrics
+from parallel import ParallelScanner, matches_query
+from rwlock import RWLock
+from storage import BufferedStorage, JsonStorage, Storage
+from typing import Callable, Iterable, Iterator
+import functools
+import itertools
 import json
+import os
+import threading
+import time
+
+BATCH_SIZE = 10000  # Number of books validated and added at once by the bulk import
+EXPORT_FORMATS = ('json', 'jsonl', 'csv')  # Formats of the files written by export
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of the changes in the write-behind mode
+FLUSH_THRESHOLD = 1000  # Number of changes that start a flush before the interval in the write-behind mode
+NO_MORE_BOOKS = "Больше книг нет."  # Answer for a page after the last one
+NOT_FOUND = "Книги не найдены."  # Answer of find_books when no book matches the query
+
+
+def iter_table(caption: str, books: Iterator[Book], offset: int = 0, limit: int | None = None) -> Iterator[str]:
+
+    """
+    Render a page of books as a table line by line.
+
+    Every page has the same title and header, the rows are numbered through all pages.
+
+    :param caption: The first line of the table.
+    :param books: The books to render.
+    :param offset: Number of books to skip.
+    :param limit: Maximum number of books on the page, all remaining books if None.
+    :return: An iterator over the lines of the table, empty if there are no books on the page.
+    """
+
+    page = itertools.islice(books, offset, None if limit is None else offset + limit)
+    for index, book in enumerate(page, start=offset + 1):
+        if index == offset + 1:
+            yield caption
+            yield "-" * 90 + "\n"
+            yield f"{'№':<5} {'ID':<10} {'Название':<30} {'Автор':<25} {'Год':<5} {'Статус':<10}\n"
+            yield "-" * 90 + "\n"
+
+        title = (book.title[:27] + '...') if len(book.title) > 30 else book.title
+        author = (book.author[:22] + '...') if len(book.author) > 25 else book.author
+        yield (
+            f"{index:<5} {book.id:<10} {title:<30} "
+            f"{author:<25} {book.year:<5} {book.status:<10}\n"
+        )
+
+
+def validate_title(title: str) -> str | None:
+
+    """
+    Check the title of a book.
+
+    :param title: The stripped title.
+    :return: An error message or None if the title is valid.
+    """
+
+    return "Название книги не может быть пустым!" if not title else None
+
+
+def validate_author(author: str) -> str | None:
+
+    """
+    Check the author of a book.
+
+    :param author: The stripped author.
+    :return: An error message or None if the author is valid.
+    """
+
+    return "Автор книги не может быть пустым!" if not author else None
+
+
+def validate_year(year: str) -> str | None:
+
+    """
+    Check the publication year of a book.
+
+    :param year: The stripped year as it was entered.
+    :return: An error message or None if the year is valid.
+    """
+
+    if not year:
+        return "Год издания не может быть пустым!"
+    if not year.isdigit():
+        return "Год издания должен быть числом!"
+    if not 1000 <= int(year) <= 2024:
+        return "Год издания должен быть больше или равно 1000 и меньше или равно 2024!"
+    return None
+
+
+def reading(method: Callable) -> Callable:
+
+    """
+    Run a method of Library under the read lock if the library is thread-safe.
+    """
+
+    @functools.wraps(method)
+    def locked(self: 'Library', *args, **kwargs):
+        if self.lock is None:
+            return method(self, *args, **kwargs)
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+
+    return locked
+
+
+def measured(method: Callable) -> Callable:
+
+    """
+    Count the calls and the latency of a method of Library if the metrics of the library are enabled.
+    """
+
+    @functools.wraps(method)
+    def run(self: 'Library', *args, **kwargs):
+        if self.metrics is None:
+            return method(self, *args, **kwargs)
+        return self.metrics.run(method.__name__, method, self, *args, **kwargs)
+
+    return run
+
+
+def writing(method: Callable) -> Callable:
+
+    """
+    Run a method of Library under the write lock if the library is thread-safe.
+    """
+
+    @functools.wraps(method)
+    def locked(self: 'Library', *args, **kwargs):
+        if self.lock is None:
+            return method(self, *args, **kwargs)
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+
+    return locked
 
 
 def context_menu_print(**kwargs) -> None:
@@ -20,38 +159,475 @@ def context_menu_print(**kwargs) -> None:
 
 
 class Library:
-    def __init__(self, file_name: str):
+    def __init__(self, file_name: str, journal: bool = False, compact_threshold: int = 1000, compact: bool = False,
+                 lazy: bool = False, storage: Storage | None = None, write_behind: bool = False,
+                 flush_interval: float = FLUSH_INTERVAL, flush_threshold: int = FLUSH_THRESHOLD,
+                 thread_safe: bool = False, cache_size: int = CACHE_SIZE, metrics: bool = False, workers: int = 0,
+                 background: bool = False, circulation: bool = False, differential: bool = False):
 
         """
         Initialize the book library with a given file name.
 
         :param file_name: The name of the file to store the books in JSON format.
+        :param journal: If True, every change is appended to a journal file instead of rewriting the JSON file.
+        :param compact_threshold: Number of journal records after which the journal is compacted into the JSON file.
+        :param compact: If True, books are kept in a columnar BookStore that uses much less memory.
+        :param lazy: If True, books are read from the file only when they are needed.
+        :param storage: Where the books are kept, the JSON file with the given name if not set.
+        :param write_behind: If True, changes are persisted by a background thread in batches.
+        :param flush_interval: Seconds between flushes of the changes in the write-behind mode.
+        :param flush_threshold: Number of changes that start a flush before the interval in the write-behind mode.
+        :param thread_safe: If True, the library may be shared between threads: lookups, searches and pages
+            run in parallel, changes run one at a time.
+        :param cache_size: Number of search queries whose results are cached, 0 to disable the cache.
+        :param metrics: If True, the operations are counted and timed, see stats.
+        :param workers: Number of worker processes of scan, 0 or 1 to scan in the current process.
+        :param background: If True, the books are loaded by a background thread and the library is returned
+            at once. Operations that need the books wait until they are loaded, new_book does not if the
+            storage has a header with the next ID and no changes to replay.
+        :param circulation: If True, checkouts and returns are appended to a log and the available and
+            issued books are counted as they change, see circulation_stats.
+        :param differential: If True, without the journal a save writes only the changed parts of the JSON
+            file instead of replacing it atomically, see JsonStorage. Not used in the write-behind mode,
+            whose flushes always replace the file.
         """
 
         self.file_name: str = file_name  # Name of the file to store books
-        self.books: list[Book] = []  # List to hold Book objects
-        self.load_books()  # Load books from the file
+        # Storage of the books, the JSON file by default
+        self.storage: Storage = storage if storage is not None else JsonStorage(
+            file_name, journal, compact_threshold, differential and not write_behind)
+        self.flush_threshold: int = flush_threshold  # Changes that start a flush in the write-behind mode
+        self.flush_lock: threading.Lock = threading.Lock()  # Guards the books while the flusher copies them
+        self.persist_lock: threading.Lock = threading.Lock()  # Lets only one flush write at a time
+        self.flush_event: threading.Event = threading.Event()  # Wakes the flusher up before the interval
+        self.flusher: threading.Thread | None = None  # Background thread persisting the changes
+        self.lock: RWLock | None = RWLock() if thread_safe else None  # Lock between the reads and the changes
+        self.load_lock: threading.Lock = threading.Lock()  # Lets only one reader read more books from the file
+        if write_behind:
+            self.storage = BufferedStorage(self.storage)
+            self.flusher = threading.Thread(target=self.flush_periodically, args=(flush_interval,), daemon=True)
+        self.books: dict[int, Book] | BookStore = BookStore() if compact else {}  # Books by their IDs in the order they were added
+        self.next_id: int = 1  # ID given to the next added book, never decreases
+        self.index: BookIndex | None = None  # Inverted index for searching books, built by the first search
+        self.index_lock: threading.Lock = threading.Lock()  # Lets only one reader build the index
+        self.cache: QueryCache | None = QueryCache(cache_size) if cache_size else None  # Cached search results
+        self.metrics: Metrics | None = Metrics() if metrics else None  # Counters and latencies of the operations
+        # Counters of the available and issued books and the log of checkouts and returns
+        self.circulation: Circulation | None = Circulation(file_name) if circulation else None
+        self.workers: int = workers  # Number of worker processes of scan
+        self.scanner: ParallelScanner | None = None  # Shards of the books in the worker processes, started by scan
+        self.lazy: bool = lazy  # Read books from the file only when they are needed
+        self.pending: Iterator[Book] | None = None  # Books not read from the file yet
+        self.loading: list[Book] = []  # Books read so far while the file is read lazily
+        self.changed_ids: set[int] = set()  # Books changed in the storage before they were read
+        self.ready: threading.Event = threading.Event()  # Set when the books are loaded
+        self.loader: threading.Thread | None = None  # Background thread loading the books
+        self.load_error: BaseException | None = None  # Why the background load failed, nothing is saved then
+        self.header: dict[str, int] = {}  # Number of books, largest and next ID saved with the books
+        self.reserved_id: int | None = None  # ID of the next book added before the background load finished
+        self.early_books: list[Book] = []  # Books added before the background load finished
+        self.early_lock: threading.Lock = threading.Lock()  # Guards the books added before the load finished
+        if background:
+            self.header = self.storage.read_header()
+            if not self.storage.has_changes():
+                self.reserved_id = self.header.get('next_id')  # The header is up to date
+            self.loader = threading.Thread(target=self.load_in_background)
+            self.loader.start()
+        else:
+            self.ready.set()  # Nobody else can use the library before it is loaded here
+            self.load_books()  # Load books from the file
+        if self.flusher is not None:
+            self.flusher.start()
 
+    @measured
     def load_books(self) -> None:
 
         """
-        Load books from a JSON file.
+        Load books from the storage.
 
-        This function attempts to read the book data from the specified JSON file.
+        This function attempts to read the book data from the storage, by default the specified JSON file.
         If the file does not exist or is not a valid JSON, a new file will be created.
+        The books are read one at a time. In the lazy mode only the storage is opened here,
+        and the books are read when they are needed.
         """
 
-        file_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.file_name = os.path.join(file_path, self.file_name)
-        if os.path.exists(file_path):
-            try:
-                with open(self.file_name, 'r', encoding='utf-8') as file:
-                    self.books = [Book(**book) for book in json.load(file)]
-                    print('Файл с книгами найден и успешно загружен!')
-            except (json.JSONDecodeError, FileNotFoundError):
-                print('Файл не является форматом JSON. Новый файл с книгами будет создан в формате JSON!')
+        self.next_id = max(self.next_id, self.storage.read_next_id())
+        self.pending = self.storage.read_books()
+        self.loading = []
+        if not self.lazy or self.storage.has_changes():
+            self.ensure_loaded()
+
+        for record in self.storage.read_changes():
+            self.apply_record(record)
+        if self.circulation is not None:
+            self.circulation.replay()
+
+    def load_in_background(self) -> None:
+
+        """
+        Load the books in the background thread, then add the books added in the meantime.
+
+        The IDs of these books were reserved from the header, which may be stale if the file was
+        changed by another program. A book whose ID turns out to be taken gets the next free ID.
+        If the load fails, the error is kept and raised by wait_ready, and the books loaded so far
+        are never saved over the file.
+        """
+
+        try:
+            self.load_books()
+        except BaseException as error:
+            self.load_error = error
+        finally:
+            with self.early_lock:  # No more books are added early once ready is set
+                try:
+                    if self.load_error is not None:
+                        self.early_books = []
+                        return
+                    records = []
+                    for book in self.early_books:
+                        if book.id < self.next_id:  # The header was stale, the ID is taken by a loaded book
+                            book.id = self.next_id
+                        self.put_book(book)
+                        records.append({'op': 'add', 'book': book.to_dict()})
+                    self.early_books = []
+                    if records and self.storage.commit_many(records):
+                        self.storage.save(self.books.values(), self.next_id)  # Not save_books, readers hold the lock
+                        self.count_saved()
+                finally:
+                    self.ready.set()
+
+    def wait_ready(self) -> None:
+
+        """
+        Wait until the books are loaded in the background, it returns at once if they are.
+
+        :raises BaseException: The error of the background load if it failed.
+        """
+
+        if not self.ready.is_set() and threading.current_thread() is not self.loader:
+            self.ready.wait()
+        if self.load_error is not None:
+            raise self.load_error
+
+    def load_more(self, count: int) -> bool:
+
+        """
+        Read more books from the file in the lazy mode.
+
+        :param count: Maximum number of books to read.
+        :return: True if there may be more books in the file, False if all books are read.
+        """
+
+        with self.load_lock:
+            if self.pending is None:
+                return False
+            for _ in range(count):
+                book = next(self.pending, None)
+                if book is None:
+                    self.pending = None
+                    self.loading = []
+                    self.changed_ids.clear()
+                    return False
+                if book.id in self.changed_ids:  # It may have been read by the storage before it was changed
+                    self.changed_ids.discard(book.id)
+                    book = self.storage.lookup(book.id)
+                    if book is None:
+                        continue
+                self.put_book(book)
+                self.loading.append(book)
+            return True
+
+    def changes_in_storage(self) -> bool:
+
+        """
+        Check if the changes of the books not read yet go straight to the storage.
+
+        It is so while the books are read lazily from a storage that finds single books itself and
+        whose reading sees the changes made in the meantime, a database. Such a book is changed in
+        a single row and read with its changes later, so the other books are not read for the change.
+
+        :return: True if a change of a book that is not read yet is only committed to the storage.
+        """
+
+        return self.pending is not None and self.storage.can_lookup and self.storage.live_reads
+
+    def ensure_loaded(self) -> None:
+
+        """
+        Read all remaining books from the file.
+
+        It is called before every operation that needs all books, such as a search or a change.
+        Readers of a thread-safe library may call it at the same time, the books are read by one of them.
+        """
+
+        self.wait_ready()
+        while self.load_more(1 << 16):
+            pass
+
+    def ensure_index(self) -> BookIndex:
+
+        """
+        Build the index of the books on the first search that needs it.
+
+        The library is loaded, searched and changed without the index until then, so the modes that
+        never search, such as the batch mode or the compact and lazy modes, do not pay for it.
+        Once built, it is kept up to date by every change.
+
+        :return: The index of all books.
+        """
+
+        self.ensure_loaded()
+        with self.index_lock:
+            if self.index is None:
+                index = BookIndex(self.books)
+                for book in self.books.values():
+                    index.add(book)
+                self.index = index
+        return self.index
+
+    def iter_books(self) -> Iterator[Book]:
+
+        """
+        Iterate over all books, reading them from the file only as far as the iteration goes.
+
+        The iterator is not protected by the lock of a thread-safe library, take pages with
+        display_books or iter_display_books instead.
+
+        :return: An iterator over the books in the order they were added.
+        """
+
+        self.wait_ready()
+        position = 0
+        while self.pending is not None:
+            if position == len(self.loading) and not self.load_more(1 << 10):
+                break
+            if position < len(self.loading):
+                yield self.loading[position]
+                position += 1
+        yield from itertools.islice(self.books.values(), position, None)
+
+    def put_book(self, book: Book) -> None:
+
+        """
+        Put a book into the library by its ID, replacing a book with the same ID in place.
+
+        :param book: The book to put.
+        """
+
+        old = self.books.get(book.id)
+        if old is None:
+            with self.flush_lock:
+                self.books[book.id] = book
+            if self.index is not None:
+                self.index.add(book)
         else:
-            print('Файл не найден. Новый файл с книгами будет создан в формате JSON!')
+            if self.index is not None:
+                self.index.unlink(old)  # Read the old fields before a BookStore slot is overwritten
+            if self.circulation is not None:
+                self.circulation.book_removed(old)
+            with self.flush_lock:
+                self.books[book.id] = book
+            if self.index is not None:
+                self.index.link(book)
+            if self.cache is not None:
+                self.cache.book_removed(book.id)
+        if self.cache is not None:
+            self.cache.book_added(book)
+        if self.circulation is not None:
+            self.circulation.book_added(book)
+        if self.scanner is not None:
+            self.scanner.put(Book(**book.to_dict()))
+        self.next_id = max(self.next_id, book.id + 1)
+
+    def drop_book(self, book_id: int) -> Book | None:
+
+        """
+        Take a book out of the library and its index.
+
+        :param book_id: The ID of the book.
+        :return: The removed book or None if there is no book with such ID.
+        """
+
+        with self.flush_lock:
+            book = self.books.pop(book_id, None)
+        if book is not None:
+            if self.index is not None:
+                self.index.remove(book)
+            if self.cache is not None:
+                self.cache.book_removed(book_id)
+            if self.circulation is not None:
+                self.circulation.book_removed(book)
+            if self.scanner is not None:
+                self.scanner.remove(book_id)
+        return book
+
+    @measured
+    @reading
+    def get_book(self, book_id: int) -> Book | None:
+
+        """
+        Get a book by its ID.
+
+        :param book_id: The ID of the book.
+        :return: The book or None if there is no book with such ID.
+        """
+
+        self.wait_ready()
+        if self.pending is not None and self.storage.can_lookup:
+            return self.storage.lookup(book_id)  # Only the book itself is read from the storage
+        self.ensure_loaded()
+        return self.books.get(book_id)
+
+    def change_book_status(self, book: Book, status: str) -> None:
+
+        """
+        Change the status of a book in the library, its index and the cached search results.
+
+        :param book: The book.
+        :param status: The new status.
+        """
+
+        old = book.status
+        with self.flush_lock:
+            if self.index is not None:
+                self.index.set_status(book, status)
+            else:
+                book.status = status
+        if self.cache is not None:
+            self.cache.book_changed(book.id)
+        if self.circulation is not None:
+            self.circulation.status_changed(book, old, status)
+        if self.scanner is not None:
+            self.scanner.set_status(book.id, status)
+
+    def apply_record(self, record: dict) -> None:
+
+        """
+        Apply a single journal record to the list of books.
+
+        :param record: A journal record with the operation name in the 'op' key.
+        """
+
+        match record.get('op'):
+            case 'add':
+                self.put_book(Book(**record['book']))
+            case 'remove':
+                self.drop_book(record['id'])
+            case 'status':
+                book = self.books.get(record['id'])
+                if book is not None:
+                    self.change_book_status(book, record['status'])
+
+    def commit(self, record: dict) -> None:
+
+        """
+        Persist a single change of the library.
+
+        The storage decides how: the JSON file is rewritten as a whole or, with the journal,
+        the change is appended to the journal file, and a database changes only one row.
+
+        :param record: A journal record describing the change.
+        """
+
+        self.commit_many([record])
+
+    def commit_many(self, records: list[dict]) -> None:
+
+        """
+        Persist many changes of the library at once.
+
+        In the write-behind mode the changes are only collected, and the flusher is woken up
+        when enough of them are waiting.
+
+        :param records: Journal records describing the changes.
+        :raises BaseException: The error of the background load if it failed, only some books are loaded then.
+        """
+
+        if self.load_error is not None:
+            raise self.load_error
+        if self.storage.commit_many(records):
+            self.save_books()
+        elif isinstance(self.storage, BufferedStorage) and len(self.storage.records) >= self.flush_threshold:
+            self.flush_event.set()
+
+    def flush(self) -> int:
+
+        """
+        Persist all changes collected in the write-behind mode.
+
+        It is a durability point: when it returns, every change made before it is on the disk.
+
+        :return: Number of persisted changes.
+        """
+
+        if not isinstance(self.storage, BufferedStorage):
+            return 0
+        with self.persist_lock:
+            with self.flush_lock:
+                records = self.storage.take()
+            if records and self.storage.storage.commit_many(records):
+                with self.flush_lock:
+                    books = list(self.books.values())
+                    if isinstance(self.books, BookStore):
+                        books = [Book(**book.to_dict()) for book in books]  # Views may move when slots are reclaimed
+                self.storage.storage.save(books, self.next_id)
+                self.count_saved()
+        return len(records)
+
+    def count_saved(self) -> None:
+
+        """
+        Count a save of the books and the number of written bytes in the metrics.
+        """
+
+        if self.metrics is None:
+            return
+        storage = getattr(self.storage, 'storage', self.storage)
+        self.metrics.count('saves')
+        if isinstance(storage, JsonStorage) and storage.differential:
+            self.metrics.count('bytes_written', storage.last_written)  # Only the changed parts may be written
+        elif os.path.exists(storage.file_name):
+            self.metrics.count('bytes_written', os.path.getsize(storage.file_name))
+
+    def flush_periodically(self, interval: float) -> None:
+
+        """
+        Flush the changes every interval or when enough of them are waiting, until the library is closed.
+
+        :param interval: Seconds between flushes.
+        """
+
+        while self.flusher is not None:
+            self.flush_event.wait(interval)
+            self.flush_event.clear()
+            self.flush()
+
+    def close(self) -> None:
+
+        """
+        Stop the flusher of the write-behind mode and the worker processes of scan, and persist the remaining changes.
+
+        In the background mode it waits until the books are loaded first, and raises the error
+        of the load after stopping the flusher if it failed.
+        """
+
+        try:
+            self.wait_ready()
+        finally:
+            flusher, self.flusher = self.flusher, None
+            if flusher is not None:
+                self.flush_event.set()
+                flusher.join()
+            self.flush()
+            scanner, self.scanner = self.scanner, None
+            if scanner is not None:
+                scanner.close()
+
+    def __enter__(self) -> 'Library':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def add_book(self, **kwargs) -> str:
 
@@ -67,9 +643,8 @@ class Library:
         :return: A message indicating the result of the operation.
         """
 
-        book_id = int(self.books[len(self.books) - 1].to_dict()['id']) + 1 if len(self.books) != 0 else 1
         book = Book(
-            id=book_id,
+            id=0,  # The ID is given by new_book when the book is added
             title=kwargs.get('title').strip() if kwargs.get('title') is not None else '',
             author=kwargs.get('author').strip() if kwargs.get('author') is not None else '',
             year=kwargs.get('year').strip() if kwargs.get('year') is not None else ''
@@ -88,8 +663,9 @@ class Library:
                 if new_title == "0":
                     break
 
-                if not new_title:
-                    context_menu_print(context_error="Название книги не может быть пустым!")
+                error = validate_title(new_title)
+                if error:
+                    context_menu_print(context_error=error)
                     new_title = input("Введите название книги: ").strip()
                     continue
                 else:
@@ -120,8 +696,9 @@ class Library:
                     new_author = input("Введите автора книги: ").strip()
                     continue
 
-                if not new_author:
-                    context_menu_print(context_error="Автор книги не может быть пустым!", ver=0)
+                error = validate_author(new_author)
+                if error:
+                    context_menu_print(context_error=error, ver=0)
                     new_author = input("Введите автора книги: ").strip()
                     continue
                 else:
@@ -152,25 +729,14 @@ class Library:
                     new_year = input("Введите год издания: ").strip()
                     continue
 
-                if not new_year:
-                    context_menu_print(context_error="Год издания не может быть пустым!", ver=0)
-                    new_year = input("Введите год издания: ").strip()
-                    continue
-
-                if not new_year.isdigit():
-                    context_menu_print(context_error="Год издания должен быть числом!", ver=0)
+                error = validate_year(new_year)
+                if error:
+                    context_menu_print(context_error=error, ver=0)
                     new_year = input("Введите год издания: ").strip()
                     continue
 
-                year_value = int(new_year)
-                if 1000 <= year_value <= 2024:
-                    new_year = int(new_year)
-                    break
-                else:
-                    context_menu_print(context_error="Год издания должен быть больше или "
-                                                     "равно 1000 и меньше или равно 2024!", ver=0)
-                    new_year = input("Введите год издания: ").strip()
-                    continue
+                new_year = int(new_year)
+                break
 
             return new_year
 
@@ -193,20 +759,166 @@ class Library:
             if book.year == '0' or book.author == '0':
                 return ""
 
-            self.books.append(book)
-            self.save_books()
+            self.new_book(book.title, book.author, book.year)
             return "Книга успешно добавлена!"
 
+    @measured
+    @writing
     def save_books(self) -> None:
 
         """
-        Save the list of books to a JSON file.
+        Save the list of books to the storage.
+
+        This function writes the current list of books to the storage, by default the specified JSON file.
+        The next book ID is saved too, so IDs of removed books are not reused.
+        """
+
+        self.ensure_loaded()
+        self.storage.save(self.books.values(), self.next_id)
+        self.count_saved()
+
+    @measured
+    @writing
+    def new_book(self, title: str, author: str, year: str | int) -> Book:
+
+        """
+        Add a new book to the library without asking the user.
+
+        :param title: Title of the book.
+        :param author: Author of the book.
+        :param year: Publication year of the book.
+        While the books are loaded in the background, the book gets the next ID from the header of the
+        storage and is added and persisted as soon as the other books are loaded.
+
+        :return: The added book with the status 'в наличии'.
+        :raises ValueError: If the book is not valid, with the same message as in add_book.
+        """
+
+        title, author, year = str(title).strip(), str(author).strip(), str(year).strip()
+        error = validate_title(title) or validate_author(author) or validate_year(year)
+        if error:
+            raise ValueError(error)
+
+        if not self.ready.is_set():
+            with self.early_lock:
+                if not self.ready.is_set() and self.reserved_id is not None:
+                    book = Book(id=self.reserved_id, title=title, author=author, year=int(year))
+                    self.reserved_id += 1
+                    self.early_books.append(book)
+                    return book
+
+        self.wait_ready()
+        if self.changes_in_storage():
+            book = Book(id=self.next_id, title=title, author=author, year=int(year))
+            self.next_id += 1
+            self.commit({'op': 'add', 'book': book.to_dict()})  # Read after the other books, at the end
+            return book
+
+        self.ensure_loaded()
+        book = Book(id=self.next_id, title=title, author=author, year=int(year))
+        self.put_book(book)
+        self.commit({'op': 'add', 'book': book.to_dict()})
+        return book
+
+    @measured
+    @writing
+    def add_books(self, books: Iterable[dict], batch_size: int = BATCH_SIZE) -> str:
+
+        """
+        Add many books to the library without asking the user.
+
+        Every book is checked with the same rules as in add_book, invalid books are skipped.
+        The books are added in batches, and all of them are persisted once at the end.
+
+        :param books: Dictionaries with the title, author, year and optionally the status of the books.
+        :param batch_size: Number of books validated and added at once.
+        :return: A message with the number of added and skipped books and the ingestion rate.
+        """
+
+        self.ensure_loaded()
+        start = time.perf_counter()
+        records = []
+        skipped = 0
+        books = iter(books)
+        while batch := list(itertools.islice(books, batch_size)):
+            for data in batch:
+                title = str(data.get('title') or '').strip()
+                author = str(data.get('author') or '').strip()
+                year = str(data.get('year') or '').strip()
+                status = str(data.get('status') or STATUS_AVAILABLE).strip()
+                if validate_title(title) or validate_author(author) or validate_year(year) or status not in STATUSES:
+                    skipped += 1
+                    continue
+
+                book = Book(id=self.next_id, title=title, author=author, year=int(year), status=status)
+                self.put_book(book)
+                records.append({'op': 'add', 'book': book.to_dict()})
+
+        if records:
+            self.commit_many(records)
+
+        elapsed = time.perf_counter() - start
+        return (f"Добавлено книг: {len(records)}, пропущено: {skipped}, "
+                f"за {elapsed:.2f} с ({len(records) / elapsed if elapsed else 0:.0f} книг/с).")
+
+    def import_csv(self, file_name: str, batch_size: int = BATCH_SIZE) -> str:
+
+        """
+        Add books from a CSV file with the header title,author,year and optionally status.
+
+        :param file_name: Path of the CSV file.
+        :param batch_size: Number of books validated and added at once.
+        :return: A message with the result of add_books.
+        """
+
+        import csv  # Only here and in export, so that the library starts faster
+
+        with open(file_name, 'r', encoding='utf-8', newline='') as file:
+            return self.add_books(csv.DictReader(file), batch_size)
+
+    def import_jsonl(self, file_name: str, batch_size: int = BATCH_SIZE) -> str:
+
+        """
+        Add books from a JSON lines file with one book object on every line.
+
+        :param file_name: Path of the JSON lines file.
+        :param batch_size: Number of books validated and added at once.
+        :return: A message with the result of add_books.
+        """
+
+        with open(file_name, 'r', encoding='utf-8') as file:
+            return self.add_books((json.loads(line) for line in file if line.strip()), batch_size)
+
+    @measured
+    @reading
+    def export(self, file_name: str, file_format: str | None = None) -> str:
+
+        """
+        Write all books to a file.
 
-        This function writes the current list of books to the specified JSON file.
+        :param file_name: Path of the file.
+        :param file_format: 'json', 'jsonl' or 'csv', taken from the extension of the file if not set.
+        :return: A message with the number of exported books.
         """
 
-        with open(self.file_name, 'w', encoding='utf-8') as file:
-            json.dump([book.to_dict() for book in self.books], file, ensure_ascii=False, indent=4)
+        file_format = file_format or os.path.splitext(file_name)[1].lstrip('.').lower()
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {file_format!r}")
+
+        self.ensure_loaded()
+        with open(file_name, 'w', encoding='utf-8', newline='') as file:
+            match file_format:
+                case 'json':
+                    json.dump([book.to_dict() for book in self.books.values()], file, ensure_ascii=False, indent=4)
+                case 'jsonl':
+                    for book in self.books.values():
+                        file.write(json.dumps(book.to_dict(), ensure_ascii=False) + '\n')
+                case 'csv':
+                    import csv
+                    writer = csv.DictWriter(file, fieldnames=['id', 'title', 'author', 'year', 'status'])
+                    writer.writeheader()
+                    writer.writerows(book.to_dict() for book in self.books.values())
+        return f"Экспортировано книг: {len(self.books)}."
 
     def remove_book(self, book_id: str) -> str:
 
@@ -226,17 +938,286 @@ class Library:
                 book_id = input("Введите ID книги для удаления: ").strip()
                 continue
             if int(book_id) != 0:
-                for book in self.books:
-                    if book.id == int(book_id):
-                        self.books.remove(book)
-                        self.save_books()
-                        return "Книга успешно удалена!"
+                if self.delete_book(int(book_id)):
+                    return "Книга успешно удалена!"
                 context_menu_print(context_error="Книга с таким ID не найдена.")
                 book_id = input("Введите ID книги для удаления: ").strip()
             else:
                 return "0"
 
-    def find_books(self, query: str) -> str:
+    @measured
+    @writing
+    def delete_book(self, book_id: int) -> bool:
+
+        """
+        Remove a book from the library by its ID without asking the user.
+
+        :param book_id: The ID of the book to remove.
+        :return: True if the book was removed, False if there is no book with such ID.
+        """
+
+        self.wait_ready()
+        if self.changes_in_storage() and book_id not in self.books:
+            if self.storage.lookup(book_id) is None:
+                return False
+            self.changed_ids.add(book_id)
+            self.commit({'op': 'remove', 'id': book_id})
+            if self.cache is not None:
+                self.cache.book_removed(book_id)
+            return True
+
+        if not self.changes_in_storage():
+            self.ensure_loaded()
+        if self.drop_book(book_id) is None:
+            return False
+        self.commit({'op': 'remove', 'id': book_id})
+        return True
+
+    @measured
+    @writing
+    def set_status(self, book_id: int, status: str) -> bool:
+
+        """
+        Change the status of a book by its ID without asking the user.
+
+        With the circulation counters, a new status is also appended to the log as a checkout or a return.
+
+        :param book_id: The ID of the book.
+        :param status: The new status, 'в наличии' or 'выдана'.
+        :return: True if the status was changed, False if there is no book with such ID.
+        """
+
+        self.wait_ready()
+        if self.changes_in_storage() and book_id not in self.books:
+            book = self.storage.lookup(book_id)
+            if book is None:
+                return False
+            self.changed_ids.add(book_id)
+            self.commit({'op': 'status', 'id': book_id, 'status': status})
+            if self.cache is not None:
+                self.cache.book_changed(book_id)
+            if self.circulation is not None and status != book.status:
+                self.circulation.record(book, status)  # The counters of the state count it when it is read
+            return True
+
+        if not self.changes_in_storage():
+            self.ensure_loaded()
+        book = self.books.get(book_id)
+        if book is None:
+            return False
+        old = book.status
+        self.change_book_status(book, status)
+        self.commit({'op': 'status', 'id': book_id, 'status': status})
+        if self.circulation is not None and status != old:
+            self.circulation.record(book, status)
+        return True
+
+    def match_books(self, query: str) -> Iterator[Book]:
+
+        """
+        Iterate over the books matching a search query.
+
+        While the file is still being read in the lazy mode, the query is answered by the storage
+        if it can, or the books are checked one by one as they are read, so the first matches
+        are found without reading the whole file. Otherwise the index is used, and the IDs of
+        the found books are kept in the cache of the library.
+
+        :param query: The search query for title, author, or year.
+        :return: An iterator over the found books in the order they were added.
+        """
+
+        self.wait_ready()
+        if self.pending is None:
+            if self.metrics is not None:
+                self.metrics.count('searches_by_index')
+            if self.cache is None:
+                return iter(self.ensure_index().search(query))
+            ids = self.cache.get(query)
+            if ids is None:
+                found = self.ensure_index().search(query)
+                self.cache.put(query, [book.id for book in found])
+                return iter(found)
+            return iter([self.books[book_id] for book_id in ids])
+
+        found = self.storage.search(query)
+        if found is not None:
+            if self.metrics is not None:
+                self.metrics.count('searches_by_storage')
+            return found
+
+        if self.metrics is not None:
+            self.metrics.count('searches_by_scan')
+        lowered = query.lower()
+        return (book for book in self.iter_books()
+                if lowered in book.title.lower() or
+                lowered in book.author.lower() or
+                query == str(book.year))
+
+    @measured
+    @reading
+    def query(self, status: str | None = None, year_from: int | None = None, year_to: int | None = None,
+              author: str | None = None, author_prefix: str | None = None, title: str | None = None) -> list[Book]:
+
+        """
+        Find books matching all given filters, the filters that are not set match every book.
+
+        The filters are answered by the secondary indexes of the library starting with the most
+        selective one, so the books are not scanned one by one.
+
+        :param status: The status of the books, 'в наличии' or 'выдана'.
+        :param year_from: The first publication year, inclusive.
+        :param year_to: The last publication year, inclusive.
+        :param author: The author of the books, case-insensitive.
+        :param author_prefix: The beginning of the author of the books, case-insensitive.
+        :param title: A case-insensitive substring of the title.
+        :return: A list of found books in the order they were added.
+        """
+
+        return self.ensure_index().query(status, year_from, year_to, author, author_prefix, title)
+
+    @measured
+    @reading
+    def scan(self, predicate: Callable[..., bool], *args) -> list[Book]:
+
+        """
+        Check every book with a predicate, for the searches no index covers.
+
+        With several workers the books are split between worker processes that keep them
+        between the scans and receive the changes, and the shards are checked at the same time.
+
+        :param predicate: A function of the book and the arguments. With several workers it must be
+            defined at the top level of a module, so that it can be sent to the processes.
+        :param args: Further arguments of the predicate.
+        :return: A list of the matching books in the order they were added.
+        """
+
+        self.ensure_loaded()
+        if self.workers <= 1:
+            return [book for book in self.books.values() if predicate(book, *args)]
+        with self.load_lock:  # Readers of a thread-safe library start the processes once
+            if self.scanner is None:
+                books = self.books.values()
+                if isinstance(self.books, BookStore):
+                    books = (Book(**book.to_dict()) for book in books)
+                self.scanner = ParallelScanner(books, self.workers)
+        return [self.books[book_id] for book_id in self.scanner.scan(predicate, *args)]
+
+    @measured
+    @reading
+    def columns(self, use_numpy: bool | None = None) -> 'ColumnTable':
+
+        """
+        Export the books into contiguous columns for the counts and groups of reports, see analytics.py.
+
+        The analytics module, and NumPy if it is installed, are imported only here.
+
+        :param use_numpy: Use NumPy, by default if it is installed.
+        :return: The columns, a copy that does not follow later changes of the library.
+        """
+
+        from analytics import ColumnTable
+
+        self.ensure_loaded()
+        return ColumnTable(self.books.values(), use_numpy)
+
+    def scan_books(self, query: str) -> list[Book]:
+
+        """
+        Find books by title, author, or publication year by checking every book, without the index.
+
+        :param query: The search query for title, author, or year.
+        :return: A list of found books in the order they were added.
+        """
+
+        return self.scan(matches_query, query, query.lower())
+
+    def stats(self) -> dict:
+
+        """
+        Collect the metrics of the library.
+
+        :return: Number of books, from the header while they are loaded in the background, the hits and
+            misses of the search cache, the circulation counters if they are enabled, and if the metrics are
+            enabled, the calls, latencies and histograms of the operations and the counters of the
+            saves, the written bytes and the searches answered by the index, the storage or a scan.
+        """
+
+        books = len(self.books) if self.ready.is_set() else self.header.get('count', len(self.books))
+        stats = {'books': books, 'metrics_enabled': self.metrics is not None}
+        if self.cache is not None:
+            lookups = self.cache.hits + self.cache.misses
+            stats['cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses,
+                              'hit_rate': self.cache.hits / lookups if lookups else 0.0}
+        if self.circulation is not None:
+            stats['circulation'] = self.circulation.snapshot()
+        if self.metrics is not None:
+            stats.update(self.metrics.snapshot())
+        return stats
+
+    @reading
+    def circulation_stats(self) -> dict:
+
+        """
+        Read the counters of the circulation without looking at the books.
+
+        :return: The available and issued books, the checkouts and returns, and the most borrowed authors.
+        :raises RuntimeError: If the library was opened without the circulation counters.
+        """
+
+        if self.circulation is None:
+            raise RuntimeError("The circulation counters are not enabled")
+        self.ensure_loaded()  # Books not read yet in the lazy mode are not counted
+        return self.circulation.snapshot()
+
+    @reading
+    def verify_circulation(self) -> list[str]:
+
+        """
+        Check the circulation counters against a full recount of the books and a replay of the log.
+
+        :return: Descriptions of the differences, empty if everything matches.
+        :raises RuntimeError: If the library was opened without the circulation counters.
+        """
+
+        if self.circulation is None:
+            raise RuntimeError("The circulation counters are not enabled")
+        self.ensure_loaded()
+        return self.circulation.verify(self.books.values())
+
+    def books_with_status(self, status: str) -> Iterator[Book]:
+
+        """
+        Iterate over the books with the given status.
+
+        :param status: The status of the books, 'в наличии' or 'выдана'.
+        :return: An iterator over the books in the order they were added.
+        """
+
+        self.wait_ready()
+        if self.pending is not None:
+            found = self.storage.with_status(status)
+            if found is not None:
+                return found
+        return (book for book in self.iter_books() if book.status == status)
+
+    @reading
+    def iter_find_books(self, query: str, offset: int = 0, limit: int | None = None) -> Iterator[str]:
+
+        """
+        Render a page of the books found by a search query line by line.
+
+        :param query: The search query for title, author, or year.
+        :param offset: Number of found books to skip.
+        :param limit: Maximum number of books on the page, all remaining books if None.
+        :return: An iterator over the lines of the table, empty if there are no books on the page.
+        """
+
+        lines = iter_table("Найденные книги:\n", self.match_books(query), offset, limit)
+        return lines if self.lock is None else iter(list(lines))  # Render the page while the lock is held
+
+    @measured
+    @reading
+    def find_books(self, query: str, offset: int = 0, limit: int | None = None) -> str:
 
         """
         Find books by title, author, or publication year.
@@ -244,61 +1225,85 @@ class Library:
         This function searches for books that match the given query and returns the results.
 
         :param query: The search query for title, author, or year.
+        :param offset: Number of found books to skip.
+        :param limit: Maximum number of books to return, all remaining books if None.
         :return: A string representation of the found books or a message if none are found.
         """
 
-        results = [book for book in self.books
-                   if query.lower() in book.title.lower() or
-                   query.lower() in book.author.lower() or
-                   query == str(book.year)]
-
-        results_print = ''
+        cached = self.pending is None and self.cache is not None
+        results = self.cache.get_page(query, offset, limit) if cached else None
+        if results is None:
+            results = ''.join(self.iter_find_books(query, offset, limit))
+            if cached:
+                self.cache.put_page(query, offset, limit, results)
         if results:
-            results_print = "Найденные книги:\n"
-            results_print += "-" * 90 + "\n"
-            results_print += f"{'№':<5} {'ID':<10} {'Название':<30} {'Автор':<25} {'Год':<5} {'Статус':<10}\n"
-            results_print += "-" * 90 + "\n"
-
-            for index, book in enumerate(results, start=1):
-                title = (book.title[:27] + '...') if len(book.title) > 30 else book.title
-                author = (book.author[:22] + '...') if len(book.author) > 25 else book.author
-
-                results_print += (
-                    f"{index:<5} {book.id:<10} {title:<30} "
-                    f"{author:<25} {book.year:<5} {book.status:<10}\n"
-                )
-            return results_print
-        else:
-            return "Книги не найдены."
+            return results
+        return NOT_FOUND if offset == 0 else NO_MORE_BOOKS
 
-    def display_books(self) -> str:
+    @reading
+    def iter_display_books(self, offset: int = 0, limit: int | None = None) -> Iterator[str]:
 
         """
-        Display all books in the library.
+        Render a page of all books in the library line by line.
 
-        This function returns a string representation of all books currently in the library.
+        :param offset: Number of books to skip.
+        :param limit: Maximum number of books on the page, all remaining books if None.
+        :return: An iterator over the lines of the table, empty if there are no books on the page.
+        """
 
-        :return: A string containing details of all books or a message if the library is empty.
+        lines = iter_table("Все книги в библиотеке:\n", self.iter_books(), offset, limit)
+        return lines if self.lock is None else iter(list(lines))  # Render the page while the lock is held
+
+    @measured
+    @reading
+    def fuzzy_search(self, query: str, limit: int = FUZZY_LIMIT) -> list[Book]:
+
+        """
+        Find books with the words of the query in the title or the author, allowing a few typos in every word.
+
+        :param query: The search query with possible typos.
+        :param limit: Maximum number of books to return.
+        :return: A list of found books, the most similar first.
         """
 
-        if not self.books:
-            return "Нет книг в библиотеке."
+        return self.ensure_index().fuzzy_search(query, limit)
 
-        result = "Все книги в библиотеке:\n"
-        result += "-" * 90 + "\n"  # Разделитель
-        result += f"{'№':<5} {'ID':<10} {'Название':<30} {'Автор':<25} {'Год':<5} {'Статус':<10}\n"
-        result += "-" * 90 + "\n"  # Заголовок разделитель
+    @reading
+    def find_similar_books(self, query: str, offset: int = 0, limit: int | None = None) -> str:
 
-        for index, book in enumerate(self.books, start=1):
-            title = (book.title[:27] + '...') if len(book.title) > 30 else book.title
-            author = (book.author[:22] + '...') if len(book.author) > 25 else book.author
+        """
+        Find books similar to a query with typos, for example when find_books found nothing.
 
-            result += (
-                f"{index:<5} {book.id:<10} {title:<30} "
-                f"{author:<25} {book.year:<5} {book.status:<10}\n"
-            )
+        :param query: The search query with possible typos.
+        :param offset: Number of found books to skip.
+        :param limit: Maximum number of books to return, FUZZY_LIMIT books in total if None.
+        :return: A string representation of the found books, the most similar first, or a message if none are found.
+        """
+
+        books = self.fuzzy_search(query, FUZZY_LIMIT if limit is None else offset + limit)
+        results = ''.join(iter_table("Похожие книги:\n", iter(books), offset, limit))
+        if results:
+            return results
+        return NOT_FOUND if offset == 0 else NO_MORE_BOOKS
+
+    @measured
+    @reading
+    def display_books(self, offset: int = 0, limit: int | None = None) -> str:
+
+        """
+        Display all books in the library.
+
+        This function returns a string representation of all books currently in the library.
+
+        :param offset: Number of books to skip.
+        :param limit: Maximum number of books to return, all remaining books if None.
+        :return: A string containing details of all books or a message if the library is empty.
+        """
 
-        return result
+        result = ''.join(self.iter_display_books(offset, limit))
+        if result:
+            return result
+        return "Нет книг в библиотеке." if offset == 0 else NO_MORE_BOOKS
 
     def change_status(self) -> str:
 
@@ -340,12 +1345,8 @@ class Library:
             print(new_status != "в наличии")
             print(new_status != "выдана")
             if new_status == "в наличии" or new_status == "выдана":
-                for book in self.books:
-                    if book.id == book_id:
-                        if new_status in ["в наличии", "выдана"]:
-                            book.status = new_status
-                            self.save_books()
-                            return "Статус успешно  изменён!"
+                if self.set_status(book_id, new_status):
+                    return "Статус успешно  изменён!"
                 return "Книга с таким ID не найдена."
             else:
                 context_menu_print(context_error="Статус может быть значением 'в наличии' или 'выдана'!", ver=0)
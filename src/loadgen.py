@@ -0,0 +1,119 @@
+from book import STATUSES
+import argparse
+import asyncio
+import json
+import random
+import time
+
+QUERIES = ['булгаков', 'гоголь', 'мастер', 'сердце', 'граф', '1925', 'дон', 'нет такой книги']  # Search queries
+
+
+def percentile(values: list[float], fraction: float) -> float:
+
+    """
+    Take a percentile of a list of values.
+
+    :param values: The sorted values.
+    :param fraction: The percentile as a fraction, for example 0.99.
+    :return: The value below which the given fraction of the values lies.
+    """
+
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_request(generator: random.Random, write_ratio: float, max_id: int) -> dict:
+
+    """
+    Make a random request, a read or a write.
+
+    :param generator: The random generator.
+    :param write_ratio: Fraction of the requests changing the library.
+    :param max_id: Largest ID used by the status changes.
+    :return: The request.
+    """
+
+    if generator.random() < write_ratio:
+        if generator.random() < 0.5:
+            return {'op': 'add', 'title': 'Нагрузочная книга', 'author': 'Генератор', 'year': 2000}
+        return {'op': 'status', 'id': generator.randint(1, max_id), 'status': generator.choice(STATUSES)}
+    if generator.random() < 0.8:
+        return {'op': 'find', 'query': generator.choice(QUERIES), 'limit': 20}
+    return {'op': 'display', 'offset': generator.randint(0, min(max_id, 1000)), 'limit': 20}
+
+
+async def run_client(host: str, port: int, requests: int, write_ratio: float, max_id: int, seed: int) -> list[float]:
+
+    """
+    Send requests one after another over one connection.
+
+    :return: Latency of every request in seconds.
+    """
+
+    generator = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    latencies = []
+    try:
+        for _ in range(requests):
+            request = make_request(generator, write_ratio, max_id)
+            start = time.perf_counter()
+            writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+            answer = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if not answer['ok']:
+                raise RuntimeError(answer['error'])
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return latencies
+
+
+async def run(host: str, port: int, clients: int, requests: int, write_ratio: float, max_id: int) -> dict:
+
+    """
+    Load the service from many clients at once.
+
+    :param host: Host of the service.
+    :param port: Port of the service.
+    :param clients: Number of simultaneous connections.
+    :param requests: Number of requests sent by every client.
+    :param write_ratio: Fraction of the requests changing the library.
+    :param max_id: Largest ID used by the requests.
+    :return: Number of requests, throughput in requests per second, p50 and p99 latency in milliseconds.
+    """
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(host, port, requests, write_ratio, max_id, seed)
+                                     for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+
+    """
+    Run the load generator from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description='Load generator for the network service of the library.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--clients', type=int, default=50, help='Number of simultaneous connections.')
+    parser.add_argument('--requests', type=int, default=200, help='Number of requests sent by every client.')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='Fraction of the requests changing the library.')
+    parser.add_argument('--max-id', type=int, default=5, help='Largest ID used by the requests.')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.host, args.port, args.clients, args.requests, args.write_ratio, args.max_id))
+    print(f"Запросов: {result['requests']}, {result['throughput_rps']:.0f} запросов/с, "
+          f"p50 {result['p50_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,16 @@
-from library import Library
+from book import STATUSES
+from library import Library, NO_MORE_BOOKS, NOT_FOUND
+from metrics import Metrics
+from storage import BufferedStorage, JsonStorage
+from typing import Iterable, Iterator
+import argparse
+import contextlib
+import itertools
+import json
+import sys
+
+PAGE_SIZE = 20  # Number of books on one page of the found or all books
+PROFILE_FILE = 'library.prof'  # File with the cProfile output of a profiled operation
 
 
 def menu(**kwargs) -> None:
@@ -11,6 +23,7 @@ def menu(**kwargs) -> None:
     :param kwargs: Optional keyword arguments that can include:
         - ver: Version of the menu to display (None for main menu, 0 for removal menu, 1 for back navigation).
         - context_error: An optional error message to display.
+        - next_page: If True, the option to show the next page of books is displayed.
     """
 
     print("\n--------------------------------------------------------")
@@ -21,6 +34,7 @@ def menu(**kwargs) -> None:
         print("3. Найти книгу.")
         print("4. Отобразить все книги.")
         print("5. Изменить статус книги.")
+        print("6. Следующая страница.") if kwargs.get('next_page') else None
         print("0. Выход.\n")
     if kwargs.get('ver') == 0:
         print("0. Вернуться в главное меню.\n")
@@ -29,20 +43,144 @@ def menu(**kwargs) -> None:
         print("-1. Вернуться назад.\n")
 
 
-def main() -> None:
+def format_stats(stats: dict) -> str:
+
+    """
+    Render the metrics of the library for the hidden menu entry.
+
+    :param stats: The result of Library.stats.
+    :return: The metrics line by line.
+    """
+
+    lines = [f"Книг: {stats['books']}"]
+    if 'cache' in stats:
+        cache = stats['cache']
+        lines.append(f"Кэш поиска: {cache['hits']} попаданий, {cache['misses']} промахов ({cache['hit_rate']:.0%})")
+    if 'circulation' in stats:
+        circulation = stats['circulation']
+        authors = ', '.join(f"{author} ({count})" for author, count in circulation['most_borrowed_authors'])
+        lines.append(f"В наличии: {circulation['available']}, выдано: {circulation['issued']}, "
+                     f"выдач: {circulation['checkouts']}, возвратов: {circulation['returns']}")
+        lines.append(f"Чаще всего берут: {authors or '—'}")
+    for name, value in stats.get('events', {}).items():
+        lines.append(f"{name}: {value}")
+    for name, operation in stats.get('operations', {}).items():
+        histogram = ', '.join(f"{label}: {count}" for label, count in operation['histogram'].items() if count)
+        lines.append(f"{name}: {operation['count']} вызовов, в среднем {operation['mean_ms']:.2f} мс ({histogram})")
+    return '\n'.join(lines)
+
+
+def execute(library: Library, command: dict):
+
+    """
+    Run one command of the batch mode against the library.
+
+    :param library: The library.
+    :param command: The command with the operation in the 'op' key: 'add' with 'title', 'author' and
+        'year', 'remove' with 'id', 'status' with 'id' and 'status', 'get' with 'id', 'find' with 'query'
+        and 'list', the last two with optional 'offset' and 'limit'.
+    :return: The result of the command, converted to JSON for the output.
+    :raises ValueError: If the command is not valid.
+    """
+
+    match command.get('op'):
+        case 'add':
+            return library.new_book(command['title'], command['author'], command['year']).to_dict()
+        case 'remove':
+            return library.delete_book(int(command['id']))
+        case 'status':
+            if command['status'] not in STATUSES:
+                raise ValueError("Статус может быть значением 'в наличии' или 'выдана'!")
+            return library.set_status(int(command['id']), command['status'])
+        case 'get':
+            book = library.get_book(int(command['id']))
+            return None if book is None else book.to_dict()
+        case 'find' | 'list' as op:
+            books = library.match_books(str(command['query'])) if op == 'find' else library.iter_books()
+            offset = int(command.get('offset', 0))
+            limit = command.get('limit')
+            end = None if limit is None else offset + int(limit)
+            return [book.to_dict() for book in itertools.islice(books, offset, end)]
+        case op:
+            raise ValueError(f"Unknown operation: {op!r}")
+
+
+def run_batch(library: Library, lines: Iterable[str]) -> Iterator[str]:
+
+    """
+    Run the commands of the batch mode, one JSON object on every line.
+
+    A failed command does not stop the others, its answer has the error instead of the result.
+
+    :param library: The library.
+    :param lines: The commands as JSON lines, empty lines are skipped.
+    :return: An iterator over the answers as JSON lines, one for every command.
+    """
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            answer = {'ok': True, 'result': execute(library, json.loads(line))}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            answer = {'ok': False, 'error': str(error)}
+        yield json.dumps(answer, ensure_ascii=False)
+
+
+def main(argv: list[str] | None = None) -> None:
 
     """
     Main function to run the library console program.
 
     This function initializes the library, displays the main menu, and handles user input
     to perform various actions such as adding, removing, finding, and displaying books.
-    It runs in a loop until the user chooses to exit.
+    It runs in a loop until the user chooses to exit. The menu is shown at once, while the books
+    are still loaded in the background.
+
+    With --batch the commands are read as JSON lines from a file or the standard input instead,
+    the answers are printed as JSON lines, and the library is loaded and saved only once.
+    The file of the books is resolved relative to the root directory of the project, like all data files,
+    while the file of the commands is opened as given, relative to the working directory.
 
+    :param argv: The command line arguments, no arguments for the interactive menu.
     :return: None
     """
 
-    library = Library('library.json')  # Initializing the library with the specified JSON file
+    parser = argparse.ArgumentParser(description='Console program of the library.')
+    parser.add_argument('--file', default='library.json',
+                        help='The JSON file with the books, relative to the root directory of the project.')
+    parser.add_argument('--batch', metavar='COMMANDS',
+                        help='Run the commands from a JSON lines file relative to the working directory, '
+                             '- for the standard input.')
+    args = parser.parse_args([] if argv is None else argv)
+
+    if args.batch is not None:
+        with contextlib.redirect_stdout(sys.stderr):  # Keep the output JSON lines only
+            library = Library(args.file, storage=BufferedStorage(JsonStorage(args.file)))  # Changes wait for the end
+        commands = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        try:
+            for answer in run_batch(library, commands):
+                print(answer)
+        finally:
+            if commands is not sys.stdin:
+                commands.close()
+            library.flush()  # All changes are saved at once
+        return
+
+    library = Library(args.file, background=True)  # The books are loaded while the menu is shown
     menu()  # Display the main menu
+    pager = None  # Function rendering a page of the last shown books by the offset and the limit
+    offset = 0  # Offset of the last shown page
+
+    def show_page() -> None:
+
+        """
+        Display the page of books at the current offset with the option to go to the next page.
+        """
+
+        page = pager(offset, PAGE_SIZE)
+        next_page = page != NO_MORE_BOOKS and pager(offset + PAGE_SIZE, 1) != NO_MORE_BOOKS
+        menu(context_error=page, next_page=next_page)
 
     while True:
         option: str = input("Выберите действие: ")  # Get user input for menu option
@@ -70,22 +208,44 @@ def main() -> None:
                 if query == "0":
                     menu()  # Return to the main menu
                     continue
-                context_error = library.find_books(query)  # Find books and get answer about mistake or successful
-                menu(context_error=context_error)  # Display the menu with get answer about mistake or successful
+                # Find books page by page and get answer about mistake or successful
+                pager, offset = lambda page_offset, limit: library.find_books(query, page_offset, limit), 0
+                if pager(0, 1) == NOT_FOUND:  # Nothing matches exactly, look for the query with typos
+                    pager = lambda page_offset, limit: library.find_similar_books(query, page_offset, limit)
+                show_page()  # Display the menu with get answer about mistake or successful
                 continue
             case '4':
-                context_error = library.display_books()  # Find all books and get answer about mistake or successful
-                menu(context_error=context_error)  # Display the menu with get answer about mistake or successful
+                pager, offset = library.display_books, 0  # Show all books page by page
+                show_page()  # Display the menu with get answer about mistake or successful
                 continue
             case '5':
                 context_error = library.change_status()  # Change the status of a book
                 menu(context_error=context_error)  # Display the menu with get answer about mistake or successful
                 continue
+            case '6' if pager is not None:
+                offset += PAGE_SIZE  # Go to the next page of the last shown books
+                show_page()
+                continue
+            case '9':  # Hidden entry: the metrics of the library, enabled on the first use
+                if library.metrics is None:
+                    library.metrics = Metrics()
+                    menu(context_error="Сбор метрик включён.")
+                    continue
+                menu(context_error=format_stats(library.stats()))
+                continue
+            case '99':  # Hidden entry: profile the next operation with cProfile
+                if library.metrics is None:
+                    library.metrics = Metrics()
+                library.metrics.profile_file = PROFILE_FILE
+                menu(context_error=f"Профиль следующей операции будет записан в {PROFILE_FILE}.")
+                continue
             case '0':
                 break  # Exit the loop and end the program
             case _:
                 menu(context_error="Неправильный статус! Напишите цифру из списка!")  # Handle invalid input
 
+    library.close()  # Books added while the others were loaded are saved after them
+
 
 if __name__ == "__main__":
-    main()  # Run the main function
+    main(sys.argv[1:])  # Run the main function
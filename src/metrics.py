@@ -0,0 +1,92 @@
+from typing import Callable
+import threading
+import time
+
+HISTOGRAM_BOUNDS_MS = (0.1, 1, 10, 100, 1000, 10000)  # Upper bounds of the latency buckets in milliseconds
+PROFILE_LINES = 20  # Number of functions in the text summary of a profile
+
+
+class Metrics:
+    def __init__(self) -> None:
+
+        """
+        Initialize empty counters and latency histograms of the operations of a library.
+
+        Every bucket of a histogram counts the operations faster than its bound and slower
+        than the previous one, the last bucket counts the slower ones.
+        """
+
+        self.counts: dict[str, int] = {}  # Number of calls of every operation
+        self.seconds: dict[str, float] = {}  # Total time of every operation
+        self.histograms: dict[str, list[int]] = {}  # Latency buckets of every operation
+        self.events: dict[str, int] = {}  # Counters of other events, such as the bytes written or the searches
+        self.profile_file: str | None = None  # File to dump the profile of the next operation to
+        self.last_profile: str = ''  # Text summary of the last profiled operation
+        self.lock: threading.Lock = threading.Lock()  # Readers of a thread-safe library count at the same time
+
+    def run(self, name: str, function: Callable, *args, **kwargs):
+
+        """
+        Run an operation, count it and put its latency into the histogram.
+
+        If a profile file is set, the operation runs under cProfile and the profile is dumped to the file.
+
+        :param name: Name of the operation.
+        :param function: The operation.
+        :return: The result of the operation.
+        """
+
+        profiler = None
+        profile_file, self.profile_file = self.profile_file, None  # Nested operations are not profiled again
+        if profile_file is not None:
+            import cProfile  # Imported only when profiling, so that the library starts faster
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self.dump_profile(profiler, profile_file)
+            milliseconds = elapsed * 1000
+            bucket = next((bucket for bucket, bound in enumerate(HISTOGRAM_BOUNDS_MS) if milliseconds < bound),
+                          len(HISTOGRAM_BOUNDS_MS))
+            with self.lock:
+                self.counts[name] = self.counts.get(name, 0) + 1
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+                self.histograms.setdefault(name, [0] * (len(HISTOGRAM_BOUNDS_MS) + 1))[bucket] += 1
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.events[name] = self.events.get(name, 0) + value
+
+    def dump_profile(self, profiler: 'cProfile.Profile', file_name: str) -> None:
+        import io
+        import pstats
+
+        profiler.dump_stats(file_name)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        self.last_profile = text.getvalue()
+
+    def snapshot(self) -> dict:
+
+        """
+        Collect the counters and the histograms.
+
+        :return: Calls, total and mean milliseconds and the latency buckets of every operation, and the events.
+        """
+
+        labels = [f'<{bound} ms' for bound in HISTOGRAM_BOUNDS_MS] + [f'>={HISTOGRAM_BOUNDS_MS[-1]} ms']
+        with self.lock:
+            return {
+                'operations': {name: {
+                    'count': count,
+                    'total_ms': self.seconds[name] * 1000,
+                    'mean_ms': self.seconds[name] * 1000 / count,
+                    'histogram': dict(zip(labels, self.histograms[name])),
+                } for name, count in self.counts.items()},
+                'events': dict(self.events),
+            }
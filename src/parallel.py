@@ -0,0 +1,111 @@
+from book import Book
+from typing import Callable, Iterable
+
+_shard: dict[int, Book] = {}  # Books of the shard kept by the worker process, by their IDs in the order they were added
+
+
+def _load_shard(books: list[Book]) -> None:
+    global _shard
+    _shard = {book.id: book for book in books}
+
+
+def _put(book: Book) -> None:
+    _shard[book.id] = book
+
+
+def _remove(book_id: int) -> None:
+    _shard.pop(book_id, None)
+
+
+def _set_status(book_id: int, status: str) -> None:
+    book = _shard.get(book_id)
+    if book is not None:
+        book.status = status
+
+
+def _scan(predicate: Callable[..., bool], args: tuple) -> list[int]:
+    return [book_id for book_id, book in _shard.items() if predicate(book, *args)]
+
+
+def matches_query(book: Book, query: str, lowered: str) -> bool:
+
+    """
+    Check a book the same way as the linear search of find_books.
+
+    :param book: The book.
+    :param query: The search query.
+    :param lowered: The lowercased search query.
+    :return: True if the query is a case-insensitive substring of the title or the author, or equals the year.
+    """
+
+    return lowered in book.title.lower() or lowered in book.author.lower() or query == str(book.year)
+
+
+class ParallelScanner:
+    def __init__(self, books: Iterable[Book], workers: int) -> None:
+
+        """
+        Split the books into shards kept by worker processes.
+
+        Every shard has its own process, which receives the books once when it starts and then
+        only the changes, so a scan sends nothing but the predicate. The shards follow the order
+        the books were added, and new books go to the last one, so joining the results of the
+        shards keeps that order.
+
+        :param books: The books in the order they were added.
+        :param workers: Number of worker processes.
+        """
+
+        from concurrent.futures import ProcessPoolExecutor  # Only here, it takes most of the import time of the library
+
+        books = list(books)
+        size = -(-len(books) // workers) or 1  # Books in every shard but the last
+        self.owners: dict[int, int] = {}  # Shard of every book by its ID
+        self.executors: list['ProcessPoolExecutor'] = []  # One single-process pool for every shard
+        for shard in range(workers):
+            shard_books = books[shard * size:(shard + 1) * size]
+            self.owners.update(dict.fromkeys((book.id for book in shard_books), shard))
+            self.executors.append(ProcessPoolExecutor(1, initializer=_load_shard, initargs=(shard_books,)))
+        for future in [executor.submit(len, ()) for executor in self.executors]:
+            future.result()  # Start the processes now rather than on the first scan
+
+    def put(self, book: Book) -> None:
+
+        """
+        Add a book to the last shard or replace it in its shard.
+
+        The changes are sent without waiting, every process applies them before the next scan.
+
+        :param book: The book.
+        """
+
+        shard = self.owners.setdefault(book.id, len(self.executors) - 1)
+        self.executors[shard].submit(_put, book)
+
+    def remove(self, book_id: int) -> None:
+        shard = self.owners.pop(book_id, None)
+        if shard is not None:
+            self.executors[shard].submit(_remove, book_id)
+
+    def set_status(self, book_id: int, status: str) -> None:
+        shard = self.owners.get(book_id)
+        if shard is not None:
+            self.executors[shard].submit(_set_status, book_id, status)
+
+    def scan(self, predicate: Callable[..., bool], *args) -> list[int]:
+
+        """
+        Check every book with a predicate in all shards at once.
+
+        :param predicate: A function of the book and the arguments, defined at the top level of a
+            module so that it can be sent to the processes.
+        :param args: Further arguments of the predicate.
+        :return: IDs of the matching books in the order they were added.
+        """
+
+        futures = [executor.submit(_scan, predicate, args) for executor in self.executors]
+        return [book_id for future in futures for book_id in future.result()]
+
+    def close(self) -> None:
+        for executor in self.executors:
+            executor.shutdown()
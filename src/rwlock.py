@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+
+
+class RWLock:
+    def __init__(self) -> None:
+
+        """
+        Initialize a readers-writer lock for threads.
+
+        Many readers hold the lock at once, a writer holds it alone. Waiting writers go first,
+        so a stream of reads cannot starve the writes. The lock is reentrant: a thread holding
+        it for writing may take it again for reading or writing, and a reader may read again.
+        """
+
+        self.condition: threading.Condition = threading.Condition()
+        self.readers: int = 0  # Number of threads holding the lock for reading
+        self.writer: int | None = None  # Identifier of the thread holding the lock for writing
+        self.waiting_writers: int = 0  # Number of threads waiting to write
+        self.local: threading.local = threading.local()  # Depth of the reads of the current thread
+
+    def held_reads(self) -> int:
+        return getattr(self.local, 'reads', 0)
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        if self.writer == threading.get_ident() or self.held_reads():
+            self.local.reads = self.held_reads() + 1  # Already holds the lock, waiting would deadlock
+            try:
+                yield
+            finally:
+                self.local.reads -= 1
+            return
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.writer is None and not self.waiting_writers)
+            self.readers += 1
+        self.local.reads = 1
+        try:
+            yield
+        finally:
+            self.local.reads = 0
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        if self.writer == threading.get_ident():
+            yield  # The outermost write releases the lock
+            return
+        if self.held_reads():
+            raise RuntimeError("A thread holding the lock for reading cannot take it for writing")
+
+        with self.condition:
+            self.waiting_writers += 1
+            self.condition.wait_for(lambda: self.writer is None and not self.readers)
+            self.waiting_writers -= 1
+            self.writer = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = None
+                self.condition.notify_all()
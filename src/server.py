@@ -0,0 +1,247 @@
+from book import Book, STATUSES
+from contextlib import asynccontextmanager
+from library import Library
+from storage import BufferedStorage, JsonStorage
+from typing import AsyncIterator, Callable, Iterator
+import argparse
+import asyncio
+import itertools
+import json
+
+DEFAULT_LIMIT = 100  # Number of books returned by find and display if the request has no limit
+FLUSH_INTERVAL = 0.5  # Seconds between flushes of the changes to the storage
+
+
+class AsyncRWLock:
+    def __init__(self) -> None:
+
+        """
+        Initialize a readers-writer lock for coroutines.
+
+        Many readers hold the lock at once, a writer holds it alone. Waiting writers go first,
+        so a stream of reads cannot starve the writes.
+        """
+
+        self.condition: asyncio.Condition = asyncio.Condition()
+        self.readers: int = 0  # Number of readers holding the lock
+        self.writer: bool = False  # A writer holds the lock
+        self.waiting_writers: int = 0  # Number of writers waiting for the lock
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writer and not self.waiting_writers)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        async with self.condition:
+            self.waiting_writers += 1
+            await self.condition.wait_for(lambda: not self.writer and not self.readers)
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class LibraryServer:
+    def __init__(self, library: Library, flush_interval: float = FLUSH_INTERVAL) -> None:
+
+        """
+        Initialize a network service sharing one Library between many clients.
+
+        The protocol is JSON lines: every request is a JSON object on its own line with the
+        operation in the 'op' key, every answer is a JSON object on its own line with 'ok'
+        and either 'result' or 'error'. Reads run in worker threads at the same time, writes
+        are applied one at a time, and the changes are flushed to the storage in batches by
+        a background task.
+
+        :param library: The library, its storage must be a BufferedStorage.
+        :param flush_interval: Seconds between flushes of the changes to the storage.
+        """
+
+        if not isinstance(library.storage, BufferedStorage):
+            raise ValueError("The storage of the library must be a BufferedStorage")
+        self.library: Library = library  # The shared library
+        self.storage: BufferedStorage = library.storage  # Storage collecting the changes
+        self.flush_interval: float = flush_interval  # Seconds between flushes
+        self.lock: AsyncRWLock = AsyncRWLock()  # Lock between the reads and the writes
+        self.server: asyncio.Server | None = None  # The listening server
+        self.flusher: asyncio.Task | None = None  # Background task flushing the changes
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.Server:
+
+        """
+        Start listening and flushing.
+
+        :param host: Host to listen on.
+        :param port: Port to listen on, 0 for any free port.
+        :return: The started server.
+        """
+
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.flusher = asyncio.create_task(self.flush_periodically())
+        return self.server
+
+    async def close(self) -> None:
+
+        """
+        Stop listening and flush the remaining changes.
+        """
+
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def flush(self) -> int:
+
+        """
+        Persist the collected changes in a worker thread without blocking the event loop.
+
+        :return: Number of persisted changes.
+        """
+
+        if not self.storage.records:
+            return 0
+        async with self.lock.read():
+            return await asyncio.to_thread(self.storage.flush, self.library.books.values(), self.library.next_id)
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+
+        """
+        Answer the requests of one client until it disconnects.
+
+        :param reader: Stream of the requests.
+        :param writer: Stream of the answers.
+        """
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    answer = {'ok': True, 'result': await self.execute(request)}
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    answer = {'ok': False, 'error': str(error)}
+                writer.write(json.dumps(answer, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def execute(self, request: dict):
+
+        """
+        Run one request against the library.
+
+        :param request: The request with the operation in the 'op' key.
+        :return: The result of the operation, converted to JSON for the answer.
+        :raises ValueError: If the request is not valid.
+        """
+
+        match request.get('op'):
+            case 'find':
+                query = str(request['query'])
+                async with self.lock.read():
+                    return await asyncio.to_thread(self.page, lambda: self.library.match_books(query), request)
+            case 'display':
+                async with self.lock.read():
+                    return await asyncio.to_thread(self.page, self.library.iter_books, request)
+            case 'get':
+                async with self.lock.read():
+                    book = await asyncio.to_thread(self.library.get_book, int(request['id']))
+                return None if book is None else book.to_dict()
+            case 'add':
+                async with self.lock.write():
+                    return self.library.new_book(request['title'], request['author'], request['year']).to_dict()
+            case 'remove':
+                async with self.lock.write():
+                    return self.library.delete_book(int(request['id']))
+            case 'status':
+                if request['status'] not in STATUSES:
+                    raise ValueError("Статус может быть значением 'в наличии' или 'выдана'!")
+                async with self.lock.write():
+                    return self.library.set_status(int(request['id']), request['status'])
+            case op:
+                raise ValueError(f"Unknown operation: {op!r}")
+
+    @staticmethod
+    def page(books: Callable[[], Iterator[Book]], request: dict) -> list[dict]:
+
+        """
+        Take a page of books as dictionaries.
+
+        :param books: Function giving the iterator over the books, called in the worker thread.
+        :param request: The request with optional 'offset' and 'limit'.
+        :return: The books of the page.
+        """
+
+        offset = int(request.get('offset', 0))
+        limit = int(request.get('limit', DEFAULT_LIMIT))
+        return [book.to_dict() for book in itertools.islice(books(), offset, offset + limit)]
+
+
+async def serve(file_name: str, host: str, port: int, flush_interval: float) -> None:
+
+    """
+    Run the service until it is interrupted.
+
+    :param file_name: The name of the JSON file with the books.
+    :param host: Host to listen on.
+    :param port: Port to listen on.
+    :param flush_interval: Seconds between flushes of the changes to the storage.
+    """
+
+    library = Library(file_name, storage=BufferedStorage(JsonStorage(file_name, journal=True)))
+    service = LibraryServer(library, flush_interval)
+    server = await service.start(host, port)
+    print(f"Сервер библиотеки запущен на {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main() -> None:
+
+    """
+    Run the service from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description='Network service of the library.')
+    parser.add_argument('--file', default='library.json', help='The name of the JSON file with the books.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL,
+                        help='Seconds between flushes of the changes to the file.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.file, args.host, args.port, args.flush_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+from book import Book
+from json_stream import iter_json_array
+from storage import JsonStorage, Storage, resolve_path, write_atomically
+from typing import Iterable, Iterator
+import argparse
+import heapq
+import json
+import os
+
+MANIFEST_SUFFIX = '.shards'  # Suffix of the file describing the shards, stored next to the JSON file
+RANGE_SIZE = 100_000  # Number of IDs in every shard of the range scheme
+SCHEMES = ('range', 'hash')  # Ways to choose the shard of a book by its ID
+SHARDS = 4  # Number of shards of the hash scheme
+
+
+def apply_change(books: dict[int, Book], record: dict) -> None:
+
+    """
+    Apply a journal record to the books of a shard.
+
+    :param books: The books of the shard by their IDs.
+    :param record: A journal record with the operation name in the 'op' key.
+    """
+
+    match record.get('op'):
+        case 'add':
+            books[record['book']['id']] = Book(**record['book'])
+        case 'remove':
+            books.pop(record['id'], None)
+        case 'status':
+            book = books.get(record['id'])
+            if book is not None:
+                book.status = record['status']
+
+
+def record_id(record: dict) -> int:
+
+    """
+    Get the ID of the book a journal record changes.
+
+    :param record: A journal record with the operation name in the 'op' key.
+    :return: The ID of the book.
+    """
+
+    return record['book']['id'] if record.get('op') == 'add' else record['id']
+
+
+def shard_name(file_name: str, generation: int, shard: int) -> str:
+
+    """
+    Name the JSON file of a shard.
+
+    :param file_name: Path of the JSON file of the catalogue.
+    :param generation: Generation of the layout, changed by every rebalance.
+    :param shard: Number of the shard.
+    :return: Path of the file, such as library.0.3.json for the shard 3 of library.json.
+    """
+
+    root, extension = os.path.splitext(file_name)
+    return f'{root}.{generation}.{shard}{extension}'
+
+
+def shard_of(book_id: int, scheme: str, shards: int, range_size: int) -> int:
+
+    """
+    Choose the shard of a book.
+
+    :param book_id: The ID of the book.
+    :param scheme: 'range' or 'hash'.
+    :param shards: Number of shards of the hash scheme.
+    :param range_size: Number of IDs in every shard of the range scheme.
+    :return: Number of the shard.
+    """
+
+    if scheme == 'hash':
+        return book_id % shards
+    return max(book_id - 1, 0) // range_size
+
+
+class ShardedStorage(Storage):
+    can_lookup = True
+
+    def __init__(self, file_name: str, shards: int = SHARDS, scheme: str = 'range', range_size: int = RANGE_SIZE,
+                 journal: bool = False, compact_threshold: int = 1000, differential: bool = False):
+
+        """
+        Initialize the storage of books split between several JSON files.
+
+        A book goes to a shard by its ID: consecutive ranges of range_size IDs in the range scheme,
+        where a new shard is started when the IDs grow, or the remainder of the ID in the hash
+        scheme with a fixed number of shards. Every shard is a JsonStorage with its own journal,
+        so a change rewrites only the shard of its book. The layout is kept in a manifest file
+        next to the JSON file and wins over the arguments once it exists; rebalance changes it.
+
+        :param file_name: The name of the JSON file, the shards are stored next to it.
+        :param shards: Number of shards of the hash scheme.
+        :param scheme: 'range' or 'hash'.
+        :param range_size: Number of IDs in every shard of the range scheme.
+        :param journal: If True, every change is appended to the journal of its shard instead of rewriting it.
+        :param compact_threshold: Number of journal records after which a shard is rewritten.
+        :param differential: If True, without the journal a change is written over the file of its shard
+            in place when it can, see JsonStorage.
+        """
+
+        self.file_name: str = resolve_path(file_name)  # Path of the JSON file the shards are named after
+        self.manifest_name: str = self.file_name + MANIFEST_SUFFIX  # Path of the manifest
+        self.journal: bool = journal  # Append changes to the journals of the shards
+        self.compact_threshold: int = compact_threshold  # Journal records before a shard is rewritten
+        self.differential: bool = differential  # Write the changes over the files of the shards in place
+        manifest = self.read_manifest()
+        if manifest is None:
+            if scheme not in SCHEMES:
+                raise ValueError(f"Unknown sharding scheme: {scheme!r}")
+            manifest = {'scheme': scheme, 'shards': shards if scheme == 'hash' else 1,
+                        'range_size': range_size, 'generation': 0}
+            self.write_manifest(manifest)
+        self.scheme: str = manifest['scheme']  # How the shard of a book is chosen
+        self.range_size: int = manifest['range_size']  # IDs in every shard of the range scheme
+        self.generation: int = manifest['generation']  # Changed by rebalance, part of the names of the shards
+        self.shards: list[JsonStorage] = []  # Storages of the shards
+        self.grow(manifest['shards'])
+        self.next_id: int = self.read_next_id()  # Highest ID saved, journaled or committed so far plus one
+
+    def read_manifest(self) -> dict | None:
+        try:
+            with open(self.manifest_name, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, manifest: dict) -> None:
+        write_atomically(self.manifest_name, lambda file: json.dump(manifest, file))
+
+    def grow(self, count: int) -> None:
+
+        """
+        Open the shards up to the given number, recording a new number in the manifest.
+
+        :param count: Number of shards.
+        """
+
+        if count <= len(self.shards):
+            return
+        recorded = len(self.shards) > 0
+        self.shards.extend(JsonStorage(shard_name(self.file_name, self.generation, shard), self.journal,
+                                       self.compact_threshold, self.differential)
+                           for shard in range(len(self.shards), count))
+        if recorded:
+            self.write_manifest({'scheme': self.scheme, 'shards': count, 'range_size': self.range_size,
+                                 'generation': self.generation})
+
+    def shard_of(self, book_id: int) -> int:
+        return shard_of(book_id, self.scheme, len(self.shards), self.range_size)
+
+    def read_next_id(self) -> int:
+        return max(shard.read_next_id() for shard in self.shards)
+
+    def read_header(self) -> dict[str, int]:
+        headers = [shard.read_header() for shard in self.shards if os.path.exists(shard.file_name)]
+        if not headers or any('count' not in header for header in headers):
+            return {}
+        return {'next_id': max(header['next_id'] for header in headers),
+                'count': sum(header['count'] for header in headers),
+                'max_id': max(header['max_id'] for header in headers)}
+
+    @staticmethod
+    def stream_shard(shard: JsonStorage) -> Iterator[Book]:
+
+        """
+        Read the saved books of a shard one at a time, without the changes in its journal.
+
+        :param shard: The storage of the shard.
+        :return: An iterator over the books, empty if the shard has no file yet.
+        """
+
+        if not os.path.exists(shard.file_name):
+            return
+        with open(shard.file_name, 'r', encoding='utf-8') as file:
+            for book in iter_json_array(file):
+                yield Book(**book)
+
+    def read_books(self) -> Iterator[Book] | None:
+
+        """
+        Read the books of all shards one at a time, merged by their IDs.
+
+        IDs are given in the order the books are added, so the merged books are in that order too.
+
+        :return: An iterator over the books or None if no shard has a file yet.
+        """
+
+        if not any(os.path.exists(shard.file_name) for shard in self.shards):
+            print('Файлы с книгами не найдены. Новые файлы будут созданы в формате JSON!')
+            return None
+        return self.merge_shards()
+
+    def merge_shards(self) -> Iterator[Book]:
+        yield from heapq.merge(*(self.stream_shard(shard) for shard in self.shards), key=lambda book: book.id)
+        print(f'Файлы с книгами найдены и успешно загружены (частей: {len(self.shards)})!')
+
+    def has_changes(self) -> bool:
+        return any(shard.has_changes() for shard in self.shards)
+
+    def read_changes(self) -> Iterator[dict]:
+
+        """
+        Read the journals of all shards merged into one.
+
+        The records of a book are all in the journal of its shard, so they are sorted by the ID of
+        the book and keep their order, and the added books come back in the order they were added.
+
+        :return: An iterator over the journal records.
+        """
+
+        records = [record for shard in self.shards for record in shard.read_changes()]
+        records.sort(key=record_id)
+        for record in records:
+            self.see(record)
+            yield record
+
+    def see(self, record: dict) -> None:
+        if record.get('op') == 'add':
+            self.next_id = max(self.next_id, record['book']['id'] + 1)
+
+    def shard_books(self, shard: JsonStorage) -> dict[int, Book]:
+
+        """
+        Read the books of a shard with the changes in its journal applied.
+
+        :param shard: The storage of the shard.
+        :return: The books of the shard by their IDs in the order they were added.
+        """
+
+        books = {book.id: book for book in self.stream_shard(shard)}
+        journal_records = shard.journal_records  # read_changes counts the records it reads
+        for record in shard.read_changes():
+            self.see(record)  # A compaction must not forget the ID of a book added and removed in the journal
+            apply_change(books, record)
+        shard.journal_records = journal_records
+        return books
+
+    def commit(self, record: dict) -> bool:
+        return self.commit_many([record])
+
+    def commit_many(self, records: list[dict]) -> bool:
+
+        """
+        Persist many changes, every one in the shard of its book.
+
+        A shard whose JSON file must be rewritten is read, changed and saved on its own, the other
+        shards are not touched. A shard that can write the changes in place is not read at all.
+
+        :param records: Journal records describing the changes.
+        :return: False, all books are never saved at once.
+        """
+
+        changes: dict[int, list[dict]] = {}
+        for record in records:
+            self.see(record)
+            changes.setdefault(self.shard_of(record_id(record)), []).append(record)
+        self.grow(max(changes, default=-1) + 1)
+        for number, shard_records in changes.items():
+            shard = self.shards[number]
+            if shard.commit_many(shard_records):
+                if shard.save_pending(max(self.next_id, shard.read_next_id())):
+                    continue
+                books = self.shard_books(shard)
+                for record in shard_records:
+                    apply_change(books, record)
+                shard.save(books.values(), max(self.next_id, shard.read_next_id()))
+        return False
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+
+        """
+        Save all books, every shard to its own file.
+
+        :param books: All books of the library.
+        :param next_id: ID of the next added book.
+        """
+
+        self.next_id = max(self.next_id, next_id)
+        shard_books: dict[int, list[Book]] = {}
+        for book in books:
+            shard_books.setdefault(self.shard_of(book.id), []).append(book)
+        self.grow(max(shard_books, default=-1) + 1)
+        for number, shard in enumerate(self.shards):
+            shard.save(shard_books.get(number, []), next_id)
+
+    def lookup(self, book_id: int) -> Book | None:
+        shard = self.shard_of(book_id)
+        return self.shards[shard].lookup(book_id) if shard < len(self.shards) else None  # One record and the journal
+
+
+def rebalance(file_name: str, scheme: str, shards: int = SHARDS, range_size: int = RANGE_SIZE) -> int:
+
+    """
+    Redistribute the books of a catalogue between new shards, for example when it has grown.
+
+    A catalogue that is not sharded yet is split, its JSON file is left as it is. The new shards
+    are written next to the old ones, then the manifest is replaced, so a failure in the middle
+    leaves the old layout in place, and only then are the files of the old shards removed.
+
+    :param file_name: Path of the JSON file of the catalogue.
+    :param scheme: 'range' or 'hash'.
+    :param shards: Number of shards of the hash scheme.
+    :param range_size: Number of IDs in every shard of the range scheme.
+    :return: Number of redistributed books.
+    """
+
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown sharding scheme: {scheme!r}")
+    sharded = os.path.exists(resolve_path(file_name) + MANIFEST_SUFFIX)
+    source = ShardedStorage(file_name) if sharded else JsonStorage(file_name)
+    if sharded:
+        books = {}
+        for shard in source.shards:
+            books.update(source.shard_books(shard))
+    else:
+        books = {book.id: book for book in source.read_books() or ()}
+        for record in source.read_changes():
+            apply_change(books, record)
+    next_id = max([source.read_next_id()] + [book_id + 1 for book_id in books])
+
+    shard_books: dict[int, list[Book]] = {}
+    for book_id in sorted(books):
+        shard_books.setdefault(shard_of(book_id, scheme, shards, range_size), []).append(books[book_id])
+    generation = source.generation + 1 if sharded else 0
+    count = shards if scheme == 'hash' else max(shard_books, default=0) + 1
+    for shard in range(count):
+        JsonStorage(shard_name(source.file_name, generation, shard)).save(shard_books.get(shard, []), next_id)
+    write_atomically(source.file_name + MANIFEST_SUFFIX, lambda file: json.dump(
+        {'scheme': scheme, 'shards': count, 'range_size': range_size, 'generation': generation}, file))
+
+    if sharded:
+        for shard in source.shards:
+            for name in (shard.file_name, shard.journal_name, shard.meta_name):
+                if os.path.exists(name):
+                    os.remove(name)
+    return len(books)
+
+
+def main() -> None:
+
+    """
+    Split a catalogue into shards or redistribute its shards from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description='Split library.json into shards or redistribute its shards.')
+    parser.add_argument('file_name')
+    parser.add_argument('--scheme', choices=SCHEMES, default='range')
+    parser.add_argument('--shards', type=int, default=SHARDS, help='Number of shards of the hash scheme.')
+    parser.add_argument('--range-size', type=int, default=RANGE_SIZE,
+                        help='Number of IDs in every shard of the range scheme.')
+    args = parser.parse_args()
+
+    count = rebalance(os.path.abspath(args.file_name), args.scheme, args.shards, args.range_size)
+    print(f"Перераспределено книг: {count}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+from book import Book
+from bisect import bisect_left
+from json_stream import iter_json_array
+from storage import JsonStorage, write_atomically
+from typing import BinaryIO, Iterable, Iterator
+import argparse
+import mmap
+import os
+import struct
+
+MAGIC = b'LIBSNAP1'  # First bytes of every snapshot file
+HEADER = struct.Struct('<8sII')  # Magic, number of books, ID of the next added book
+RECORD = struct.Struct('<iiIIIIIH')  # ID, year, title offset and length, author offset and length, status offset and length
+ID_ENTRY = struct.Struct('<iI')  # ID and slot of a book, sorted by ID
+
+
+def write_snapshot(file_name: str, books: Iterable[Book], next_id: int) -> None:
+
+    """
+    Write books to a binary snapshot file.
+
+    The file has a header, a table of fixed-width records in the order of the books, a table
+    of IDs sorted for binary search and a heap of UTF-8 strings. Equal authors and statuses
+    share one string in the heap. The file is written to a temporary file first and then
+    replaces the old one, so readers never see a half-written snapshot.
+
+    :param file_name: Path of the snapshot file.
+    :param books: The books to write.
+    :param next_id: ID of the next added book.
+    """
+
+    records = bytearray()
+    heap = bytearray()
+    shared: dict[str, tuple[int, int]] = {}
+    ids = []
+
+    def put(text: str, share: bool) -> tuple[int, int]:
+        if share and text in shared:
+            return shared[text]
+        data = text.encode('utf-8')
+        location = (len(heap), len(data))
+        heap.extend(data)
+        if share:
+            shared[text] = location
+        return location
+
+    for slot, book in enumerate(books):
+        records += RECORD.pack(book.id, book.year, *put(book.title, False), *put(book.author, True),
+                               *put(book.status, True))
+        ids.append((book.id, slot))
+
+    ids.sort()
+
+    def write(file: BinaryIO) -> None:
+        file.write(HEADER.pack(MAGIC, len(ids), next_id))
+        file.write(records)
+        file.write(b''.join(ID_ENTRY.pack(book_id, slot) for book_id, slot in ids))
+        file.write(heap)
+
+    write_atomically(file_name, write, binary=True)
+
+
+class SnapshotReader:
+    def __init__(self, file_name: str) -> None:
+
+        """
+        Open a binary snapshot file with mmap.
+
+        Nothing is read in advance, every access decodes only the records and strings it needs,
+        so opening takes the same time for any number of books.
+
+        :param file_name: Path of the snapshot file.
+        :raises ValueError: If the file is not a snapshot.
+        """
+
+        with open(file_name, 'rb') as file:
+            self.data: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data.size() < HEADER.size:
+            self.data.close()
+            raise ValueError(f"Not a snapshot file: {file_name}")
+        magic, self.count, self.next_id = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError(f"Not a snapshot file: {file_name}")
+        self.ids_start: int = HEADER.size + self.count * RECORD.size  # Offset of the table of IDs
+        self.heap_start: int = self.ids_start + self.count * ID_ENTRY.size  # Offset of the heap of strings
+
+    def __len__(self) -> int:
+        return self.count
+
+    def text(self, offset: int, length: int) -> str:
+        start = self.heap_start + offset
+        return self.data[start:start + length].decode('utf-8')
+
+    def book(self, slot: int) -> Book:
+
+        """
+        Decode the book at a slot of the record table.
+
+        :param slot: Position of the book in the snapshot.
+        :return: The book.
+        """
+
+        book_id, year, title_offset, title_length, author_offset, author_length, status_offset, status_length = \
+            RECORD.unpack_from(self.data, HEADER.size + slot * RECORD.size)
+        return Book(book_id, self.text(title_offset, title_length), self.text(author_offset, author_length), year,
+                    self.text(status_offset, status_length))
+
+    def find(self, book_id: int) -> Book | None:
+
+        """
+        Find a book by its ID with a binary search over the table of IDs.
+
+        :param book_id: The ID of the book.
+        :return: The book or None if there is no book with such ID.
+        """
+
+        entries = _IdTable(self)
+        position = bisect_left(entries, book_id)
+        if position == self.count or entries[position] != book_id:
+            return None
+        return self.book(ID_ENTRY.unpack_from(self.data, self.ids_start + position * ID_ENTRY.size)[1])
+
+    def iter_books(self) -> Iterator[Book]:
+        for slot in range(self.count):
+            yield self.book(slot)
+
+    def close(self) -> None:
+        self.data.close()
+
+
+class _IdTable:
+
+    """
+    Sequence of the sorted IDs of a snapshot for bisect, decoding only the probed entries.
+    """
+
+    def __init__(self, reader: SnapshotReader) -> None:
+        self.reader = reader
+
+    def __len__(self) -> int:
+        return self.reader.count
+
+    def __getitem__(self, position: int) -> int:
+        return ID_ENTRY.unpack_from(self.reader.data, self.reader.ids_start + position * ID_ENTRY.size)[0]
+
+
+class SnapshotStorage(JsonStorage):
+    can_lookup = True
+
+    def __init__(self, file_name: str, journal: bool = True, compact_threshold: int = 1000):
+
+        """
+        Initialize the storage of books in a binary snapshot file.
+
+        Changes are kept in the journal the same way as for the JSON file, and the snapshot
+        is rewritten when the journal is compacted.
+
+        :param file_name: The name of the snapshot file.
+        :param journal: If True, every change is appended to a journal file instead of rewriting the snapshot.
+        :param compact_threshold: Number of journal records after which the journal is compacted into the snapshot.
+        """
+
+        super().__init__(file_name, journal, compact_threshold, differential=False)
+        self.reader: SnapshotReader | None = None  # The opened snapshot
+
+    def open_reader(self) -> SnapshotReader | None:
+        if self.reader is None and os.path.exists(self.file_name):
+            self.reader = SnapshotReader(self.file_name)
+        return self.reader
+
+    def read_next_id(self) -> int:
+        reader = self.open_reader()
+        return max(super().read_next_id(), 1 if reader is None else reader.next_id)
+
+    def read_header(self) -> dict[str, int]:
+        reader = self.open_reader()
+        if reader is None:
+            return {}
+        return {'next_id': max(super().read_header().get('next_id', 1), reader.next_id), 'count': reader.count}
+
+    def read_books(self) -> Iterator[Book] | None:
+        reader = self.open_reader()
+        if reader is None:
+            print('Файл не найден. Новый файл с книгами будет создан в бинарном формате!')
+            return None
+        return reader.iter_books()
+
+    def lookup(self, book_id: int) -> Book | None:
+        reader = self.open_reader()
+        return None if reader is None else reader.find(book_id)
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+        write_snapshot(self.file_name, books, next_id)
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if os.path.exists(self.journal_name):
+            os.remove(self.journal_name)
+        self.journal_records = 0
+
+
+def json_to_snapshot(json_name: str, snapshot_name: str) -> int:
+
+    """
+    Convert a JSON file of books to a binary snapshot.
+
+    :param json_name: Path of the JSON file.
+    :param snapshot_name: Path of the snapshot file.
+    :return: Number of converted books.
+    """
+
+    next_id = 1
+    books = []
+    with open(json_name, 'r', encoding='utf-8') as file:
+        for data in iter_json_array(file):
+            book = Book(**data)
+            next_id = max(next_id, book.id + 1)
+            books.append(book)
+    next_id = max(next_id, JsonStorage(json_name).read_next_id())
+    write_snapshot(snapshot_name, books, next_id)
+    return len(books)
+
+
+def snapshot_to_json(snapshot_name: str, json_name: str) -> int:
+
+    """
+    Convert a binary snapshot to a JSON file of books in the format of library.json.
+
+    :param snapshot_name: Path of the snapshot file.
+    :param json_name: Path of the JSON file.
+    :return: Number of converted books.
+    """
+
+    reader = SnapshotReader(snapshot_name)
+    try:
+        JsonStorage(json_name).save(reader.iter_books(), reader.next_id)
+        return len(reader)
+    finally:
+        reader.close()
+
+
+def main() -> None:
+
+    """
+    Convert between the JSON and the binary snapshot formats from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description='Convert between library.json and a binary snapshot.')
+    parser.add_argument('direction', choices=['to-binary', 'to-json'])
+    parser.add_argument('source')
+    parser.add_argument('target')
+    args = parser.parse_args()
+
+    source, target = os.path.abspath(args.source), os.path.abspath(args.target)
+    if args.direction == 'to-binary':
+        count = json_to_snapshot(source, target)
+    else:
+        count = snapshot_to_json(source, target)
+    print(f"Преобразовано книг: {count}.")
+
+
+if __name__ == "__main__":
+    main()
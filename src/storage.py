@@ -0,0 +1,887 @@
+from array import array
+from bisect import bisect_left
+from book import Book, STATUSES
+from json.encoder import encode_basestring
+from json_stream import iter_json_array
+from typing import BinaryIO, Callable, Iterable, Iterator, TextIO
+import json
+import os
+import re
+import threading
+
+JOURNAL_SUFFIX = '.journal'  # Suffix of the journal file stored next to the JSON file
+META_SUFFIX = '.meta'  # Suffix of the file with the library metadata stored next to the JSON file
+HEADER_KEYS = ('next_id', 'count', 'max_id')  # Values of the header saved in the metadata file
+PAGE_ROWS = 1000  # Number of rows read from SQLite at once
+STATUS_WIDTH = max(len(json.dumps(status, ensure_ascii=False).encode('utf-8')) for status in STATUSES)  # Bytes
+# reserved for the status in the JSON file, so a change of the status keeps the length of the record
+RECORD_PATTERN = re.compile(  # A book in the JSON file as json.dump writes it with indent=4
+    rb'\n    \{\n        "id": (\d+),\n        "title": [^\n]*,\n        "author": [^\n]*,\n'
+    rb'        "year": -?\d+,\n        "status": ("(?:[^"\\\n]|\\.)*" *)\n    \}')
+
+
+def resolve_path(file_name: str) -> str:
+
+    """
+    Resolve the name of a data file relative to the root directory of the project.
+
+    :param file_name: The name of the file, absolute paths are kept as they are.
+    :return: The path of the file.
+    """
+
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), file_name)
+
+
+def write_atomically(file_name: str, write: Callable[[TextIO], None] | Callable[[BinaryIO], None],
+                     binary: bool = False) -> None:
+
+    """
+    Write a text file so that it is replaced as a whole or not at all.
+
+    The content is written to a temporary file, flushed to the disk and then moved over the
+    old file with os.replace, which is atomic. The temporary file is named after the process and
+    the thread, so writers such as a flush of the write-behind mode and an explicit save never
+    share it, and it is removed if the write fails.
+
+    :param file_name: Path of the file.
+    :param write: Function writing the content to the opened temporary file.
+    :param binary: Open the temporary file in the binary mode, write gets bytes instead of text.
+    """
+
+    temp_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temp_name, 'wb') if binary else open(temp_name, 'w', encoding='utf-8') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def encode_record(book: dict, pad: bool = False) -> bytes:
+
+    """
+    Encode a book the same way as json.dump with indent=4 does as an element of the array.
+
+    With pad the status is followed by spaces up to STATUS_WIDTH bytes, which is still valid
+    JSON, so it can later be replaced in place by any other status.
+
+    :param book: The dictionary of the book.
+    :param pad: Reserve STATUS_WIDTH bytes for the status.
+    :return: The UTF-8 text of the book, starting with the line break before it.
+    """
+
+    status = encode_basestring(book['status'])
+    if pad:
+        status += ' ' * (STATUS_WIDTH - len(status.encode('utf-8')))
+    return (f'\n    {{\n        "id": {book["id"]},\n        "title": {encode_basestring(book["title"])},\n'
+            f'        "author": {encode_basestring(book["author"])},\n        "year": {book["year"]},\n'
+            f'        "status": {status}\n    }}').encode('utf-8')
+
+
+def status_slot(record: bytes) -> tuple[int, int]:
+
+    """
+    Find the status in an encoded book.
+
+    :param record: The book encoded by encode_record.
+    :return: The offset of the status in the record and its length with the padding.
+    """
+
+    start = record.rindex(b'"status": ') + len(b'"status": ')
+    return start, len(record) - len(b'\n    }') - start
+
+
+class Storage:
+
+    """
+    Base class of the places where a Library keeps its books.
+
+    A storage gives the saved books and the changes made after they were saved, persists every
+    single change and saves all books at once. It can also answer queries itself, so the
+    library does not need to read all books for them.
+    """
+
+    can_lookup: bool = False  # The storage finds saved books by their IDs with lookup
+    live_reads: bool = False  # Books read lazily with read_books include the changes committed meanwhile
+
+    def read_next_id(self) -> int:
+
+        """
+        Read the saved ID of the next added book.
+
+        :return: The saved ID, 1 if nothing is saved.
+        """
+
+        return 1
+
+    def read_header(self) -> dict[str, int]:
+
+        """
+        Read the header saved with the books without reading the books.
+
+        :return: The ID of the next added book in 'next_id' and, if they are known, the number of
+            books in 'count' and the largest ID in 'max_id', or an empty dictionary if there is no header.
+        """
+
+        return {}
+
+    def read_books(self) -> Iterator[Book] | None:
+
+        """
+        Read the saved books one at a time.
+
+        :return: An iterator over the books or None if there are no saved books.
+        """
+
+        return None
+
+    def has_changes(self) -> bool:
+
+        """
+        Check if there are changes that must be applied on top of the saved books.
+
+        :return: True if read_changes gives any records.
+        """
+
+        return False
+
+    def read_changes(self) -> Iterator[dict]:
+
+        """
+        Read the changes made after the books were saved.
+
+        :return: An iterator over the journal records of the changes.
+        """
+
+        return iter(())
+
+    def commit(self, record: dict) -> bool:
+
+        """
+        Persist a single change.
+
+        :param record: A journal record describing the change.
+        :return: True if the storage needs all books to be saved with save.
+        """
+
+        return True
+
+    def commit_many(self, records: list[dict]) -> bool:
+
+        """
+        Persist many changes at once.
+
+        :param records: Journal records describing the changes.
+        :return: True if the storage needs all books to be saved with save.
+        """
+
+        return True
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+
+        """
+        Save all books, replacing everything saved before.
+
+        :param books: All books of the library.
+        :param next_id: ID of the next added book.
+        """
+
+        raise NotImplementedError
+
+    def lookup(self, book_id: int) -> Book | None:
+
+        """
+        Find a saved book by its ID, only used if can_lookup is True.
+
+        :param book_id: The ID of the book.
+        :return: The book or None if there is no book with such ID.
+        """
+
+        raise NotImplementedError
+
+    def search(self, query: str) -> Iterator[Book] | None:
+
+        """
+        Find the saved books by title, author, or publication year.
+
+        :param query: The search query for title, author, or year.
+        :return: An iterator over the found books or None if the storage does not answer queries.
+        """
+
+        return None
+
+    def with_status(self, status: str) -> Iterator[Book] | None:
+
+        """
+        Find the saved books with the given status.
+
+        :param status: The status of the books.
+        :return: An iterator over the found books or None if the storage does not answer queries.
+        """
+
+        return None
+
+
+class JsonStorage(Storage):
+    def __init__(self, file_name: str, journal: bool = False, compact_threshold: int = 1000,
+                 differential: bool = False):
+
+        """
+        Initialize the storage of books in a JSON file.
+
+        By default every save replaces the file atomically, so a failure never leaves it damaged.
+        The differential save is much faster for single changes of a large file, but writes over
+        the file in place, so a failure in the middle of a write can leave it damaged.
+
+        :param file_name: The name of the JSON file.
+        :param journal: If True, every change is appended to a journal file instead of rewriting the JSON file.
+        :param compact_threshold: Number of journal records after which the journal is compacted into the JSON file.
+        :param differential: If True, without the journal a save writes only the changed parts of the
+            JSON file when it can, see save_changes.
+        """
+
+        self.file_name: str = resolve_path(file_name)  # Path of the JSON file
+        self.journal: bool = journal  # Append changes to the journal instead of rewriting the file
+        self.compact_threshold: int = compact_threshold  # Journal records before compaction
+        self.journal_name: str = self.file_name + JOURNAL_SUFFIX  # Path of the journal file
+        self.journal_records: int = 0  # Number of records currently in the journal
+        self.meta_name: str = self.file_name + META_SUFFIX  # Path of the metadata file
+        self.differential: bool = differential  # Write only the changed parts of the file
+        self.pending: list[dict] = []  # Changes committed since the last save
+        self.ids: array | None = None  # IDs of the saved books in the file order, None if the layout is unknown
+        self.status_offsets: array = array('q')  # Offsets of the statuses of the saved books in the file
+        self.status_widths: array = array('i')  # Lengths of the statuses with their padding
+        self.max_id: int = 0  # The largest ID of the saved books
+        self.header: dict[str, int] | None = None  # The header written by the last save
+        self.file_state: tuple[int, int] | None = None  # Size and modification time of the file the offsets are of
+        self.last_written: int = 0  # Number of bytes written by the last save
+
+    def read_next_id(self) -> int:
+        return self.read_header().get('next_id', 1)
+
+    def read_header(self) -> dict[str, int]:
+        try:
+            with open(self.meta_name, 'r', encoding='utf-8') as file:
+                header = json.load(file)
+            return {key: int(header[key]) for key in HEADER_KEYS if key in header} if 'next_id' in header else {}
+        except (json.JSONDecodeError, FileNotFoundError, TypeError, ValueError):
+            return {}
+
+    def read_books(self) -> Iterator[Book] | None:
+
+        """
+        Open the JSON file and read its books one at a time.
+
+        If the file does not exist or is not a valid JSON, a new file will be created.
+
+        :return: An iterator over the books or None if the file does not exist.
+        """
+
+        if not os.path.exists(os.path.dirname(self.file_name)):
+            print('Файл не найден. Новый файл с книгами будет создан в формате JSON!')
+            return None
+        try:
+            file = open(self.file_name, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            print('Файл не является форматом JSON. Новый файл с книгами будет создан в формате JSON!')
+            return None
+        return self.stream_books(file)
+
+    @staticmethod
+    def stream_books(file) -> Iterator[Book]:
+
+        """
+        Read books from an opened JSON file one at a time.
+
+        :param file: The opened JSON file, it is closed when all books are read.
+        :return: An iterator over the books of the file.
+        """
+
+        with file:
+            try:
+                for book in iter_json_array(file):
+                    yield Book(**book)
+                print('Файл с книгами найден и успешно загружен!')
+            except json.JSONDecodeError:
+                print('Файл не является форматом JSON. Новый файл с книгами будет создан в формате JSON!')
+
+    def has_changes(self) -> bool:
+        return os.path.exists(self.journal_name)
+
+    def read_changes(self) -> Iterator[dict]:
+
+        """
+        Read the records of the journal file.
+
+        Every record is one JSON object on its own line. Replaying is idempotent, so a journal
+        that was already compacted into the JSON file can safely be applied again. A torn last
+        line (the process died in the middle of a write) is discarded and cut from the file.
+
+        :return: An iterator over the journal records.
+        """
+
+        if not os.path.exists(self.journal_name):
+            return
+
+        valid_size = 0
+        with open(self.journal_name, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                yield record
+                self.journal_records += 1
+                valid_size += len(line)
+
+        if os.path.getsize(self.journal_name) != valid_size:
+            print('Журнал изменений повреждён, последняя неполная запись отброшена.')
+            with open(self.journal_name, 'r+b') as file:
+                file.truncate(valid_size)
+
+    def commit(self, record: dict) -> bool:
+
+        """
+        Persist a single change.
+
+        Without the journal the whole list of books must be saved to the JSON file. With the journal
+        the record is appended to the journal file, and the journal is compacted into the JSON
+        file once it grows to the compaction threshold.
+
+        :param record: A journal record describing the change.
+        :return: True if all books must be saved.
+        """
+
+        return self.commit_many([record])
+
+    def commit_many(self, records: list[dict]) -> bool:
+
+        """
+        Persist many changes at once with a single write to the journal.
+
+        :param records: Journal records describing the changes.
+        :return: True if all books must be saved.
+        """
+
+        if not self.journal or len(records) + self.journal_records >= self.compact_threshold:
+            if self.differential and not self.journal:
+                self.pending.extend(records)
+            return True
+
+        with open(self.journal_name, 'a', encoding='utf-8') as file:
+            file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+            file.flush()
+            os.fsync(file.fileno())
+        self.journal_records += len(records)
+        return False
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+
+        """
+        Save the list of books to the JSON file.
+
+        In the differential mode, if only the changes committed since the last save are new, they
+        are written over the old file with save_changes. Otherwise the file is replaced atomically,
+        so it is never left half-written, and the journal, which is already contained in the saved
+        file, is cleared afterwards. The next book ID is saved to the metadata file, so IDs of removed books are not
+        reused, together with the number of books and the largest ID, which are known before the
+        books are read.
+
+        :param books: All books of the library.
+        :param next_id: ID of the next added book.
+        """
+
+        if self.save_pending(next_id):
+            return
+        self.pending = []
+
+        ids, offsets, widths = array('q'), array('q'), array('i')
+
+        def write(file: BinaryIO) -> None:
+            position = file.write(b'[')
+            for book in books:
+                record = encode_record(book.to_dict(), self.differential)
+                if ids:
+                    position += file.write(b',')
+                start, width = status_slot(record)
+                ids.append(book.id)
+                offsets.append(position + start)
+                widths.append(width)
+                position += file.write(record)
+            file.write(b'\n]' if ids else b']')
+
+        self.file_state = None
+        write_atomically(self.file_name, write, binary=True)
+        self.remember_layout(ids, offsets, widths)
+        self.last_written = self.file_state[0]
+        self.header = None  # The metadata file is replaced together with the JSON file
+        self.write_header(next_id)
+
+        if os.path.exists(self.journal_name):
+            os.remove(self.journal_name)
+        self.journal_records = 0
+
+    def save_pending(self, next_id: int) -> bool:
+
+        """
+        Write the changes committed since the last save over the JSON file if it is possible.
+
+        :param next_id: ID of the next added book.
+        :return: True if the changes are written, False if all books must be saved with save.
+        """
+
+        if not self.pending or not self.save_changes(self.pending, next_id):
+            return False
+        self.pending = []
+        return True
+
+    def save_changes(self, records: list[dict], next_id: int) -> bool:
+
+        """
+        Write the changes committed since the last save over the JSON file instead of rewriting it.
+
+        A new status is written in place of the old one, in the space the padding reserves. Added
+        books with larger IDs than the saved ones are written over the closing bracket of the
+        array. Everything else, such as a removed book, changes the layout, and the file must be
+        rewritten as a whole. The writes are not atomic, the journal is still the way to survive
+        a failure in the middle of one.
+
+        :param records: Journal records describing the changes.
+        :param next_id: ID of the next added book.
+        :return: False if nothing was written and the file must be rewritten.
+        """
+
+        if not self.differential or self.journal or not self.read_layout():
+            return False
+        ids = self.ids
+        last_id = ids[-1] if ids else 0
+        patches: dict[int, bytes] = {}
+        added: dict[int, dict] = {}
+        for record in records:
+            match record.get('op'):
+                case 'add' if record['book']['id'] > last_id:
+                    last_id = record['book']['id']
+                    added[last_id] = dict(record['book'])
+                case 'status' if record['id'] in added:
+                    added[record['id']]['status'] = record['status']
+                case 'status':
+                    position = bisect_left(ids, record['id'])
+                    if position == len(ids) or ids[position] != record['id']:
+                        return False
+                    status = json.dumps(record['status'], ensure_ascii=False).encode('utf-8')
+                    if len(status) > self.status_widths[position]:
+                        return False
+                    patches[position] = status.ljust(self.status_widths[position])
+                case _:
+                    return False
+
+        size = self.file_state[0]
+        self.file_state = None
+        written = 0
+        with open(self.file_name, 'r+b') as file:
+            for position, status in sorted(patches.items()):
+                file.seek(self.status_offsets[position])
+                written += file.write(status)
+            if added:
+                position = tail = size - len(b'\n]') if ids else len(b'[')
+                file.seek(position)
+                for book in added.values():
+                    record = encode_record(book, pad=True)
+                    if ids:
+                        position += file.write(b',')
+                    start, width = status_slot(record)
+                    ids.append(book['id'])
+                    self.status_offsets.append(position + start)
+                    self.status_widths.append(width)
+                    position += file.write(record)
+                written += position - tail
+                written += file.write(b'\n]')
+            file.flush()
+            os.fsync(file.fileno())
+        stat = os.stat(self.file_name)
+        self.file_state = (stat.st_size, stat.st_mtime_ns)
+        self.max_id = max(self.max_id, last_id)
+        self.last_written = written
+        self.write_header(next_id)
+        return True
+
+    def remember_layout(self, ids: array, offsets: array, widths: array) -> None:
+
+        """
+        Keep the offsets of the statuses of the written file for the next save.
+
+        :param ids: IDs of the books in the file order.
+        :param offsets: Offsets of their statuses.
+        :param widths: Lengths of their statuses with the padding.
+        """
+
+        stat = os.stat(self.file_name)
+        self.file_state = (stat.st_size, stat.st_mtime_ns)
+        sorted_ids = all(ids[position - 1] < ids[position] for position in range(1, len(ids)))
+        self.ids = ids if sorted_ids else None  # Unsorted IDs cannot be found with bisect
+        self.max_id = max(ids, default=0)
+        self.status_offsets, self.status_widths = offsets, widths
+
+    def read_layout(self) -> bool:
+
+        """
+        Find the offsets of the statuses in the JSON file if they are not known.
+
+        The offsets are kept from the last save while the file is not changed by anybody else, and
+        otherwise the file is read once and must have exactly the layout json.dump gives with indent=4.
+
+        :return: False if the file has another layout or does not exist.
+        """
+
+        try:
+            stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return False
+        if self.file_state == (stat.st_size, stat.st_mtime_ns):
+            return self.ids is not None
+        with open(self.file_name, 'rb') as file:
+            data = file.read()
+        ids, offsets, widths = array('q'), array('q'), array('i')
+        end = 1
+        for match in RECORD_PATTERN.finditer(data):
+            if match.start() != end or data[end - 1] != (ord(',') if ids else ord('[')):
+                return False
+            ids.append(int(match[1]))
+            offsets.append(match.start(2))
+            widths.append(match.end(2) - match.start(2))
+            end = match.end() + 1  # The comma after the book
+        if (data[end - 1:] != b'\n]') if ids else (data != b'[]'):
+            return False
+        self.remember_layout(ids, offsets, widths)
+        return self.ids is not None
+
+    def lookup(self, book_id: int) -> Book | None:
+
+        """
+        Find a saved book by its ID with the changes in the journal applied.
+
+        With the offsets of the statuses, see read_layout, only the record of the book is read,
+        because every record ends right after its status and starts after the previous one. A file
+        with another layout is read as a whole.
+
+        :param book_id: The ID of the book.
+        :return: The book or None if there is no book with such ID.
+        """
+
+        book = None
+        if self.read_layout():
+            position = bisect_left(self.ids, book_id)
+            if position < len(self.ids) and self.ids[position] == book_id:
+                ends = [self.status_offsets[index] + self.status_widths[index] + len(b'\n    }')
+                        for index in (position - 1, position) if index >= 0]
+                start = ends[0] + len(b',') if position else len(b'[')
+                with open(self.file_name, 'rb') as file:
+                    file.seek(start)
+                    book = Book(**json.loads(file.read(ends[-1] - start)))
+        elif os.path.exists(self.file_name):
+            with open(self.file_name, 'r', encoding='utf-8') as file:
+                book = next((Book(**book) for book in iter_json_array(file) if book['id'] == book_id), None)
+
+        journal_records = self.journal_records  # read_changes counts the records it reads
+        for record in self.read_changes():
+            match record.get('op'):
+                case 'add' if record['book']['id'] == book_id:
+                    book = Book(**record['book'])
+                case 'remove' if record['id'] == book_id:
+                    book = None
+                case 'status' if record['id'] == book_id and book is not None:
+                    book.status = record['status']
+        self.journal_records = journal_records
+        return book
+
+    def write_header(self, next_id: int) -> None:
+        header = {'next_id': next_id, 'count': len(self.status_offsets), 'max_id': self.max_id}
+        if header != self.header:  # A status change keeps the header
+            write_atomically(self.meta_name, lambda file: json.dump(header, file))
+            self.header = header
+
+
+class SqliteStorage(Storage):
+    can_lookup = True
+    live_reads = True
+
+    def __init__(self, file_name: str):
+
+        """
+        Initialize the storage of books in an SQLite database.
+
+        Every change is one short transaction touching a single row. Books are kept in the
+        order they were added, with indexes on the ID, the year and the status, and an FTS5
+        trigram index over titles and authors if the SQLite build supports it.
+
+        :param file_name: The name of the database file.
+        """
+
+        import sqlite3  # Only here, most libraries never open a database and it is slow to import
+
+        self.file_name: str = resolve_path(file_name)  # Path of the database file
+        self.connection: sqlite3.Connection = sqlite3.connect(self.file_name, check_same_thread=False)
+        self.connection.create_function('py_lower', 1, lambda text: text.lower(), deterministic=True)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS books (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id INTEGER NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    author TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    status TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS books_year ON books (year);
+                CREATE INDEX IF NOT EXISTS books_status ON books (status);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            ''')
+        self.fts: bool = self.create_fts()  # The FTS5 index is available
+
+    def create_fts(self) -> bool:
+
+        """
+        Create the FTS5 trigram index over titles and authors kept in sync by triggers.
+
+        :return: False if the SQLite build has no FTS5 or no trigram tokenizer.
+        """
+
+        import sqlite3
+
+        try:
+            with self.connection:
+                exists = self.connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'books_fts'").fetchone() is not None
+                self.connection.executescript('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                        title, author, content='books', content_rowid='seq', tokenize='trigram');
+                    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+                        INSERT INTO books_fts (rowid, title, author) VALUES (new.seq, new.title, new.author);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+                        INSERT INTO books_fts (books_fts, rowid, title, author)
+                        VALUES ('delete', old.seq, old.title, old.author);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+                        INSERT INTO books_fts (books_fts, rowid, title, author)
+                        VALUES ('delete', old.seq, old.title, old.author);
+                        INSERT INTO books_fts (rowid, title, author) VALUES (new.seq, new.title, new.author);
+                    END;
+                ''')
+                if not exists:
+                    self.connection.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def read_next_id(self) -> int:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+        return 1 if row is None else row[0]
+
+    def read_header(self) -> dict[str, int]:
+        count, max_id = self.connection.execute('SELECT count(*), coalesce(max(id), 0) FROM books').fetchone()
+        return {'next_id': self.read_next_id(), 'count': count, 'max_id': max_id}
+
+    def rows(self, sql: str, parameters: tuple = ()) -> Iterator[Book]:
+
+        """
+        Run a query over the books table and give its rows as books.
+
+        :param sql: The query selecting id, title, author, year and status.
+        :param parameters: Parameters of the query.
+        :return: An iterator over the books.
+        """
+
+        for row in self.connection.execute(sql, parameters):
+            yield Book(*row)
+
+    def read_books(self) -> Iterator[Book] | None:
+
+        """
+        Read the books one page at a time in the order they were added.
+
+        Every page is a short query continuing after the last read row, so the changes made while
+        the books are read are seen: removed books are skipped and added books come at the end.
+
+        :return: An iterator over the books.
+        """
+
+        last = 0
+        while True:
+            rows = self.connection.execute('SELECT seq, id, title, author, year, status FROM books WHERE seq > ? '
+                                           'ORDER BY seq LIMIT ?', (last, PAGE_ROWS)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for row in rows:
+                yield Book(*row[1:])
+
+    def lookup(self, book_id: int) -> Book | None:
+        return next(self.rows('SELECT id, title, author, year, status FROM books WHERE id = ?', (book_id,)), None)
+
+    def commit(self, record: dict) -> bool:
+
+        """
+        Persist a single change in its own transaction.
+
+        :param record: A journal record describing the change.
+        :return: False, the other books are never saved again.
+        """
+
+        return self.commit_many([record])
+
+    def commit_many(self, records: list[dict]) -> bool:
+
+        """
+        Persist many changes in one transaction.
+
+        :param records: Journal records describing the changes.
+        :return: False, the other books are never saved again.
+        """
+
+        with self.connection:
+            for record in records:
+                match record.get('op'):
+                    case 'add':
+                        book = record['book']
+                        self.connection.execute(
+                            'INSERT INTO books (id, title, author, year, status) VALUES (?, ?, ?, ?, ?) '
+                            'ON CONFLICT (id) DO UPDATE SET title = excluded.title, author = excluded.author, '
+                            'year = excluded.year, status = excluded.status',
+                            (book['id'], book['title'], book['author'], book['year'], book['status']))
+                        self.connection.execute(
+                            "INSERT INTO meta (key, value) VALUES ('next_id', ?) "
+                            "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)", (book['id'] + 1,))
+                    case 'remove':
+                        self.connection.execute('DELETE FROM books WHERE id = ?', (record['id'],))
+                    case 'status':
+                        self.connection.execute('UPDATE books SET status = ? WHERE id = ?',
+                                                (record['status'], record['id']))
+        return False
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM books')
+            self.connection.executemany(
+                'INSERT INTO books (id, title, author, year, status) VALUES (?, ?, ?, ?, ?)',
+                ((book.id, book.title, book.author, book.year, book.status) for book in books))
+            self.connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('next_id', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (next_id,))
+
+    def search(self, query: str) -> Iterator[Book] | None:
+
+        """
+        Find books by title, author, or publication year in the database.
+
+        The same case-insensitive substring test as in the Library is done by SQLite with the
+        Python lowercasing, after the FTS5 index narrowed the candidates down when possible.
+
+        :param query: The search query for title, author, or year.
+        :return: An iterator over the found books in the order they were added.
+        """
+
+        lowered = query.lower()
+        matches = '(instr(py_lower(title), ?) OR instr(py_lower(author), ?))'
+        parameters: tuple = (lowered, lowered)
+        if self.fts and len(lowered) >= 3:
+            matches = f"(seq IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?) AND {matches})"
+            parameters = ('"' + query.replace('"', '""') + '"',) + parameters
+        if query.isdigit() and str(int(query)) == query:
+            matches += ' OR year = ?'
+            parameters += (int(query),)
+        return self.rows(f'SELECT id, title, author, year, status FROM books WHERE {matches} ORDER BY seq',
+                         parameters)
+
+    def with_status(self, status: str) -> Iterator[Book] | None:
+        return self.rows('SELECT id, title, author, year, status FROM books WHERE status = ? ORDER BY seq',
+                         (status,))
+
+
+class BufferedStorage(Storage):
+    def __init__(self, storage: Storage):
+
+        """
+        Initialize a storage that keeps changes in memory until they are flushed.
+
+        Reading is passed to the wrapped storage. Committed changes are only collected, and
+        flush persists all of them at once, so many changes cost one write.
+
+        :param storage: The storage where the changes are persisted.
+        """
+
+        self.storage: Storage = storage  # The wrapped storage
+        self.records: list[dict] = []  # Changes not persisted yet
+
+    @property
+    def can_lookup(self) -> bool:
+        return self.storage.can_lookup
+
+    def read_next_id(self) -> int:
+        return self.storage.read_next_id()
+
+    def read_header(self) -> dict[str, int]:
+        return self.storage.read_header()
+
+    def read_books(self) -> Iterator[Book] | None:
+        return self.storage.read_books()
+
+    def has_changes(self) -> bool:
+        return self.storage.has_changes()
+
+    def read_changes(self) -> Iterator[dict]:
+        return self.storage.read_changes()
+
+    def commit(self, record: dict) -> bool:
+        self.records.append(record)
+        return False
+
+    def commit_many(self, records: list[dict]) -> bool:
+        self.records.extend(records)
+        return False
+
+    def save(self, books: Iterable[Book], next_id: int) -> None:
+        self.records = []
+        self.storage.save(books, next_id)
+
+    def flush(self, books: Iterable[Book], next_id: int) -> int:
+
+        """
+        Persist all collected changes in the wrapped storage.
+
+        :param books: All books of the library, saved if the wrapped storage needs it.
+        :param next_id: ID of the next added book.
+        :return: Number of persisted changes.
+        """
+
+        records = self.take()
+        if records and self.storage.commit_many(records):
+            self.storage.save(books, next_id)
+        return len(records)
+
+    def take(self) -> list[dict]:
+
+        """
+        Take the collected changes out of the buffer.
+
+        :return: The changes in the order they were committed.
+        """
+
+        records, self.records = self.records, []
+        return records
+
+    def lookup(self, book_id: int) -> Book | None:
+        return self.storage.lookup(book_id)
+
+    def search(self, query: str) -> Iterator[Book] | None:
+        return self.storage.search(query)
+
+    def with_status(self, status: str) -> Iterator[Book] | None:
+        return self.storage.with_status(status)
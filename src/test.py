@@ -1,6 +1,24 @@
+import analytics
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
+from analytics import group_books
+from book import Book
+from book_store import BookStore
+from index import BookIndex, edit_distance, words
+from json_stream import iter_json_array
 from library import Library
+from snapshot import SnapshotStorage, json_to_snapshot, snapshot_to_json
+from server import LibraryServer
+from sharding import ShardedStorage, rebalance
+from storage import BufferedStorage, JsonStorage, SqliteStorage
 from main import main
 
 
@@ -78,6 +96,21 @@ class TestLibraryConsoleApp(unittest.TestCase):
             main()
             mock_print.assert_any_call("Найденные книги:\n...")  # Check output
 
+    @patch('builtins.input', side_effect=['3', 'Булгакв', '0'])  # Simulate input
+    @patch('main.Library', return_value=None)
+    def test_find_similar_books(self, mock_library, mock_input):
+
+        """
+            Test that the search with a typo shows the similar books when nothing is found.
+        """
+
+        self.library_mock.find_books.return_value = "Книги не найдены."
+        self.library_mock.find_similar_books.return_value = "Похожие книги:\n..."
+        mock_library.return_value = self.library_mock
+        with patch('builtins.print') as mock_print:
+            main()
+            mock_print.assert_any_call("Похожие книги:\n...")  # Check output
+
     @patch('builtins.input', side_effect=['4', '0'])  # Simulate input
     @patch('main.Library', return_value=None)
     def test_display_books(self, mock_library, mock_input):
@@ -94,6 +127,25 @@ class TestLibraryConsoleApp(unittest.TestCase):
             main()
             mock_print.assert_any_call("Все книги в библиотеке:\n...")  # Check output
 
+    @patch('builtins.input', side_effect=['4', '6', '0'])  # Simulate input
+    @patch('main.Library', return_value=None)
+    def test_display_next_page(self, mock_library, mock_input):
+
+        """
+            Test the paging through all books.
+
+            This test simulates user input for displaying books and going to the next page, and
+            verifies that the pages are requested with the right offsets.
+        """
+
+        self.library_mock.display_books.side_effect = lambda offset, limit: f"page {offset}"
+        mock_library.return_value = self.library_mock
+        with patch('builtins.print') as mock_print:
+            main()
+            mock_print.assert_any_call("page 0")
+            mock_print.assert_any_call("page 20")
+            mock_print.assert_any_call("6. Следующая страница.")
+
     @patch('builtins.input', side_effect=['5', '0'])  # Simulate input
     @patch('main.Library', return_value=None)
     def test_change_status(self, mock_library, mock_input):
@@ -128,5 +180,867 @@ class TestLibraryConsoleApp(unittest.TestCase):
             self.assertGreater(mock_print.call_count, 0)  # Ensure print was called
 
 
+class TestLibraryStorage(unittest.TestCase):
+
+    """
+        Unit test class for testing how the Library stores books on disk.
+
+        These tests run the real Library against a temporary JSON file.
+    """
+
+    def setUp(self):
+
+        """
+            Create a temporary directory with a JSON file of two books.
+        """
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, 'library.json')
+        with open(self.file_name, 'w', encoding='utf-8') as file:
+            json.dump([
+                {'id': 1, 'title': 'Мастер и Маргарита', 'author': 'Михаил Булгаков', 'year': 1940, 'status': 'выдана'},
+                {'id': 2, 'title': 'Собачье сердце', 'author': 'Михаил Булгаков', 'year': 1925, 'status': 'в наличии'},
+            ], file, ensure_ascii=False)
+
+    def tearDown(self):
+
+        """
+            Remove the temporary directory.
+        """
+
+        self.temp_dir.cleanup()
+
+    def open_library(self, **kwargs) -> Library:
+
+        """
+            Open the Library on the temporary file without printing anything.
+        """
+
+        with patch('builtins.print'):
+            return Library(self.file_name, **kwargs)
+
+    @patch('builtins.input', side_effect=['Мёртвые души', 'Николай Гоголь', '1842'])
+    def test_journal_replay(self, mock_input):
+
+        """
+            Test that journal records are replayed on startup and a torn last line is discarded.
+        """
+
+        library = self.open_library(journal=True)
+        with patch('builtins.print'):
+            library.add_book()
+            library.remove_book('1')
+
+        with open(library.storage.journal_name, 'a', encoding='utf-8') as file:
+            file.write('{"op": "remove", "id"')  # Simulate a crash in the middle of a write
+
+        library = self.open_library(journal=True)
+        self.assertEqual(list(library.books), [2, 3])
+        self.assertEqual(library.storage.journal_records, 2)
+        with open(library.storage.journal_name, 'rb') as file:
+            self.assertTrue(file.read().endswith(b'\n'))
+
+        library.save_books()
+        self.assertFalse(os.path.exists(library.storage.journal_name))
+        self.assertEqual(list(self.open_library().books), [2, 3])
+
+    def test_ids_not_reused(self):
+
+        """
+            Test that the ID of a removed book is not given to a new book, also after a restart.
+        """
+
+        for journal in (False, True):
+            with self.subTest(journal=journal), patch('builtins.input', side_effect=[
+                    'Мёртвые души', 'Николай Гоголь', '1842', 'Нос', 'Николай Гоголь', '1836']):
+                self.tearDown()
+                self.setUp()
+                library = self.open_library(journal=journal)
+                with patch('builtins.print'):
+                    library.add_book()
+                self.assertTrue(library.delete_book(3))
+                self.assertFalse(library.delete_book(3))
+
+                library = self.open_library(journal=journal)
+                with patch('builtins.print'):
+                    library.add_book()
+                self.assertEqual(list(library.books), [1, 2, 4])
+                self.assertTrue(library.set_status(4, 'выдана'))
+                self.assertEqual(library.get_book(4).status, 'выдана')
+
+    def test_compact_store(self):
+
+        """
+            Test that the columnar store gives the same results as the dictionary of books.
+        """
+
+        library = self.open_library()
+        compact = self.open_library(compact=True)
+        self.assertIsInstance(compact.books, BookStore)
+        self.assertIsNone(compact.index)  # Built by the first search only
+        for current in (library, compact):
+            current.put_book(Book(7, 'Нос', 'Николай Гоголь', 1836))
+            current.delete_book(1)
+            current.set_status(7, 'выдана')
+
+        self.assertEqual(compact.display_books(), library.display_books())
+        self.assertEqual(compact.find_books('гоголь'), library.find_books('гоголь'))
+        self.assertEqual([book.to_dict() for book in compact.books.values()],
+                         [book.to_dict() for book in library.books.values()])
+        self.assertEqual(compact.get_book(7).status, 'выдана')
+        self.assertIsNone(compact.get_book(1))
+
+        kept = compact.get_book(7)
+        found = compact.query(status='выдана')
+        generation = compact.books.generation
+        for book_id in range(8, 14):
+            compact.books[book_id] = Book(book_id, f'Книга {book_id}', 'Автор', 1900)
+        for book_id in range(8, 14):
+            compact.delete_book(book_id)  # More removed slots than books, they are reclaimed
+        self.assertGreater(compact.books.generation, generation)
+        self.assertEqual(kept.to_dict(), {'id': 7, 'title': 'Нос', 'author': 'Николай Гоголь', 'year': 1836,
+                                          'status': 'выдана'})
+        self.assertEqual([book.id for book in found], [7])
+        kept.status = 'в наличии'
+        self.assertEqual(compact.books[7].status, 'в наличии')
+        removed = compact.get_book(2)
+        compact.delete_book(2)
+        compact.books.reclaim()
+        with self.assertRaises(KeyError):
+            removed.title
+
+    def test_lazy_loading(self):
+
+        """
+            Test that the lazy mode reads books only as far as they are needed.
+        """
+
+        library = self.open_library(lazy=True)
+        self.assertEqual(len(library.books), 0)
+        self.assertEqual(next(library.iter_books()).id, 1)
+        self.assertEqual(len(library.books), 2)  # Books are read in batches
+        self.assertEqual(library.display_books(), self.open_library().display_books())
+        self.assertIsNotNone(self.open_library(lazy=True).get_book(2))
+
+    def test_iter_json_array(self):
+
+        """
+            Test that the streaming parser gives the same elements as json.load for any chunk size.
+        """
+
+        data = [{'id': 1, 'title': 'a, [b]', 'n': 12345}, [], 1.5e10, 'x"y', None, True, 678]
+        text = ' [ ' + ' ,\n'.join(json.dumps(item) for item in data) + ' ] \n'
+        for chunk_size in (1, 2, 3, 7, 100):
+            with tempfile.TemporaryFile('w+', encoding='utf-8') as file:
+                file.write(text)
+                file.seek(0)
+                self.assertEqual(list(iter_json_array(file, chunk_size)), data)
+
+        for text in ('', '{}', '[1,', '[1 2]', '[1] x'):
+            with tempfile.TemporaryFile('w+', encoding='utf-8') as file:
+                file.write(text)
+                file.seek(0)
+                with self.assertRaises(json.JSONDecodeError):
+                    list(iter_json_array(file, 2))
+
+    def test_bulk_import_export(self):
+
+        """
+            Test that bulk import validates books, persists them and exports them in every format.
+        """
+
+        library = self.open_library(journal=True)
+        answer = library.add_books([
+            {'title': ' Нос ', 'author': 'Николай Гоголь', 'year': 1836},
+            {'title': '', 'author': 'Без названия', 'year': '1900'},
+            {'title': 'Шинель', 'author': 'Николай Гоголь', 'year': '999'},
+            {'title': 'Ревизор', 'author': 'Николай Гоголь', 'year': '1836', 'status': 'выдана'},
+        ], batch_size=3)
+        self.assertTrue(answer.startswith("Добавлено книг: 2, пропущено: 2, за "), answer)
+        self.assertEqual(self.open_library().get_book(4).to_dict(), {
+            'id': 4, 'title': 'Ревизор', 'author': 'Николай Гоголь', 'year': 1836, 'status': 'выдана'})
+
+        for file_format in ('json', 'jsonl', 'csv'):
+            file_name = os.path.join(self.temp_dir.name, 'export.' + file_format)
+            self.assertEqual(library.export(file_name), "Экспортировано книг: 4.")
+            if file_format != 'json':
+                with patch('builtins.print'):
+                    imported = Library(os.path.join(self.temp_dir.name, file_format + '.json'))
+                getattr(imported, 'import_' + file_format)(file_name)
+                self.assertEqual([book.to_dict() for book in imported.books.values()],
+                                 [book.to_dict() for book in library.books.values()])
+
+    def test_binary_snapshot(self):
+
+        """
+            Test the conversion to the binary snapshot, lookups without loading and the conversion back.
+        """
+
+        snapshot_name = os.path.join(self.temp_dir.name, 'library.snap')
+        self.assertEqual(json_to_snapshot(self.file_name, snapshot_name), 2)
+
+        library = self.open_library(storage=SnapshotStorage(snapshot_name), lazy=True)
+        self.assertEqual(library.get_book(2).title, 'Собачье сердце')
+        self.assertIsNone(library.get_book(3))
+        self.assertEqual(len(library.books), 0)  # Nothing was read for the lookups
+        self.assertEqual(library.display_books(), self.open_library().display_books())
+        library.set_status(1, 'в наличии')
+        library.save_books()
+
+        library = self.open_library(storage=SnapshotStorage(snapshot_name), lazy=True)
+        self.assertEqual(library.get_book(1).status, 'в наличии')
+        json_name = os.path.join(self.temp_dir.name, 'converted.json')
+        self.assertEqual(snapshot_to_json(snapshot_name, json_name), 2)
+        with patch('builtins.print'):
+            converted = Library(json_name)
+        self.assertEqual(converted.display_books(), library.display_books())
+
+    def test_sqlite_storage(self):
+
+        """
+            Test that the SQLite storage keeps every change and answers searches like the index.
+        """
+
+        json_library = self.open_library()
+        database_name = os.path.join(self.temp_dir.name, 'library.db')
+        library = self.open_library(storage=SqliteStorage(database_name))
+        for book in json_library.books.values():
+            library.put_book(book)
+        library.save_books()
+        library.commit({'op': 'add', 'book': Book(3, 'Нос', 'Николай Гоголь', 1836).to_dict()})
+        library.delete_book(1)
+        library.set_status(2, 'выдана')
+        library.storage.connection.close()
+
+        library = self.open_library(storage=SqliteStorage(database_name))
+        lazy_library = self.open_library(storage=SqliteStorage(database_name), lazy=True)
+        self.assertEqual([book.to_dict() for book in lazy_library.books_with_status('выдана')],
+                         [{'id': 2, 'title': 'Собачье сердце', 'author': 'Михаил Булгаков',
+                           'year': 1925, 'status': 'выдана'}])
+        for query in ('', 'со', 'ГОГОЛЬ', 'ь с', '1836', '18', 'нет такой'):
+            self.assertEqual([book.to_dict() for book in lazy_library.match_books(query)],
+                             [book.to_dict() for book in library.match_books(query)], query)
+        self.assertEqual(len(lazy_library.books), 0)  # Everything was answered by SQLite
+        self.assertEqual(library.next_id, 4)
+
+        self.assertTrue(lazy_library.set_status(3, 'выдана'))
+        self.assertTrue(lazy_library.delete_book(2))
+        self.assertFalse(lazy_library.set_status(2, 'в наличии'))
+        self.assertEqual(lazy_library.new_book('Шинель', 'Николай Гоголь', '1842').id, 4)
+        self.assertEqual(len(lazy_library.books), 0)  # Every change was a single row in SQLite
+        self.assertEqual(lazy_library.get_book(3).status, 'выдана')
+        lazy_library.load_more(1)  # The page with the book 4 is read from SQLite before it is changed
+        self.assertTrue(lazy_library.set_status(4, 'выдана'))
+        self.assertEqual([book.to_dict() for book in lazy_library.iter_books()],
+                         [{'id': 3, 'title': 'Нос', 'author': 'Николай Гоголь', 'year': 1836, 'status': 'выдана'},
+                          {'id': 4, 'title': 'Шинель', 'author': 'Николай Гоголь', 'year': 1842, 'status': 'выдана'}])
+        library.storage.connection.close()
+        lazy_library.storage.connection.close()
+
+    def test_server(self):
+
+        """
+            Test the network service: answers to every operation and the batched flush to the file.
+        """
+
+        async def scenario() -> list[dict]:
+            storage = BufferedStorage(JsonStorage(self.file_name, journal=True))
+            service = LibraryServer(self.open_library(storage=storage), flush_interval=60)
+            server = await service.start(port=0)
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            answers = []
+            for request in ({'op': 'add', 'title': 'Нос', 'author': 'Николай Гоголь', 'year': '1836'},
+                            {'op': 'add', 'title': '', 'author': 'Николай Гоголь', 'year': '1836'},
+                            {'op': 'status', 'id': 3, 'status': 'выдана'},
+                            {'op': 'remove', 'id': 1},
+                            {'op': 'find', 'query': 'гоголь'},
+                            {'op': 'display', 'offset': 1, 'limit': 1},
+                            {'op': 'get', 'id': 1},
+                            {'op': 'fly'}):
+                writer.write(json.dumps(request).encode('utf-8') + b'\n')
+                answers.append(json.loads(await reader.readline()))
+            self.assertEqual(len(storage.records), 3)  # Nothing is written until the flush
+            writer.close()
+            await service.close()
+            return answers
+
+        nose = {'id': 3, 'title': 'Нос', 'author': 'Николай Гоголь', 'year': 1836, 'status': 'выдана'}
+        answers = asyncio.run(scenario())
+        self.assertEqual(answers[:7], [
+            {'ok': True, 'result': dict(nose, status='в наличии')},
+            {'ok': False, 'error': 'Название книги не может быть пустым!'},
+            {'ok': True, 'result': True},
+            {'ok': True, 'result': True},
+            {'ok': True, 'result': [nose]},
+            {'ok': True, 'result': [nose]},
+            {'ok': True, 'result': None},
+        ])
+        self.assertFalse(answers[7]['ok'])
+        self.assertEqual(list(self.open_library().books), [2, 3])
+
+    def test_write_behind(self):
+
+        """
+            Test that the write-behind mode persists the changes on flush, on the threshold and on close.
+        """
+
+        library = self.open_library(write_behind=True, flush_interval=60, flush_threshold=3)
+        self.assertTrue(library.set_status(1, 'в наличии'))
+        self.assertEqual(self.open_library().get_book(1).status, 'выдана')  # Not written yet
+        self.assertEqual(library.flush(), 1)
+        self.assertEqual(self.open_library().get_book(1).status, 'в наличии')
+        self.assertEqual(library.flush(), 0)
+
+        for status in ('в наличии', 'выдана', 'в наличии'):  # The third change wakes the flusher up
+            library.set_status(2, status)
+        for _ in range(100):
+            if not library.storage.records:
+                break
+            time.sleep(0.01)
+        self.assertEqual(library.storage.records, [])
+
+        with library:
+            library.new_book('Нос', 'Николай Гоголь', '1836')
+        self.assertIsNone(library.flusher)
+        self.assertEqual(list(self.open_library().books), [1, 2, 3])
+        self.assertEqual([name for name in os.listdir(self.temp_dir.name) if name.endswith('.tmp')], [])
+
+        errors = []
+
+        def save_concurrently(storage: JsonStorage) -> None:
+            try:
+                for _ in range(20):
+                    storage.save(library.books.values(), library.next_id)
+            except OSError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=save_concurrently, args=(JsonStorage(self.file_name),)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(list(self.open_library().books), [1, 2, 3])  # No writer replaced the file with a torn one
+        self.assertEqual([name for name in os.listdir(self.temp_dir.name) if name.endswith('.tmp')], [])
+
+    def test_thread_safe_stress(self):
+
+        """
+            Test that a thread-safe library stays consistent under mixed operations from many threads.
+        """
+
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                library = self.open_library(journal=True, thread_safe=True, compact=compact)
+                library.add_books({'title': f'Книга {i}', 'author': f'Автор {i % 7}', 'year': 1900 + i % 100}
+                                  for i in range(200))
+                added, removed, errors = [], [], []
+
+                def worker(seed: int) -> None:
+                    generator = random.Random(seed)
+                    try:
+                        for _ in range(300):
+                            book_id = generator.randint(1, library.next_id)
+                            match generator.randrange(6):
+                                case 0:
+                                    added.append(library.new_book(f'Новая {seed}', 'Поток', 2000).id)
+                                case 1:
+                                    if library.delete_book(book_id):
+                                        removed.append(book_id)
+                                case 2:
+                                    library.set_status(book_id, generator.choice(['в наличии', 'выдана']))
+                                case 3:
+                                    book = library.get_book(book_id)
+                                    self.assertTrue(book is None or book.id == book_id)
+                                case 4:
+                                    library.find_books(f'Автор {seed % 7}', 0, 20)
+                                case 5:
+                                    library.display_books(generator.randrange(200), 20)
+                    except Exception as error:
+                        errors.append(error)
+
+                threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                self.assertEqual(errors, [])
+                self.assertEqual(len(set(added)), len(added))  # No ID was given twice
+                self.assertEqual(len(set(removed)), len(removed))  # No book was removed twice
+                ids = list(library.books)
+                self.assertEqual(len(ids), 2 + 200 + len(added) - len(removed))
+                self.assertGreater(library.next_id, max(ids))
+                for book in library.books.values():
+                    self.assertIn(book.id, [found.id for found in library.ensure_index().search(book.title)])
+                self.assertEqual([book.to_dict() for book in self.open_library().books.values()],
+                                 [book.to_dict() for book in library.books.values()])
+                self.tearDown()
+                self.setUp()
+
+    def test_query_cache(self):
+
+        """
+            Test that the search results are cached and that the changes drop only the entries they affect.
+        """
+
+        library = self.open_library()
+        cache = library.cache
+        page = library.find_books('булгаков')
+        self.assertEqual(library.find_books('булгаков'), page)
+        library.find_books('1925')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        library.new_book('Нос', 'Николай Гоголь', '1836')  # Matches none of the queries
+        self.assertEqual(list(cache.entries), ['булгаков', '1925'])
+        library.set_status(2, 'выдана')  # The IDs stay, the rendered pages are dropped
+        self.assertEqual(cache.entries['1925'].ids, [2])
+        self.assertEqual(cache.entries['булгаков'].pages, {})
+        self.assertIn('выдана', library.find_books('1925'))
+        library.delete_book(1)
+        self.assertEqual(list(cache.entries), ['1925'])
+        library.new_book('Записки юного врача', 'Михаил Булгаков', '1925')
+        self.assertEqual(list(cache.entries), [])
+        self.assertEqual([book.id for book in library.match_books('1925')], [2, 4])
+
+    def test_metrics(self):
+
+        """
+            Test the counters, the histograms and the profile of the operations.
+        """
+
+        self.assertEqual(self.open_library().stats(), {
+            'books': 2, 'metrics_enabled': False, 'cache': {'hits': 0, 'misses': 0, 'hit_rate': 0.0}})
+
+        library = self.open_library(metrics=True)
+        library.find_books('булгаков')
+        library.find_books('булгаков')
+        profile_file = os.path.join(self.temp_dir.name, 'library.prof')
+        library.metrics.profile_file = profile_file
+        library.set_status(2, 'выдана')
+        stats = library.stats()
+        self.assertEqual(stats['cache'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual({name: operation['count'] for name, operation in stats['operations'].items()},
+                         {'load_books': 1, 'find_books': 2, 'save_books': 1, 'set_status': 1})
+        self.assertEqual(sum(stats['operations']['find_books']['histogram'].values()), 2)
+        self.assertEqual(stats['events']['saves'], 1)
+        self.assertEqual(stats['events']['bytes_written'], os.path.getsize(self.file_name))
+        self.assertEqual(stats['events']['searches_by_index'], 1)  # The second page came from the cache
+        self.assertTrue(os.path.exists(profile_file))
+        self.assertIn('set_status', library.metrics.last_profile)
+
+    def test_parallel_scan(self):
+
+        """
+            Test that the scan in worker processes finds the same books as the index and sees the changes.
+        """
+
+        with self.open_library(workers=2) as library:
+            for title in ('Нос', 'Шинель', 'Ревизор'):
+                library.new_book(title, 'Николай Гоголь', '1836')
+            self.assertEqual(library.scan_books('гоголь'), list(library.match_books('гоголь')))
+            library.delete_book(4)
+            library.set_status(3, 'выдана')
+            library.new_book('Игроки', 'Николай Гоголь', '1842')
+            self.assertEqual([book.id for book in library.scan_books('гоголь')], [3, 5, 6])
+            self.assertEqual([book.id for book in library.scan(is_issued)], [1, 3])
+            self.assertEqual([book.to_dict() for book in library.scan(is_issued)],
+                             [book.to_dict() for book in self.open_library().scan(is_issued)])
+
+    def test_background_loading(self):
+
+        """
+            Test that a book is added from the saved header before the background load finishes.
+        """
+
+        self.open_library().save_books()  # Write the header
+        loaded = threading.Event()
+        read_books = JsonStorage.read_books
+
+        def read_books_later(storage: JsonStorage):
+            loaded.wait()
+            return read_books(storage)
+
+        with patch.object(JsonStorage, 'read_books', autospec=True, side_effect=read_books_later), \
+                patch('builtins.print'):
+            library = Library(self.file_name, background=True)
+            self.assertEqual(library.header, {'next_id': 3, 'count': 2, 'max_id': 2})
+            self.assertEqual(library.new_book('Нос', 'Николай Гоголь', '1836').id, 3)
+            self.assertFalse(library.ready.is_set())
+            self.assertEqual(library.stats()['books'], 2)
+            loaded.set()
+            self.assertEqual(library.get_book(3).title, 'Нос')  # Waits for the load
+            self.assertEqual(library.new_book('Шинель', 'Николай Гоголь', '1842').id, 4)
+            library.close()
+        self.assertEqual(list(self.open_library().books), [1, 2, 3, 4])
+
+        with open(self.file_name + '.meta', 'w', encoding='utf-8') as file:
+            json.dump({'next_id': 2, 'count': 1, 'max_id': 1}, file)  # Stale, the file was changed by another program
+        with patch.object(JsonStorage, 'read_books', autospec=True, side_effect=read_books_later), \
+                patch('builtins.print'):
+            loaded.clear()
+            library = Library(self.file_name, background=True)
+            book = library.new_book('Ревизор', 'Николай Гоголь', '1836')
+            self.assertEqual(book.id, 2)  # Reserved from the stale header
+            loaded.set()
+            library.wait_ready()
+            self.assertEqual(book.id, 5)  # Issued again after the load
+            self.assertEqual(library.get_book(2).title, 'Собачье сердце')
+            library.close()
+        self.assertEqual([book.title for book in self.open_library().books.values()],
+                         ['Мастер и Маргарита', 'Собачье сердце', 'Нос', 'Шинель', 'Ревизор'])
+
+        with open(self.file_name, 'r', encoding='utf-8') as file:
+            records = json.load(file)
+        records.insert(2, dict(records[0], id=99, isbn='978-5-17-090335-2'))  # Not a field of a book
+        with open(self.file_name, 'w', encoding='utf-8') as file:
+            json.dump(records, file, ensure_ascii=False, indent=4)
+        with open(self.file_name, 'rb') as file:
+            content = file.read()
+        with patch.object(JsonStorage, 'read_books', autospec=True, side_effect=read_books_later), \
+                patch('builtins.print'):
+            loaded.clear()
+            library = Library(self.file_name, background=True)
+            library.new_book('Игроки', 'Николай Гоголь', '1842')  # Added early, dropped when the load fails
+            loaded.set()
+            self.assertRaises(TypeError, library.wait_ready)
+            self.assertRaises(TypeError, library.new_book, 'Женитьба', 'Николай Гоголь', '1842')
+            self.assertRaises(TypeError, library.commit, {'op': 'remove', 'id': 1})
+            self.assertRaises(TypeError, library.close)
+        with open(self.file_name, 'rb') as file:
+            self.assertEqual(file.read(), content)  # Nothing loaded so far is saved over the file
+
+    def test_sharded_storage(self):
+
+        """
+            Test that a change rewrites only the shard of its book and that rebalancing keeps the books.
+        """
+
+        with patch('builtins.print'):
+            self.assertEqual(rebalance(self.file_name, 'range', range_size=2), 2)
+        library = self.open_library(storage=ShardedStorage(self.file_name))
+        for title in ('Нос', 'Шинель', 'Ревизор'):
+            library.new_book(title, 'Николай Гоголь', '1836')
+        self.assertEqual(len(library.storage.shards), 3)
+
+        with patch.object(JsonStorage, 'save', autospec=True, side_effect=JsonStorage.save) as mock_save:
+            library.set_status(4, 'выдана')
+            library.delete_book(2)
+        shards = library.storage.shards
+        self.assertEqual([call.args[0] for call in mock_save.call_args_list], [shards[1], shards[0]])
+
+        reopened = self.open_library(storage=ShardedStorage(self.file_name))
+        self.assertEqual(reopened.display_books(), library.display_books())
+        self.assertEqual(reopened.find_books('гоголь'), library.find_books('гоголь'))
+        self.assertEqual(self.open_library(lazy=True, storage=ShardedStorage(self.file_name)).get_book(4).status,
+                         'выдана')
+
+        old_files = [shard.file_name for shard in reopened.storage.shards]
+        with patch('builtins.print'):
+            self.assertEqual(rebalance(self.file_name, 'hash', shards=2), 4)
+        self.assertFalse(any(os.path.exists(name) for name in old_files))
+        rebalanced = self.open_library(storage=ShardedStorage(self.file_name))
+        self.assertEqual(len(rebalanced.storage.shards), 2)
+        self.assertEqual(rebalanced.display_books(), library.display_books())
+        self.assertEqual(rebalanced.new_book('Игроки', 'Николай Гоголь', '1842').id, 6)
+
+        journaled = self.open_library(storage=ShardedStorage(self.file_name, journal=True))
+        journaled.set_status(3, 'выдана')
+        journaled.delete_book(5)
+        lazy = self.open_library(lazy=True, storage=ShardedStorage(self.file_name, journal=True))
+        with patch.object(ShardedStorage, 'shard_books', side_effect=AssertionError):  # Only single records are read
+            self.assertEqual([lazy.get_book(book_id) and lazy.get_book(book_id).to_dict() for book_id in range(1, 7)],
+                             [journaled.books[book_id].to_dict() if book_id in journaled.books else None
+                              for book_id in range(1, 7)])
+
+        journaled = self.open_library(storage=ShardedStorage(self.file_name, journal=True, compact_threshold=4))
+        journaled.new_book('Женитьба', 'Николай Гоголь', '1842')  # The book 7 goes to the journal of the shard 1
+        journaled.new_book('Портрет', 'Николай Гоголь', '1835')  # The book 8 goes to the journal of the shard 0
+        reopened = self.open_library(storage=ShardedStorage(self.file_name, journal=True, compact_threshold=4))
+        self.assertEqual(list(reopened.books), [1, 3, 4, 6, 7, 8])  # The journals are replayed in the add order
+        self.assertEqual(reopened.display_books(), journaled.display_books())
+        journaled.set_status(4, 'в наличии')
+        journaled.set_status(6, 'выдана')
+        journaled.delete_book(8)  # Compacts the shard 0, whose only add was in the journal
+        reopened = self.open_library(storage=ShardedStorage(self.file_name, journal=True, compact_threshold=4))
+        self.assertEqual(reopened.new_book('Невский проспект', 'Николай Гоголь', '1835').id, 9)
+
+    def test_circulation(self):
+
+        """
+            Test that the circulation counters follow the changes, survive a restart and are checked by the replay.
+        """
+
+        library = self.open_library(circulation=True)
+        self.assertEqual((library.circulation.available, library.circulation.issued), (1, 1))
+        library.set_status(2, 'выдана')
+        library.set_status(2, 'выдана')  # Not a new checkout
+        library.set_status(1, 'в наличии')
+        library.new_book('Нос', 'Николай Гоголь', '1836')
+        self.assertEqual(library.circulation.issued_by_author, {'Михаил Булгаков': 1})
+        self.assertEqual(library.circulation.issued_by_year, {1925: 1})
+        self.assertEqual(library.circulation_stats(), {
+            'available': 2, 'issued': 1, 'checkouts': 1, 'returns': 1,
+            'most_borrowed_authors': [('Михаил Булгаков', 1)]})
+        library.delete_book(2)
+        self.assertEqual((library.circulation.available, library.circulation.issued), (2, 0))
+        self.assertEqual(library.verify_circulation(), [])
+
+        reopened = self.open_library(circulation=True)
+        self.assertEqual(reopened.circulation_stats(), library.circulation_stats())
+        self.assertEqual(reopened.verify_circulation(), [])
+        reopened.circulation.issued += 1
+        self.assertEqual(len(reopened.verify_circulation()), 1)
+
+        self.open_library().set_status(1, 'выдана')  # Not in the log
+        self.assertEqual(len(self.open_library(circulation=True).verify_circulation()), 1)
+        with self.assertRaises(RuntimeError):
+            self.open_library().circulation_stats()
+
+        torn = self.open_library(circulation=True)
+        with open(torn.circulation.log_name, 'a', encoding='utf-8') as file:
+            file.write('{"op": "checkout", "id"')  # Simulate a crash in the middle of a write
+        torn = self.open_library(circulation=True)
+        torn.set_status(3, 'выдана')
+        torn.set_status(3, 'в наличии')
+        torn.set_status(3, 'выдана')
+        reopened = self.open_library(circulation=True)
+        self.assertEqual(reopened.circulation_stats(), torn.circulation_stats())
+        self.assertEqual((reopened.circulation.checkouts, reopened.circulation.returns), (3, 2))
+        self.assertEqual(len(reopened.verify_circulation()), 1)  # Only the change of the book 1 made without the log
+
+    def test_columns(self):
+
+        """
+            Test that the counts and groups over the columns match the ones over the books.
+        """
+
+        library = self.open_library(compact=True)
+        library.add_books({'title': f'Книга {i}', 'author': f'Автор {i % 7}', 'year': 1900 + i % 100,
+                           'status': ('в наличии', 'выдана')[i % 3 == 0]} for i in range(500))
+        library.delete_book(2)
+        library.put_book(Book(1000, 'Древняя книга', 'Автор 1', -50))  # Imported, not checked like the console input
+        books = list(library.books.values())
+        for use_numpy in (False, True) if analytics.numpy is not None else (False,):  # Both backends if possible
+            table = library.columns(use_numpy)
+            for filters in ({}, {'year_from': 1950}, {'year_to': 1905},
+                            {'year_from': 1920, 'year_to': 1930, 'status': 'выдана'},
+                            {'author': 'Михаил Булгаков'}, {'author': 'Нет такого'}):
+                mask = table.where(**filters)
+                for keys in (('decade',), ('author', 'status'), ('year', 'status')):
+                    self.assertEqual(table.group_by(*keys, mask=mask), group_books(books, *keys, **filters))
+                found = library.query(filters.get('status'), filters.get('year_from'), filters.get('year_to'),
+                                      filters.get('author'))
+                self.assertEqual(table.count(mask), len(found))
+                self.assertEqual(table.ids_of(mask), [book.id for book in found])
+        self.assertEqual(table.group_by('status'), {'в наличии': 334, 'выдана': 168})
+
+    def test_differential_save(self):
+
+        """
+            Test that status changes and added books are written over the JSON file and a removal rewrites it.
+        """
+
+        def check(library: Library, replaced: bool) -> None:
+            with open(self.file_name, 'r', encoding='utf-8') as file:
+                self.assertEqual(json.load(file), [book.to_dict() for book in library.books.values()])
+            self.assertEqual(os.stat(self.file_name).st_ino != inode, replaced)
+            self.assertEqual(library.storage.read_header(), {'next_id': library.next_id, 'count': len(library.books),
+                                                             'max_id': max(library.books, default=0)})
+            self.assertEqual(self.open_library().display_books(), library.display_books())
+
+        library = self.open_library()
+        inode = os.stat(self.file_name).st_ino
+        library.set_status(2, 'выдана')
+        check(library, replaced=True)  # Replaced atomically by default
+
+        library = self.open_library(differential=True)
+        inode = os.stat(self.file_name).st_ino
+        library.set_status(2, 'в наличии')  # The status written before has no space for a longer one
+        check(library, replaced=True)
+
+        inode = os.stat(self.file_name).st_ino
+        library.set_status(1, 'в наличии')
+        library.set_status(2, 'выдана')
+        check(library, replaced=False)
+        self.assertEqual(library.storage.last_written, len('"выдана"'.encode('utf-8')) + 5)  # With the padding
+        library.new_book('Нос', 'Николай Гоголь', '1836')
+        library.add_books([{'title': 'Шинель', 'author': 'Николай Гоголь', 'year': 1842},
+                           {'title': 'Ревизор', 'author': 'Николай Гоголь', 'year': 1836}])
+        check(library, replaced=False)
+
+        library = self.open_library(differential=True)  # The offsets are found in the file written before
+        library.set_status(4, 'выдана')
+        library.set_status(4, 'в наличии')
+        check(library, replaced=False)
+        library.delete_book(3)
+        check(library, replaced=True)
+
+        self.assertFalse(self.open_library(differential=True, write_behind=True).storage.storage.differential)
+        with patch('builtins.print'):
+            rebalance(self.file_name, 'hash', shards=2)
+        library = self.open_library(storage=ShardedStorage(self.file_name, differential=True))
+        library.set_status(1, 'выдана')  # The first change of a shard finds its layout
+        with patch.object(ShardedStorage, 'shard_books', side_effect=AssertionError):
+            library.set_status(1, 'в наличии')
+            library.set_status(2, 'выдана')
+        self.assertEqual(self.open_library(storage=ShardedStorage(self.file_name)).display_books(),
+                         library.display_books())
+
+    def test_batch_mode(self):
+
+        """
+            Test the batch mode: JSON lines answers for every command and a single save at the end.
+        """
+
+        commands = os.path.join(self.temp_dir.name, 'commands.jsonl')
+        with open(commands, 'w', encoding='utf-8') as file:
+            for command in ({'op': 'add', 'title': 'Нос', 'author': 'Николай Гоголь', 'year': 1836},
+                            {'op': 'status', 'id': 3, 'status': 'выдана'},
+                            {'op': 'remove', 'id': 1},
+                            {'op': 'find', 'query': 'гоголь'},
+                            {'op': 'list', 'offset': 1},
+                            {'op': 'status', 'id': 2, 'status': 'потеряна'}):
+                file.write(json.dumps(command, ensure_ascii=False) + '\n')
+            file.write('\nне JSON\n')
+
+        with patch('sys.stdout', new_callable=io.StringIO) as output, \
+                patch.object(JsonStorage, 'save', autospec=True, side_effect=JsonStorage.save) as mock_save:
+            main(['--file', self.file_name, '--batch', commands])
+        answers = [json.loads(line) for line in output.getvalue().splitlines()]
+        nose = {'id': 3, 'title': 'Нос', 'author': 'Николай Гоголь', 'year': 1836, 'status': 'выдана'}
+        self.assertEqual(answers[:5], [
+            {'ok': True, 'result': dict(nose, status='в наличии')},
+            {'ok': True, 'result': True},
+            {'ok': True, 'result': True},
+            {'ok': True, 'result': [nose]},
+            {'ok': True, 'result': [nose]},
+        ])
+        self.assertEqual([answer['ok'] for answer in answers[5:]], [False, False])
+        self.assertEqual(mock_save.call_count, 1)
+        self.assertEqual(list(self.open_library().books), [2, 3])
+
+        with open(commands, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'op': 'get', 'id': 2}) + '\n')
+        directory = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        try:
+            with patch('sys.stdout', new_callable=io.StringIO) as output:
+                main(['--file', self.file_name, '--batch', 'commands.jsonl'])  # Relative to the working directory
+        finally:
+            os.chdir(directory)
+        self.assertEqual(json.loads(output.getvalue())['result']['id'], 2)
+
+
+def is_issued(book: Book) -> bool:
+    return book.status == 'выдана'
+
+
+class TestBookIndex(unittest.TestCase):
+
+    """
+        Unit test class for testing the inverted index used by the book search.
+    """
+
+    def test_search_matches_scan(self):
+
+        """
+            Test that the index finds exactly the same books as the linear search, in the same order.
+        """
+
+        generator = random.Random(1)
+        words = ['Мастер', 'и', 'Маргарита', 'Собачье', 'сердце', 'Ab', 'ÉCOLE', 'x']
+        books = [Book(book_id, ' '.join(generator.choices(words, k=generator.randint(1, 3))),
+                      generator.choice(words), generator.randint(1900, 1910))
+                 for book_id in generator.sample(range(1, 1000), 200)]
+
+        index = BookIndex()
+        for book in books:
+            index.add(book)
+        for book in books[::3]:
+            index.remove(book)
+        books = [book for book in books if book.id in index.books]
+
+        for query in ['', 'м', 'Ма', 'мАр', 'маргарита', 'и м', 'éc', 'x', 'zz', '1905', '190', 'a']:
+            expected = [book for book in books
+                        if query.lower() in book.title.lower() or
+                        query.lower() in book.author.lower() or
+                        query == str(book.year)]
+            self.assertEqual(index.search(query), expected, query)
+
+    def test_query_matches_scan(self):
+
+        """
+            Test that the filtered queries find exactly the same books as filtering all books, in the same order.
+        """
+
+        generator = random.Random(2)
+        authors = ['Михаил Булгаков', 'Михаил Лермонтов', 'Николай Гоголь', 'Ab']
+        books = [Book(book_id, generator.choice(['Мастер', 'Маргарита', 'Нос', 'x']), generator.choice(authors),
+                      generator.randint(1900, 1950), generator.choice(['в наличии', 'выдана']))
+                 for book_id in range(1, 301)]
+
+        index = BookIndex()
+        for book in books:
+            index.add(book)
+        for book in books[::4]:
+            index.remove(book)
+        books = [book for book in books if book.id in index.books]
+        for book in books[1::5]:
+            index.set_status(book, 'выдана' if book.status == 'в наличии' else 'в наличии')
+
+        for filters in [{}, {'status': 'выдана'}, {'year_from': 1910, 'year_to': 1920}, {'year_to': 1905},
+                        {'author': 'михаил булгаков'}, {'author_prefix': 'Михаил'}, {'title': 'мар'},
+                        {'status': 'в наличии', 'year_from': 1930, 'author_prefix': 'м', 'title': 'а'},
+                        {'author': 'Ab', 'title': 'b'}, {'author_prefix': 'я'}, {'year_from': 1960}]:
+            expected = [book for book in books
+                        if book.status == filters.get('status', book.status) and
+                        filters.get('year_from', 0) <= book.year <= filters.get('year_to', 9999) and
+                        book.author.lower() == filters.get('author', book.author).lower() and
+                        book.author.lower().startswith(filters.get('author_prefix', '').lower()) and
+                        filters.get('title', '').lower() in book.title.lower()]
+            self.assertEqual(index.query(**filters), expected, filters)
+
+    def test_fuzzy_search(self):
+
+        """
+            Test that the fuzzy search finds the books with typos, the most similar first, and misses none of them.
+        """
+
+        index = BookIndex()
+        for book_id, (title, author) in enumerate([('Граф Монте-Кристо', 'Александр Дюма'),
+                                                   ('Мастер и Маргарита', 'Михаил Булгаков'),
+                                                   ('Собачье сердце', 'Михаил Булгаков'),
+                                                   ('Булка', 'Пекарь')], 1):
+            index.add(Book(book_id, title, author, 1900))
+        self.assertEqual([book.id for book in index.fuzzy_search('Булгакв')], [2, 3])
+        self.assertEqual([book.id for book in index.fuzzy_search('Монте Кристо')], [1])
+        self.assertEqual([book.id for book in index.fuzzy_search('Булгакв', limit=1)], [2])
+        self.assertEqual(index.fuzzy_search('Жюль Верн'), [])
+
+        generator = random.Random(3)
+        vocabulary = ['мастер', 'маргарита', 'сердце', 'булгаков', 'гоголь', 'нос', 'души', 'и']
+        for book_id in range(5, 300):
+            index.add(Book(book_id, ' '.join(generator.choices(vocabulary, k=2)), generator.choice(vocabulary), 1900))
+        for book in list(index.books.values())[::7]:
+            index.remove(book)
+
+        def typos(query: str, book: Book) -> int | None:
+            total = 0
+            for word in words(query):
+                limit = max(1, len(word) // 4) if len(word) >= 3 else 0
+                edits = min(edit_distance(word, book_word, limit) for book_word in words(book.title + ' ' + book.author))
+                if edits > limit:
+                    return None
+                total += edits
+            return total
+
+        for query in ['мастир', 'маргрита', 'сердцe', 'гогль', 'нас', 'Булгаков Мастер', 'и ду', 'ду ши']:
+            expected = sorted((typos(query, book), index.order[book.id], book.id) for book in index.books.values()
+                              if typos(query, book) is not None)
+            self.assertEqual([book.id for book in index.fuzzy_search(query, limit=1000)],
+                             [book_id for *_, book_id in expected], query)
+
+
 if __name__ == "__main__":
     unittest.main()  # Run the unit tests